@@ -1,3 +1,4 @@
+from .debug import router as debug_router
 from .root import router as root_router
 
-all_http_routers = [root_router]
+all_http_routers = [root_router, debug_router]
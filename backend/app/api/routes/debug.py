@@ -0,0 +1,51 @@
+"""Admin-only diagnostics: event-loop stalls, sampling profiles and startup cost."""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from app.auth import get_current_admin
+from app.core import startup
+from app.core.config import get_settings
+from app.core.profiling import ProfilerBusy, loop_monitor, profiler
+
+router = APIRouter(prefix="/debug", tags=["debug"], dependencies=[Depends(get_current_admin)])
+settings = get_settings()
+
+
+@router.get("/loop")
+async def loop_stats():
+    """Lag máximo y últimos bloqueos del event loop, con tarea y pila."""
+    return loop_monitor.stats()
+
+
+@router.get("/startup")
+async def startup_report(top: int = Query(25, ge=1, le=500)):
+    """Tiempo hasta estar listo, imports más lentos y pasos de inicialización (ms)."""
+    return startup.report(top)
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def sampling_profile(seconds: float = Query(5.0, gt=0), interval_ms: float = Query(5.0, ge=1, le=1000),
+                           threads: str = Query("loop", pattern="^(loop|all)$")):
+    """Perfil por muestreo del servidor en formato de pilas colapsadas (flamegraph.pl, speedscope).
+
+    ``threads=loop`` muestrea solo el hilo del event loop; ``all``, también
+    los pools de almacenamiento, persistencia, etc.
+    """
+    if seconds > settings.PROFILE_MAX_SECONDS:
+        raise HTTPException(422, detail=f"Máximo {settings.PROFILE_MAX_SECONDS} s")
+    thread_id = threading.get_ident() if threads == "loop" else None
+    try:
+        counts, samples = await asyncio.to_thread(profiler.sample, seconds, interval_ms / 1000, thread_id)
+    except ProfilerBusy:
+        raise HTTPException(409, detail="Ya hay un perfil en curso")
+    filename = f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded"
+    return PlainTextResponse(profiler.collapsed(counts), headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "X-Profile-Samples": str(samples),
+    })
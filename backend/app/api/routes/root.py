@@ -1,10 +1,12 @@
 """Basic HTTP routes."""
 from __future__ import annotations
-from fastapi import APIRouter
-from app.core.config import Settings
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+from app.core.config import get_settings
+from app.core.metrics import metrics
 
 router = APIRouter()
-settings = Settings()
+settings = get_settings()
 
 
 @router.get("/")
@@ -15,3 +17,10 @@ async def root():
 @router.get("/health")
 async def health_check():
     return {"status": "ok", "version": settings.VERSION}
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Métricas deshabilitadas")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
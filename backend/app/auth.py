@@ -1,13 +1,28 @@
-"""Simple admin auth using in-memory token store & JWT scaffolding."""
+"""Simple admin auth using in-memory token store & JWT scaffolding.
+
+Any token with a valid signature and expiry is accepted, whichever worker
+issued it. Verified tokens are cached in ``active_tokens`` (an
+expiry-ordered store), so a known, unexpired token is accepted without
+decoding the JWT again. Logout revokes the token until it expires: its
+hash goes to ``revoked_tokens`` and is published on the bus so the other
+workers reject it too. bcrypt runs on the thread pool.
+``jose`` and passlib's ``CryptContext`` are loaded on first use, not at
+import, to keep them out of the cold start.
+"""
 from __future__ import annotations
 from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 from pydantic import BaseModel
-from datetime import datetime, timedelta
-from typing import Optional, Dict, Set
-from jose import jwt, JWTError
-from passlib.context import CryptContext
+from typing import Optional, Dict, List, Tuple
+from functools import lru_cache
+from app.core.metrics import metrics
+from app.core.bus import bus
+import asyncio
+import hashlib
+import heapq
 import os
+import time
 
 load_dotenv()  # asegura cargar .env antes de leer variables
 
@@ -15,12 +30,96 @@ SECRET = os.getenv("SECRET_KEY", "dev-secret")
 ALGO = os.getenv("ALGORITHM", "HS256")
 ACCESS_MIN = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
 
-pwd = CryptContext(schemes=["bcrypt"], deprecated="auto")
 ADMIN_USER = os.getenv("ADMIN_USER", "admin")
 _admin_plain = os.getenv("ADMIN_PASSWORD", "admin")
-ADMIN_PASS_HASH = pwd.hash(_admin_plain)
+# Hash precalculado (ADMIN_PASSWORD_HASH); si no existe se calcula en el primer login
+ADMIN_PASS_HASH: Optional[str] = os.getenv("ADMIN_PASSWORD_HASH") or None
+_admin_hash_lock = asyncio.Lock()
 
-active_tokens: Set[str] = set()
+LOGIN_SECONDS = metrics.histogram("auth_login_seconds", "Duration of /auth/login (password hashing included)")
+LOGINS = metrics.counter("auth_logins_total", "Login attempts by result")
+VERIFICATIONS = metrics.counter("auth_token_verifications_total", "Bearer token checks by result")
+
+
+class TokenStore:
+    """Active tokens with their subject and expiry, evicted in ``exp`` order."""
+
+    def __init__(self) -> None:
+        self._tokens: Dict[str, Tuple[str, float]] = {}
+        self._heap: List[Tuple[float, str]] = []
+
+    def add(self, token: str, sub: str, exp: float) -> None:
+        self.purge()
+        self._tokens[token] = (sub, exp)
+        heapq.heappush(self._heap, (exp, token))
+
+    def get(self, token: str) -> Optional[str]:
+        """Subject of ``token`` if it is active and unexpired."""
+        entry = self._tokens.get(token)
+        if entry is None:
+            return None
+        if entry[1] <= time.time():
+            self.purge()
+            return None
+        return entry[0]
+
+    def discard(self, token: str) -> None:
+        # the heap entry is skipped lazily by purge()
+        self._tokens.pop(token, None)
+
+    def purge(self) -> None:
+        now = time.time()
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, token = heapq.heappop(heap)
+            entry = self._tokens.get(token)
+            if entry is not None and entry[1] <= now:
+                del self._tokens[token]
+        if len(heap) > 2 * len(self._tokens) + 64:  # compactar revocados
+            self._heap = [(exp, t) for t, (_, exp) in self._tokens.items()]
+            heapq.heapify(self._heap)
+
+    def __contains__(self, token: str) -> bool:
+        return self.get(token) is not None
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+
+active_tokens = TokenStore()
+revoked_tokens = TokenStore()  # sha256 del token -> exp (el sujeto no se usa)
+
+
+def _digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def revoke(digest: str, exp: float) -> None:
+    """Reject the token with hash ``digest`` until ``exp``."""
+    revoked_tokens.add(digest, "", exp)
+
+
+def on_revoke(message: dict) -> None:
+    """Apply a logout published by another worker."""
+    digest, exp = message.get("token"), message.get("exp")
+    if isinstance(digest, str) and isinstance(exp, (int, float)):
+        revoke(digest, exp)
+
+
+@lru_cache(maxsize=None)
+def get_pwd():
+    """bcrypt context, created on the first login."""
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def _hash_password(plain: str) -> str:
+    return get_pwd().hash(plain)
+
+
+def _verify_password(plain: str, hashed: str) -> bool:
+    return get_pwd().verify(plain, hashed)
 
 router = APIRouter(prefix="/auth", tags=["auth"])    
 
@@ -33,37 +132,74 @@ class TokenResponse(BaseModel):
     token_type: str = "bearer"
 
 
-def create_token(sub: str) -> str:
-    exp = datetime.utcnow() + timedelta(minutes=ACCESS_MIN)
+def create_token(sub: str) -> Tuple[str, float]:
+    exp = int(time.time()) + ACCESS_MIN * 60
     to_encode = {"sub": sub, "exp": exp}
-    return jwt.encode(to_encode, SECRET, algorithm=ALGO)
+    from jose import jwt
+
+    return jwt.encode(to_encode, SECRET, algorithm=ALGO), exp
 
 
 def verify_token(token: str) -> str:
+    if revoked_tokens and _digest(token) in revoked_tokens:
+        VERIFICATIONS.inc(result="rejected")
+        raise HTTPException(status_code=401, detail="Token revocado")
+    sub = active_tokens.get(token)
+    if sub is not None:  # ya verificado y vigente: no hace falta decodificar
+        VERIFICATIONS.inc(result="cached")
+        return sub
+    from jose import jwt, JWTError
+
     try:
         payload = jwt.decode(token, SECRET, algorithms=[ALGO])
         sub: str = payload.get("sub")  # type: ignore
-        if not sub:
+        exp = payload.get("exp")
+        if not sub or not isinstance(exp, (int, float)):
             raise HTTPException(status_code=401, detail="Token inválido")
-        if token not in active_tokens:
-            raise HTTPException(status_code=401, detail="Token revocado")
+        # firmado por cualquier worker (mismo SECRET_KEY) y sin caducar
+        active_tokens.add(token, sub, exp)
+        VERIFICATIONS.inc(result="decoded")
         return sub
+    except HTTPException:
+        VERIFICATIONS.inc(result="rejected")
+        raise
     except JWTError:
+        VERIFICATIONS.inc(result="rejected")
         raise HTTPException(status_code=401, detail="Token inválido")
 
 
-def get_current_admin(authorization: str = Header(None)) -> str:
+async def get_current_admin(authorization: str = Header(None)) -> str:
+    # async: evita el salto al threadpool que FastAPI hace con dependencias sync
     if not authorization or not authorization.lower().startswith("bearer "):
         raise HTTPException(status_code=401, detail="Falta Authorization Bearer")
     token = authorization.split(None,1)[1]
     return verify_token(token)
 
+async def _admin_hash() -> str:
+    global ADMIN_PASS_HASH
+    if ADMIN_PASS_HASH is None:
+        async with _admin_hash_lock:
+            if ADMIN_PASS_HASH is None:
+                ADMIN_PASS_HASH = await run_in_threadpool(_hash_password, _admin_plain)
+    return ADMIN_PASS_HASH
+
 @router.post("/login", response_model=TokenResponse)
 async def login(data: LoginRequest):
-    if data.username != ADMIN_USER or not pwd.verify(data.password, ADMIN_PASS_HASH):
-        raise HTTPException(status_code=401, detail="Credenciales inválidas")
-    token = create_token(data.username)
-    active_tokens.add(token)
+    t0 = time.perf_counter()
+    try:
+        if data.username != ADMIN_USER:
+            raise HTTPException(status_code=401, detail="Credenciales inválidas")
+        admin_hash = await _admin_hash()
+        if not await run_in_threadpool(_verify_password, data.password, admin_hash):
+            raise HTTPException(status_code=401, detail="Credenciales inválidas")
+    except HTTPException:
+        LOGINS.inc(result="fail")
+        raise
+    finally:
+        LOGIN_SECONDS.observe(time.perf_counter() - t0)
+    LOGINS.inc(result="ok")
+    token, exp = create_token(data.username)
+    active_tokens.add(token, data.username, exp)
     return TokenResponse(access_token=token)
 
 @router.post("/logout")
@@ -72,6 +208,15 @@ async def logout(authorization: str = Header(None)):
         return {"detail": "No había sesión"}
     token = authorization.split(None,1)[1]
     active_tokens.discard(token)
+    from jose import jwt, JWTError
+
+    try:
+        exp = jwt.decode(token, SECRET, algorithms=[ALGO])["exp"]
+    except (JWTError, KeyError):
+        return {"detail": "No había sesión"}
+    digest = _digest(token)
+    revoke(digest, exp)
+    bus.publish({"kind": "revoke", "token": digest, "exp": exp})
     return {"detail": "Sesión terminada"}
 
 @router.get("/me")
@@ -0,0 +1,249 @@
+"""Cross-worker event bus and run locks.
+
+With several uvicorn workers each process has its own WebSocket clients,
+robot replicas and queues. Every local broadcast and queue mutation is
+published on the bus so the other workers can deliver it to their clients
+and keep their replicas in sync, and each robot's motion task is guarded
+by a bus lock so exactly one worker (the lock owner) animates a robot.
+
+Backends: ``LocalBackend`` (single process: nothing to relay, locks are
+in-memory) and ``RedisBackend`` (pub/sub channel + ``SET NX PX`` locks).
+With ``BUS_BACKEND=auto`` a Redis server that cannot be reached at startup
+is not fatal: the worker logs a warning and runs with the local bus.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional
+
+from .config import Settings
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[dict], Awaitable[None]]
+
+# Renueva el TTL solo si el lock sigue siendo nuestro
+_RENEW_LUA = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) else return 0 end"
+_RELEASE_LUA = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+
+class LocalBackend:
+    name = "local"
+
+    def __init__(self) -> None:
+        self._locks: Dict[str, str] = {}
+
+    async def start(self, worker_id: str, on_message: Callable[[bytes], Awaitable[None]]) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def publish(self, data: bytes) -> None:
+        pass  # un solo proceso: no hay otros workers a los que reenviar
+
+    async def acquire(self, name: str, owner: str, ttl_ms: int) -> bool:
+        if self._locks.get(name, owner) != owner:
+            return False
+        self._locks[name] = owner
+        return True
+
+    async def renew(self, name: str, owner: str, ttl_ms: int) -> bool:
+        return self._locks.get(name) == owner
+
+    async def release(self, name: str, owner: str) -> None:
+        if self._locks.get(name) == owner:
+            del self._locks[name]
+
+
+class RedisBackend:
+    name = "redis"
+
+    def __init__(self, url: str, channel: str, required: bool = True) -> None:
+        import redis.asyncio as aioredis  # dependencia opcional
+
+        self.redis = aioredis.from_url(url)
+        self.channel = channel
+        self.required = required  # False: sin conexión se sigue con el bus local
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+
+    async def start(self, worker_id: str, on_message: Callable[[bytes], Awaitable[None]]) -> None:
+        self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(self.channel)
+        self._reader = asyncio.create_task(self._read(on_message), name="bus-reader")
+
+    async def _read(self, on_message: Callable[[bytes], Awaitable[None]]) -> None:
+        async for message in self._pubsub.listen():  # type: ignore[union-attr]
+            try:
+                await on_message(message["data"])
+            except Exception as e:  # pragma: no cover - tolerante
+                logger.warning(f"Mensaje de bus inválido: {e}")
+
+    async def stop(self) -> None:
+        if self._reader:
+            self._reader.cancel()
+        if self._pubsub is not None:
+            await self._pubsub.unsubscribe(self.channel)
+            await self._pubsub.close()
+        await self.redis.close()
+
+    async def publish(self, data: bytes) -> None:
+        await self.redis.publish(self.channel, data)
+
+    async def acquire(self, name: str, owner: str, ttl_ms: int) -> bool:
+        return bool(await self.redis.set(name, owner, nx=True, px=ttl_ms))
+
+    async def renew(self, name: str, owner: str, ttl_ms: int) -> bool:
+        return bool(await self.redis.eval(_RENEW_LUA, 1, name, owner, ttl_ms))
+
+    async def release(self, name: str, owner: str) -> None:
+        await self.redis.eval(_RELEASE_LUA, 1, name, owner)
+
+
+class EventBus:
+    """Publishes messages from this worker and dispatches the others' to ``handler``."""
+
+    def __init__(self, backend=None, lock_ttl_ms: int = 5000) -> None:
+        self.backend = backend or LocalBackend()
+        self.lock_ttl_ms = lock_ttl_ms
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._handler: Optional[Handler] = None
+        self._outbox: Optional[asyncio.Queue] = None
+        self._publisher: Optional[asyncio.Task] = None
+        self._renewals: Dict[str, asyncio.Task] = {}
+        self.counters = {"published": 0, "received": 0, "publish_errors": 0, "locks_lost": 0}
+
+    @property
+    def distributed(self) -> bool:
+        return not isinstance(self.backend, LocalBackend)
+
+    def configure(self, backend, lock_ttl_ms: Optional[int] = None) -> None:
+        self.backend = backend
+        if lock_ttl_ms is not None:
+            self.lock_ttl_ms = lock_ttl_ms
+
+    async def start(self, handler: Handler) -> None:
+        self._handler = handler
+        if not self.distributed:
+            return
+        try:
+            await self.backend.start(self.worker_id, self._on_raw)
+        except Exception as e:
+            if getattr(self.backend, "required", True):
+                raise
+            logger.warning(f"Bus {self.backend.name} no disponible ({e}); se usa el bus local (un solo worker)")
+            try:
+                await self.backend.stop()
+            except Exception:  # pragma: no cover - tolerante
+                pass
+            self.backend = LocalBackend()
+            return
+        self._outbox = asyncio.Queue(maxsize=10000)
+        self._publisher = asyncio.create_task(self._publish_loop(), name="bus-publisher")
+
+    async def stop(self) -> None:
+        for task in self._renewals.values():
+            task.cancel()
+        self._renewals.clear()
+        if self._publisher:
+            self._publisher.cancel()
+            self._publisher = None
+        await self.backend.stop()
+
+    def publish(self, message: dict) -> None:
+        """Queue ``message`` for the other workers (no-op with a local bus)."""
+        if self._outbox is None:
+            return
+        message["origin"] = self.worker_id
+        try:
+            self._outbox.put_nowait(message)
+        except asyncio.QueueFull:
+            self.counters["publish_errors"] += 1
+
+    async def _publish_loop(self) -> None:
+        assert self._outbox is not None
+        while True:
+            message = await self._outbox.get()
+            try:
+                await self.backend.publish(json.dumps(message, separators=(",", ":")).encode())
+                self.counters["published"] += 1
+            except Exception as e:  # pragma: no cover - tolerante
+                self.counters["publish_errors"] += 1
+                logger.warning(f"Error publicando en el bus: {e}")
+
+    async def _on_raw(self, data: bytes) -> None:
+        message = json.loads(data)
+        if message.get("origin") == self.worker_id or self._handler is None:
+            return
+        self.counters["received"] += 1
+        await self._handler(message)
+
+    # ----- Locks (un dueño por robot) -----
+    async def acquire(self, name: str, on_lost: Optional[Callable[[], Awaitable[None]]] = None) -> bool:
+        """Take lock ``name``; ``on_lost`` is awaited if it can no longer be renewed."""
+        if not await self.backend.acquire(name, self.worker_id, self.lock_ttl_ms):
+            return False
+        if self.distributed:
+            self._renewals[name] = asyncio.create_task(self._renew_loop(name, on_lost), name=f"lock-{name}")
+        return True
+
+    async def _renew_loop(self, name: str, on_lost: Optional[Callable[[], Awaitable[None]]]) -> None:
+        renewed = time.monotonic()
+        while True:
+            await asyncio.sleep(self.lock_ttl_ms / 3000)
+            try:
+                if await self.backend.renew(name, self.worker_id, self.lock_ttl_ms):
+                    renewed = time.monotonic()
+                    continue
+            except Exception as e:  # pragma: no cover - tolerante
+                logger.warning(f"Error renovando lock {name}: {e}")
+                if time.monotonic() - renewed < self.lock_ttl_ms / 1000:
+                    continue  # el TTL aún no venció: se reintenta
+            # otro worker puede haberlo tomado: dejar de animar aquí
+            logger.warning(f"Lock perdido: {name}")
+            self.counters["locks_lost"] += 1
+            self._renewals.pop(name, None)
+            if on_lost is not None:
+                await on_lost()
+            return
+
+    async def release(self, name: str) -> None:
+        task = self._renewals.pop(name, None)
+        if task:
+            task.cancel()
+        try:
+            await self.backend.release(name, self.worker_id)
+        except Exception as e:  # pragma: no cover - tolerante
+            logger.warning(f"Error liberando lock {name}: {e}")
+
+    def stats(self) -> dict:
+        return {"backend": self.backend.name, "worker_id": self.worker_id, **self.counters}
+
+
+def build_backend(settings: Settings):
+    """``BUS_BACKEND``: ``auto`` (Redis if ``REDIS_URL`` is set), ``redis`` or ``local``."""
+    kind = (settings.BUS_BACKEND or "auto").lower()
+    if kind == "local" or (kind == "auto" and not settings.REDIS_URL):
+        return LocalBackend()
+    if kind == "auto":
+        try:
+            return RedisBackend(settings.REDIS_URL, settings.BUS_CHANNEL, required=False)
+        except ImportError:
+            logger.warning("REDIS_URL definido pero el paquete redis no está instalado; se usa el bus local")
+            return LocalBackend()
+    if kind == "redis":
+        return RedisBackend(settings.REDIS_URL, settings.BUS_CHANNEL)
+    raise ValueError(f"BUS_BACKEND desconocido: {kind}")
+
+
+bus = EventBus()
+
+metrics.callback_counter("bus_messages_total", "Cross-worker bus messages by outcome",
+                         lambda: [({"event": k}, v) for k, v in bus.counters.items()])
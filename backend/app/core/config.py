@@ -1,4 +1,6 @@
 import os
+from functools import lru_cache
+
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -31,6 +33,9 @@ class Settings:
     ALLOWED_METHODS: list[str] = os.getenv("ALLOWED_METHODS", "").split(",") if os.getenv("ALLOWED_METHODS") else []
     ALLOWED_HEADERS: list[str] = os.getenv("ALLOWED_HEADERS", "*").split(",") if os.getenv("ALLOWED_HEADERS") else ["*"]
     REDIS_URL: str = os.getenv("REDIS_URL")
+    BUS_BACKEND: str = os.getenv("BUS_BACKEND", "auto")  # auto (redis si REDIS_URL) | redis | local
+    BUS_CHANNEL: str = os.getenv("BUS_CHANNEL", "robotica:events")
+    BUS_LOCK_TTL_MS: int = int(os.getenv("BUS_LOCK_TTL_MS", "5000"))
     SMTP_SERVER: str = os.getenv("SMTP_SERVER")
     SMTP_PORT: int = int(os.getenv("SMTP_PORT", "587"))
     EMAIL_USER: str = os.getenv("EMAIL_USER")
@@ -39,7 +44,73 @@ class Settings:
     VERSION: str = os.getenv("VERSION")
     ENVIRONMENT: str = os.getenv("ENVIRONMENT")
     LOG_LEVEL: str = os.getenv("LOG_LEVEL")
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "True").lower() == "true"
+    LOOP_MONITOR_INTERVAL_MS: float = float(os.getenv("LOOP_MONITOR_INTERVAL_MS", "100"))  # 0 = desactivado
+    LOOP_LAG_THRESHOLD_MS: float = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "50"))  # un frame
+    PROFILE_MAX_SECONDS: float = float(os.getenv("PROFILE_MAX_SECONDS", "30"))
+    # Firebase y bcrypt se inicializan en segundo plano tras arrancar (false = en el primer uso)
+    STARTUP_WARMUP: bool = os.getenv("STARTUP_WARMUP", "true").lower() == "true"
+
+    # WebSocket fan-out
+    WS_SEND_QUEUE_SIZE: int = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+    WS_OVERFLOW_POLICY: str = os.getenv("WS_OVERFLOW_POLICY", "drop_oldest")  # drop_oldest | drop_newest | disconnect
+    WS_COALESCE_STATE: bool = os.getenv("WS_COALESCE_STATE", "True").lower() == "true"
+    WS_SEND_TIMEOUT_S: float = float(os.getenv("WS_SEND_TIMEOUT_S", "5"))
+    WS_DELTA_FRAMES: bool = os.getenv("WS_DELTA_FRAMES", "True").lower() == "true"
+    WS_KEYFRAME_EVERY: int = int(os.getenv("WS_KEYFRAME_EVERY", "20"))
+    WS_ADAPTIVE_RATE: bool = os.getenv("WS_ADAPTIVE_RATE", "True").lower() == "true"
+    WS_ADAPTIVE_TARGET_MS: float = float(os.getenv("WS_ADAPTIVE_TARGET_MS", "20"))  # latencia de envío tolerada
+    WS_ADAPTIVE_MIN_FPS: float = float(os.getenv("WS_ADAPTIVE_MIN_FPS", "2"))
+    JOURNAL_CAPACITY: int = int(os.getenv("JOURNAL_CAPACITY", "1024"))  # eventos por robot para /ws?since=
+    JOURNAL_DIR: str = os.getenv("JOURNAL_DIR", "")  # vacío = solo en memoria
+    JOURNAL_FILE_BYTES: int = int(os.getenv("JOURNAL_FILE_BYTES", str(8 << 20)))
+    # Grabación de trayectorias (app.motion.recorder); vacío = desactivada
+    RECORDER_DIR: str = os.getenv("RECORDER_DIR", "")
+    RECORDER_BUFFER_FRAMES: int = int(os.getenv("RECORDER_BUFFER_FRAMES", "1024"))
+    RECORDER_FILE_BYTES: int = int(os.getenv("RECORDER_FILE_BYTES", str(64 << 20)))
+    RECORDER_KEEP_FILES: int = int(os.getenv("RECORDER_KEEP_FILES", "24"))
+    RECORDER_CHUNK_BYTES: int = int(os.getenv("RECORDER_CHUNK_BYTES", str(256 << 10)))  # descargas
+
+    # Robots (multi-arm)
+    ROBOTS_MAX: int = int(os.getenv("ROBOTS_MAX", "64"))
+    ROBOT_IDS: list[str] = [r.strip() for r in os.getenv("ROBOT_IDS", "").split(",") if r.strip()]
+    STATUS_STATS_MAX_AGE_MS: int = int(os.getenv("STATUS_STATS_MAX_AGE_MS", "1000"))  # /status: estadísticas cacheadas
+
+    # Motion playback
+    FRAME_INTERVAL_MS: int = int(os.getenv("FRAME_INTERVAL_MS", "50"))
+    MOTION_PROFILE: str = os.getenv("MOTION_PROFILE", "linear")  # linear | trapezoidal | s_curve
+    MOTION_QUEUE_MAX: int = int(os.getenv("MOTION_QUEUE_MAX", "100000"))
+    MOTION_MAX_SPEED_DEG_S: float = float(os.getenv("MOTION_MAX_SPEED_DEG_S", "0"))  # 0 = sin límite
+    IK_TOLERANCE: float = float(os.getenv("IK_TOLERANCE", "0.25"))  # unidades de Robot3D
+
+    # Simulación headless (dry-run)
+    SIM_MAX_WORKERS: int = int(os.getenv("SIM_MAX_WORKERS", "0"))  # 0 = os.cpu_count()
+    SIM_PROCESS_MIN: int = int(os.getenv("SIM_PROCESS_MIN", "8"))  # lotes menores se simulan en un hilo
+    SIM_BATCH_MAX: int = int(os.getenv("SIM_BATCH_MAX", "1000"))
+
+    # Storage (programs + state)
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "auto")  # auto | firebase | sqlite | memory | none
+    STORAGE_SQLITE_URL: str = os.getenv("STORAGE_SQLITE_URL", "sqlite:///robotica.db")
+    STORAGE_MAX_WORKERS: int = int(os.getenv("STORAGE_MAX_WORKERS", "8"))
+    STORAGE_MAX_CONCURRENCY: int = int(os.getenv("STORAGE_MAX_CONCURRENCY", "16"))
+    STORAGE_TIMEOUT_S: float = float(os.getenv("STORAGE_TIMEOUT_S", "10"))
+
+    # Saved programs
+    PROGRAM_CACHE_SIZE: int = int(os.getenv("PROGRAM_CACHE_SIZE", "128"))
+    PROGRAM_CACHE_MAX_ITEMS: int = int(os.getenv("PROGRAM_CACHE_MAX_ITEMS", "200000"))
+    PROGRAM_FORMAT: str = os.getenv("PROGRAM_FORMAT", "json")  # json | packed (binario comprimido)
+    PROGRAM_CHUNK_BYTES: int = int(os.getenv("PROGRAM_CHUNK_BYTES", "900000"))  # < 1 MiB por documento
+
+    # Write-behind state persistence
+    PERSIST_BACKEND: str = os.getenv("PERSIST_BACKEND", "auto")  # auto (= storage) | memory | file | none
+    PERSIST_RATE_HZ: float = float(os.getenv("PERSIST_RATE_HZ", "2"))
+    PERSIST_FILE_PATH: str = os.getenv("PERSIST_FILE_PATH", "robot_state.json")
 
     def __init__(self, **kwargs):
         for key, value in kwargs.items():
-            setattr(self, key, value)
\ No newline at end of file
+            setattr(self, key, value)
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """Process-wide settings, read from the environment once."""
+    return Settings()
@@ -1,14 +1,19 @@
-"""Firebase initialization (optional).
+"""Firebase initialization (optional, lazy).
 
-Provides function to initialize Firebase only if credentials exist, so
-WebSocket/local development works without cloud setup.
+``init_firebase`` only checks that the credentials file exists and looks
+like a service account, so WebSocket/local development works without cloud
+setup. Importing ``firebase_admin`` and creating the app, Firestore client
+and bucket is the slowest part of a cold start, so ``FirebaseResources``
+does it on first access (or in the background with ``warm_up``). If that
+fails the error is kept and every later access raises
+``FirebaseUnavailable`` at once instead of retrying.
 """
 from __future__ import annotations
 
+import json
 import os
 import logging
-import firebase_admin
-from firebase_admin import credentials, firestore, storage
+import threading
 from typing import Optional
 
 from .config import Settings
@@ -16,11 +21,102 @@ from .config import Settings
 logger = logging.getLogger(__name__)
 
 
+class FirebaseUnavailable(Exception):
+    pass
+
+
 class FirebaseResources:
-    def __init__(self, app: firebase_admin.App):
-        self.app = app
-        self.db = firestore.client()
-        self.bucket = storage.bucket()
+    def __init__(self, settings: Settings, cred_path: str):
+        self._settings = settings
+        self._cred_path = cred_path
+        self._lock = threading.Lock()
+        self._app = None
+        self._db = None
+        self._bucket = None
+        self.error: Optional[str] = None
+
+    @property
+    def initialized(self) -> bool:
+        return self._app is not None
+
+    @property
+    def available(self) -> bool:
+        return self.error is None
+
+    def _fail(self, e: Exception) -> FirebaseUnavailable:
+        # no se reintenta en cada acceso: el error queda registrado
+        self.error = f"Firebase init failed: {e}"
+        logger.error(self.error)
+        return FirebaseUnavailable(self.error)
+
+    @property
+    def app(self):
+        if self._app is None:
+            with self._lock:
+                if self.error is not None:
+                    raise FirebaseUnavailable(self.error)
+                if self._app is None:
+                    try:
+                        import firebase_admin
+                        from firebase_admin import credentials
+
+                        cred = credentials.Certificate(self._cred_path)  # type: ignore[arg-type]
+                        self._app = firebase_admin.initialize_app(cred, {
+                            'storageBucket': self._settings.FIREBASE_STORAGE_BUCKET,
+                            'databaseURL': self._settings.FIREBASE_DATABASE_URL
+                        })
+                    except Exception as e:
+                        raise self._fail(e) from e
+                    logger.info("Firebase initialized.")
+        return self._app
+
+    @property
+    def db(self):
+        if self._db is None:
+            app = self.app
+            with self._lock:
+                if self.error is not None:
+                    raise FirebaseUnavailable(self.error)
+                if self._db is None:
+                    try:
+                        from firebase_admin import firestore
+
+                        self._db = firestore.client(app)
+                    except Exception as e:
+                        raise self._fail(e) from e
+        return self._db
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            app = self.app
+            with self._lock:
+                if self._bucket is None:
+                    from firebase_admin import storage
+
+                    self._bucket = storage.bucket(app=app)
+        return self._bucket
+
+    def warm_up(self) -> bool:
+        """Create the app and Firestore client now (meant for a worker thread)."""
+        try:
+            self.db
+        except FirebaseUnavailable:
+            return False
+        return True
+
+
+def _check_credentials(cred_path: str) -> Optional[str]:
+    """Cheap check of a service account file (without importing firebase_admin)."""
+    try:
+        with open(cred_path, encoding="utf-8") as fh:
+            data = json.load(fh)
+    except (OSError, ValueError) as e:
+        return str(e)
+    if not isinstance(data, dict) or data.get("type") != "service_account":
+        return "not a service account key"
+    missing = [k for k in ("project_id", "private_key", "client_email") if not data.get(k)]
+    return f"missing {', '.join(missing)}" if missing else None
 
 
 def init_firebase(settings: Settings) -> Optional[FirebaseResources]:
@@ -28,20 +124,16 @@ def init_firebase(settings: Settings) -> Optional[FirebaseResources]:
     if not cred_path or not os.path.isfile(cred_path):
         logger.info("Firebase credentials not found; skipping Firebase init.")
         return None
-    try:
-        cred = credentials.Certificate(cred_path)  # type: ignore[arg-type]
-        firebase_app = firebase_admin.initialize_app(cred, {
-            'storageBucket': settings.FIREBASE_STORAGE_BUCKET,
-            'databaseURL': settings.FIREBASE_DATABASE_URL
-        })
-        logger.info("Firebase initialized.")
-        return FirebaseResources(firebase_app)
-    except Exception as e:  # pragma: no cover - defensive
-        logger.warning(f"Firebase init failed: {e}")
+    problem = _check_credentials(cred_path)
+    if problem is not None:
+        logger.warning(f"Firebase init failed: invalid credentials {cred_path} ({problem})")
         return None
+    return FirebaseResources(settings, cred_path)
 
 
 def shutdown_firebase(resources: Optional[FirebaseResources]) -> None:
-    if resources:
+    if resources and resources.initialized:
+        import firebase_admin
+
         firebase_admin.delete_app(resources.app)
         logger.info("Firebase app deleted.")
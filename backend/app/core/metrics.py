@@ -0,0 +1,187 @@
+"""In-process metrics registry with Prometheus text exposition.
+
+Hot paths record into ``Counter``/``Histogram`` objects created once at
+import time; when ``METRICS_ENABLED`` is false every ``inc``/``observe``
+returns after a single attribute check, and callers guard their
+``perf_counter()`` calls with ``metrics.enabled``. Values that already
+exist elsewhere (queue depths, connection counts, component counters) are
+read only when ``/metrics`` is scraped, through gauges with a callback.
+"""
+from __future__ import annotations
+
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .config import get_settings
+
+settings = get_settings()
+
+LabelKey = Tuple[Tuple[str, str], ...]
+Sample = Tuple[Dict[str, str], float]
+
+# Segundos: desde 100 µs (broadcast) hasta 10 s (escrituras a Firebase)
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.075, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt_labels(key: Iterable[Tuple[str, str]]) -> str:
+    parts = [f'{k}="{v}"' for k, v in key]
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help: str) -> None:
+        self._registry = registry
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()  # el persister escribe desde su propio hilo
+
+    @abstractmethod
+    def render(self) -> List[str]:
+        ...
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help: str) -> None:
+        super().__init__(registry, name, help)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        if not self._registry.enabled:
+            return
+        key = _key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(_key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_fmt_labels(k)} {_fmt_value(v)}" for k, v in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help: str,
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(registry, name, help)
+        self.buckets = tuple(sorted(buckets))
+        # por etiquetas: [conteos por bucket (+Inf al final), suma, total]
+        self._series: Dict[LabelKey, list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        if not self._registry.enabled:
+            return
+        key = _key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels: str) -> int:
+        series = self._series.get(_key(labels))
+        return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, (counts, total, n) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = _fmt_labels(key + (("le", _fmt_value(bound)),))
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{_fmt_labels(key)} {_fmt_value(total)}")
+            lines.append(f"{self.name}_count{_fmt_labels(key)} {n}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Value read at scrape time from ``fn`` (one number or ``[(labels, value)]``)."""
+
+    kind = "gauge"
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help: str,
+                 fn: Callable[[], object]) -> None:
+        super().__init__(registry, name, help)
+        self.fn = fn
+
+    def samples(self) -> List[Sample]:
+        value = self.fn()
+        if isinstance(value, (int, float)):
+            return [({}, float(value))]
+        return list(value)  # type: ignore[arg-type]
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_fmt_labels(_key(labels))} {_fmt_value(v)}" for labels, v in self.samples()]
+
+
+class CallbackCounter(Gauge):
+    """Monotonic counter kept by another component (e.g. ``manager.counters``)."""
+
+    kind = "counter"
+
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = True, prefix: str = "robotica_") -> None:
+        self.enabled = enabled
+        self.prefix = prefix
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing  # recarga de módulos: se reutiliza la métrica
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._register(Counter(self, self.prefix + name, help))  # type: ignore[return-value]
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, self.prefix + name, help, buckets))  # type: ignore[return-value]
+
+    def gauge(self, name: str, help: str, fn: Callable[[], object]) -> Gauge:
+        return self._register(Gauge(self, self.prefix + name, help, fn))  # type: ignore[return-value]
+
+    def callback_counter(self, name: str, help: str, fn: Callable[[], object]) -> Gauge:
+        return self._register(CallbackCounter(self, self.prefix + name, help, fn))  # type: ignore[return-value]
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(self.prefix + name)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            try:
+                body = metric.render()
+            except Exception as e:  # un callback roto no debe tumbar el scrape
+                lines.append(f"# {metric.name} no disponible: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(body)
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry(enabled=settings.METRICS_ENABLED)
@@ -0,0 +1,172 @@
+"""Write-behind persistence of the robot state.
+
+The animation loop only calls ``persister.submit(state)``: the latest state
+is kept in memory and a worker thread writes it at most ``PERSIST_RATE_HZ``
+times per second (or immediately on ``flush()``), so frame timing never
+waits on a network round-trip. By default writes go through the configured
+``Storage`` (see ``storage.py``); ``memory`` and ``file`` backends stand in
+for it in local development and load tests.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional, Protocol
+
+from .config import Settings
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+WRITE_SECONDS = metrics.histogram("persist_write_seconds", "Duration of one write-behind state batch")
+WRITE_ERRORS = metrics.counter("persist_write_errors_total", "Failed write-behind state batches")
+
+
+class PersistenceBackend(Protocol):
+    def write_batch(self, states: Dict[str, dict]) -> None:
+        """Persist ``{key: state}`` in one round-trip where the backend allows it."""
+
+
+class MemoryBackend:
+    name = "memory"
+
+    def __init__(self) -> None:
+        self.data: Dict[str, dict] = {}
+        self.writes = 0
+
+    def write_batch(self, states: Dict[str, dict]) -> None:
+        self.data.update(states)
+        self.writes += 1
+
+
+class FileBackend:
+    """Stores the last state per key in a JSON file (atomic replace)."""
+
+    name = "file"
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.data: Dict[str, dict] = {}
+        if os.path.isfile(path):
+            try:
+                with open(path, "r", encoding="utf-8") as fh:
+                    self.data = json.load(fh)
+            except (OSError, ValueError):
+                logger.warning(f"No se pudo leer {path}; se sobrescribirá")
+
+    def write_batch(self, states: Dict[str, dict]) -> None:
+        self.data.update(states)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.data, fh)
+        os.replace(tmp, self.path)
+
+
+class StatePersister:
+    def __init__(self, backend: Optional[PersistenceBackend] = None, rate_hz: float = 2.0) -> None:
+        self.backend = backend
+        self.min_interval = 1.0 / rate_hz if rate_hz > 0 else 0.0
+        self._dirty: Dict[str, dict] = {}
+        self._cond = threading.Condition()
+        self._flush_requested = False
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self.counters = {"submitted": 0, "flushes": 0, "errors": 0}
+
+    def configure(self, backend: Optional[PersistenceBackend], rate_hz: Optional[float] = None) -> None:
+        self.backend = backend
+        if rate_hz is not None:
+            self.min_interval = 1.0 / rate_hz if rate_hz > 0 else 0.0
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="state-persister", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Flush pending state and join the worker (called on shutdown)."""
+        if self._thread is None:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, state: dict, key: str = "state") -> None:
+        """Record the latest ``state``; cheap enough to call every frame."""
+        with self._cond:
+            self._dirty[key] = dict(state)
+            self.counters["submitted"] += 1
+            self._cond.notify()
+
+    def flush(self) -> None:
+        """Ask the worker to write pending state now (e.g. at the end of a move)."""
+        with self._cond:
+            if self._dirty:
+                self._flush_requested = True
+                self._cond.notify()
+
+    def _run(self) -> None:
+        last_write = 0.0
+        while True:
+            with self._cond:
+                while not self._dirty and not self._stopping:
+                    self._cond.wait()
+                if not self._stopping and not self._flush_requested:
+                    wait = last_write + self.min_interval - time.monotonic()
+                    if wait > 0:
+                        self._cond.wait(wait)
+                        continue
+                batch, self._dirty = self._dirty, {}
+                self._flush_requested = False
+                stopping = self._stopping
+            if batch:
+                self._write(batch)
+                last_write = time.monotonic()
+            if stopping:
+                return
+
+    def _write(self, batch: Dict[str, dict]) -> None:
+        if self.backend is None:
+            return
+        backend = getattr(self.backend, "name", type(self.backend).__name__)
+        t0 = time.perf_counter()
+        try:
+            self.backend.write_batch(batch)
+            self.counters["flushes"] += 1
+        except Exception as e:  # pragma: no cover - tolerante
+            self.counters["errors"] += 1
+            WRITE_ERRORS.inc(backend=backend)
+            logger.warning(f"Error persistiendo estado: {e}")
+        finally:
+            WRITE_SECONDS.observe(time.perf_counter() - t0, backend=backend)
+
+    def stats(self) -> dict:
+        return {"pending": len(self._dirty), **self.counters}
+
+
+def build_backend(settings: Settings, storage=None) -> Optional[PersistenceBackend]:
+    """Select the backend named by ``PERSIST_BACKEND``.
+
+    ``auto`` (default) writes through the configured ``Storage`` (Firebase
+    or SQLite), which implements ``write_batch``.
+    """
+    kind = (settings.PERSIST_BACKEND or "auto").lower()
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "file":
+        return FileBackend(settings.PERSIST_FILE_PATH)
+    if kind == "none":
+        return None
+    if kind in ("auto", "storage"):
+        return storage
+    raise ValueError(f"PERSIST_BACKEND desconocido: {kind}")
+
+
+persister = StatePersister()
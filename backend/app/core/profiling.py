@@ -0,0 +1,199 @@
+"""Event-loop lag monitor and on-demand sampling profiler.
+
+``LoopMonitor`` runs a heartbeat task that sleeps ``interval`` and records
+how late it wakes up (``event_loop_lag_seconds``). A watchdog thread checks
+the heartbeat; when it is late by more than ``threshold`` the loop is
+still blocked, so the watchdog captures the loop thread's stack and the
+current task's name right then. ``TaskNameMiddleware`` names each request
+task after its route, so a stall reads ``POST /auth/login`` instead of
+``Task-123``. The last stalls are kept in ``LoopMonitor.slow``.
+
+``SamplingProfiler`` only runs on request: for a few seconds a thread
+reads ``sys._current_frames()`` at a fixed interval and counts collapsed
+stacks (``thread;outer;...;inner count``), the input format of
+``flamegraph.pl`` and speedscope.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from .config import get_settings
+from .metrics import metrics
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+LOOP_LAG = metrics.histogram("event_loop_lag_seconds", "How late the event loop heartbeat woke up")
+LOOP_STALLS = metrics.counter("event_loop_stalls_total", "Event loop stalls longer than the threshold")
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _label(frame, lines: bool) -> str:
+    code = frame.f_code
+    path = code.co_filename
+    if path.startswith(_ROOT):
+        path = os.path.relpath(path, _ROOT)
+    else:
+        path = os.path.basename(path)
+    # en los perfiles, una función = un nodo del flamegraph (sin línea actual)
+    where = f"{path}:{frame.f_lineno}" if lines else path
+    return f"{code.co_name} ({where})".replace(";", ",")
+
+
+def _stack(frame, lines: bool = True, limit: int = 64) -> List[str]:
+    """Frame labels, outermost first."""
+    labels = []
+    while frame is not None and len(labels) < limit:
+        labels.append(_label(frame, lines))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+class LoopMonitor:
+    def __init__(self, interval_s: float = 0.1, threshold_s: float = 0.05, keep: int = 50) -> None:
+        self.interval = interval_s
+        self.threshold = threshold_s
+        self.slow: Deque[dict] = deque(maxlen=keep)
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._halt = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread_id = 0
+        self._beat = 0.0
+        self._captured: Optional[Tuple[str, List[str]]] = None
+        self.max_lag = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def start(self) -> None:
+        if not self.enabled or self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._halt.clear()
+        self._task = asyncio.create_task(self._heartbeat(), name="loop-monitor")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._halt.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            t0 = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._beat = now
+            lag = max(0.0, now - t0 - self.interval)
+            LOOP_LAG.observe(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+            if lag > self.threshold:
+                self._record(lag)
+            else:
+                self._captured = None
+
+    def _record(self, lag: float) -> None:
+        task, stack = self._captured or ("?", [])
+        self._captured = None
+        LOOP_STALLS.inc()
+        self.slow.append({"at": time.time(), "lag_ms": round(lag * 1000, 1), "task": task, "stack": stack})
+        where = stack[-1] if stack else "?"
+        logger.warning(f"Event loop bloqueado {lag * 1000:.0f} ms en {task} ({where})")
+
+    def _watch(self) -> None:
+        # Hilo aparte: si el latido se retrasa, el loop sigue bloqueado y su pila es la culpable
+        while not self._halt.wait(self.threshold / 2):
+            late = time.monotonic() - self._beat - self.interval
+            if late <= self.threshold or self._captured is not None:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            try:
+                task = asyncio.current_task(self._loop)
+            except RuntimeError:
+                task = None
+            self._captured = (task.get_name() if task is not None else "?", _stack(frame)[-20:])
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "stalls": len(self.slow),
+            "slow": list(self.slow),
+        }
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+class SamplingProfiler:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+
+    def sample(self, seconds: float, interval_s: float, thread_id: Optional[int] = None) -> Tuple[Counter, int]:
+        """Collapsed stack counts over ``seconds`` (only ``thread_id`` if given)."""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy()
+        try:
+            me = threading.get_ident()
+            counts: Counter = Counter()
+            samples = 0
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                names: Dict[int, str] = {t.ident: t.name for t in threading.enumerate() if t.ident}
+                for ident, frame in sys._current_frames().items():
+                    if ident == me or (thread_id is not None and ident != thread_id):
+                        continue
+                    thread = names.get(ident, str(ident)).replace(";", ",").replace(" ", "_")
+                    counts[";".join([thread] + _stack(frame, lines=False))] += 1
+                samples += 1
+                time.sleep(interval_s)
+            return counts, samples
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def collapsed(counts: Counter) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in counts.most_common())
+
+
+class TaskNameMiddleware:
+    """ASGI middleware naming each request task ``METHOD /path``."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket"):
+            task = asyncio.current_task()
+            if task is not None:
+                task.set_name(f"{scope.get('method', 'WS')} {scope.get('path', '')}")
+        await self.app(scope, receive, send)
+
+
+loop_monitor = LoopMonitor(settings.LOOP_MONITOR_INTERVAL_MS / 1000, settings.LOOP_LAG_THRESHOLD_MS / 1000)
+profiler = SamplingProfiler()
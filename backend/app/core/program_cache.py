@@ -0,0 +1,111 @@
+"""In-process cache and summary index for saved programs.
+
+Saved programs are immutable, so once a program has been read (or written)
+it can be served from memory indefinitely. ``ProgramCache`` is an LRU
+bounded both by entry count and by total number of items. ``ProgramIndex``
+keeps a lightweight summary per program (mirrored by the storage layer,
+e.g. Firestore ``programas_index``) so listing never downloads ``items``;
+programs saved on other workers reach it through the bus.
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from .config import get_settings
+
+settings = get_settings()
+
+
+class ProgramCache:
+    def __init__(self, max_entries: int = 128, max_items: int = 200_000) -> None:
+        self.max_entries = max_entries
+        self.max_items = max_items
+        self._data: "OrderedDict[str, dict]" = OrderedDict()
+        self._items = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, program_id: str) -> Optional[dict]:
+        with self._lock:
+            data = self._data.get(program_id)
+            if data is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(program_id)
+            self.hits += 1
+            return data
+
+    def put(self, program_id: str, data: dict) -> None:
+        size = len(data.get("items", []))
+        if size > self.max_items:
+            return  # demasiado grande para cachear
+        with self._lock:
+            old = self._data.pop(program_id, None)
+            if old is not None:
+                self._items -= len(old.get("items", []))
+            self._data[program_id] = data
+            self._items += size
+            while self._data and (len(self._data) > self.max_entries or self._items > self.max_items):
+                _, evicted = self._data.popitem(last=False)
+                self._items -= len(evicted.get("items", []))
+
+    def stats(self) -> dict:
+        return {"entries": len(self._data), "items": self._items, "hits": self.hits, "misses": self.misses}
+
+
+def summarize(program_id: str, data: dict) -> dict:
+    items = data.get("items", [])
+    return {
+        "id": program_id,
+        "name": data.get("name"),
+        "type": data.get("type"),
+        "created_at": data.get("created_at"),
+        # los documentos empaquetados guardan los totales (no traen ``items``)
+        "items_count": data.get("items_count", len(items)),
+        "duration_ms": data.get("duration_ms") or sum(int(i.get("duration_ms", 1000)) for i in items),
+    }
+
+
+class ProgramIndex:
+    """Summaries sorted by ``(created_at, id)``; loaded once, updated on save.
+
+    ``add`` works before ``load`` too: summaries added meanwhile (e.g. from
+    another worker while the storage index is being read) are kept.
+    """
+
+    def __init__(self) -> None:
+        self._by_id: Dict[str, dict] = {}
+        self._order: List[Tuple[float, str]] = []
+        self._dirty = False
+        self.loaded = False
+        self._lock = threading.Lock()
+
+    def load(self, summaries: List[dict]) -> None:
+        with self._lock:
+            self._by_id = {**{s["id"]: s for s in summaries}, **self._by_id}
+            self._dirty = True
+            self.loaded = True
+
+    def add(self, summary: dict) -> None:
+        with self._lock:
+            self._by_id[summary["id"]] = summary
+            self._dirty = True
+
+    def page(self, offset: int = 0, limit: Optional[int] = None) -> Tuple[List[dict], int]:
+        with self._lock:
+            if self._dirty:
+                self._order = sorted((s.get("created_at") or 0, pid) for pid, s in self._by_id.items())
+                self._dirty = False
+            end = None if limit is None else offset + limit
+            ids = self._order[offset:end]
+            return [self._by_id[pid] for _, pid in ids], len(self._order)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+
+program_cache = ProgramCache(settings.PROGRAM_CACHE_SIZE, settings.PROGRAM_CACHE_MAX_ITEMS)
+program_index = ProgramIndex()
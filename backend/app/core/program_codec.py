@@ -0,0 +1,111 @@
+"""Packed binary encoding of saved program items.
+
+With ``PROGRAM_FORMAT=packed`` the ``items`` of a program are stored as a
+blob instead of one map per item: a version header followed by
+fixed-width little-endian records, compressed with zlib::
+
+    header:     <4s magic "RBP1"> <B version> <B kind (0 seq, 1 par)> <I count>
+    sequential: <B joint> <h angle> <I duration_ms> <B profile>
+    parallel:   <h base> <h hombro> <h codo> <I duration_ms> <B profile>
+
+``profile`` is 0 for the default or ``1 + PROFILES.index(...)``. Blobs
+larger than a Firestore document are split with ``split_chunks``.
+Decoding yields ``PackedItems`` (see ``app.motion.trajectory``) over one
+``np.frombuffer`` of the records, with no dict per item.
+"""
+from __future__ import annotations
+
+import struct
+import zlib
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.motion.trajectory import JOINTS, PROFILE_CODES, RECORD_DTYPES, PackedItems
+
+MAGIC = b"RBP1"
+VERSION = 1
+PACKED_FORMAT = "packed-v1"  # valor del campo "format" del documento
+_HEADER = struct.Struct("<4sBBI")
+KINDS = ("sequential", "parallel")
+
+
+def _column(records: np.ndarray, field: str, values: list) -> None:
+    info = np.iinfo(records.dtype[field])
+    column = np.asarray(values, dtype=np.int64)
+    if len(column) and (column.min() < info.min or column.max() > info.max):
+        raise OverflowError(field)
+    records[field] = column
+
+
+def pack_items(kind: str, items: Sequence[dict]) -> Optional[bytes]:
+    """Encode ``items``; ``None`` if they don't fit the packed records."""
+    if kind not in RECORD_DTYPES:
+        return None
+    records = np.zeros(len(items), dtype=RECORD_DTYPES[kind])
+    try:
+        if kind == "sequential":
+            _column(records, "joint", [JOINTS.index(i["joint"]) for i in items])
+            _column(records, "angle", [i["angle"] for i in items])
+        else:
+            for j in JOINTS:
+                _column(records, j, [i[j] for i in items])
+        _column(records, "duration_ms", [i.get("duration_ms", 1000) for i in items])
+        _column(records, "profile", [PROFILE_CODES.index(i.get("profile")) for i in items])
+    except (KeyError, ValueError, TypeError, OverflowError):
+        return None  # articulación o perfil desconocido, valores fuera de rango
+    header = _HEADER.pack(MAGIC, VERSION, KINDS.index(kind), len(items))
+    return header + zlib.compress(records.tobytes(), 6)
+
+
+def unpack_items(blob: bytes) -> PackedItems:
+    if len(blob) < _HEADER.size:
+        raise ValueError("Programa empaquetado truncado")
+    magic, version, kind_id, count = _HEADER.unpack_from(blob, 0)
+    if magic != MAGIC or version != VERSION or kind_id >= len(KINDS):
+        raise ValueError(f"Formato de programa no soportado: {magic!r} v{version}")
+    kind = KINDS[kind_id]
+    raw = zlib.decompress(blob[_HEADER.size:])
+    records = np.frombuffer(raw, dtype=RECORD_DTYPES[kind])
+    if len(records) != count:
+        raise ValueError("Programa empaquetado corrupto")
+    return PackedItems(kind, records)
+
+
+def split_chunks(blob: bytes, size: int) -> List[bytes]:
+    return [blob[i:i + size] for i in range(0, len(blob), size)] or [b""]
+
+
+# Campos del documento que describen el blob (no se devuelven al cargar)
+_DOC_FIELDS = ("format", "items_packed", "chunks", "items_count", "duration_ms")
+
+
+def encode_program(data: dict, chunk_bytes: int) -> Optional[Tuple[dict, List[bytes]]]:
+    """Document (without ``items``) plus blob chunks; ``None`` to keep JSON.
+
+    A blob that fits in one chunk goes inline as ``items_packed`` and the
+    chunk list is empty; otherwise the document records ``chunks``.
+    """
+    items = data.get("items", [])
+    blob = pack_items(data.get("type"), items)
+    if blob is None:
+        return None
+    doc = {k: v for k, v in data.items() if k != "items"}
+    doc.update(format=PACKED_FORMAT, items_count=len(items),
+               duration_ms=sum(int(i.get("duration_ms", 1000)) for i in items))
+    chunks = split_chunks(blob, chunk_bytes)
+    if len(chunks) == 1:
+        doc["items_packed"] = blob
+        return doc, []
+    doc["chunks"] = len(chunks)
+    return doc, chunks
+
+
+def is_packed(doc: dict) -> bool:
+    return doc.get("format") == PACKED_FORMAT
+
+
+def decode_program(doc: dict, blob: bytes) -> dict:
+    data = {k: v for k, v in doc.items() if k not in _DOC_FIELDS}
+    data["items"] = unpack_items(blob)
+    return data
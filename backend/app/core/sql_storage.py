@@ -0,0 +1,89 @@
+"""SQLite (or any SQLAlchemy URL) storage backend built on SQLModel.
+
+Lets the backend run and be load-tested without any cloud service:
+``STORAGE_BACKEND=sqlite STORAGE_SQLITE_URL=sqlite:///robotica.db``.
+"""
+from __future__ import annotations
+
+import json
+from typing import Dict, List, Optional
+
+from sqlmodel import Field, Session, SQLModel, create_engine, select
+
+from .storage import Storage
+
+
+class ProgramRow(SQLModel, table=True):
+    __tablename__ = "programas"
+
+    id: str = Field(primary_key=True)
+    type: str
+    name: str
+    created_at: float = Field(index=True)
+    items_count: int = 0
+    duration_ms: int = 0
+    data: str  # programa completo en JSON
+
+
+class StateRow(SQLModel, table=True):
+    __tablename__ = "robotica"
+
+    key: str = Field(primary_key=True)
+    data: str
+
+
+class SQLStorage(Storage):
+    name = "sqlite"
+
+    def __init__(self, url: str, **kwargs) -> None:
+        super().__init__(**kwargs)
+        connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+        self.engine = create_engine(url, connect_args=connect_args)
+        SQLModel.metadata.create_all(self.engine)
+
+    def _save_program(self, program_id: str, data: dict, summary: dict) -> None:
+        row = ProgramRow(
+            id=program_id,
+            type=summary.get("type") or "",
+            name=summary.get("name") or "",
+            created_at=summary.get("created_at") or 0.0,
+            items_count=summary.get("items_count", 0),
+            duration_ms=summary.get("duration_ms", 0),
+            data=json.dumps(data),
+        )
+        with Session(self.engine) as session:
+            session.merge(row)
+            session.commit()
+
+    def _get_program(self, program_id: str) -> Optional[dict]:
+        with Session(self.engine) as session:
+            row = session.get(ProgramRow, program_id)
+            return json.loads(row.data) if row else None
+
+    def _load_index(self) -> List[dict]:
+        # solo columnas de resumen: nunca se lee ``data``
+        stmt = select(
+            ProgramRow.id, ProgramRow.name, ProgramRow.type, ProgramRow.created_at,
+            ProgramRow.items_count, ProgramRow.duration_ms,
+        )
+        with Session(self.engine) as session:
+            return [
+                {"id": r[0], "name": r[1], "type": r[2], "created_at": r[3],
+                 "items_count": r[4], "duration_ms": r[5]}
+                for r in session.exec(stmt)
+            ]
+
+    def _load_state(self, key: str) -> Optional[dict]:
+        with Session(self.engine) as session:
+            row = session.get(StateRow, key)
+            return json.loads(row.data) if row else None
+
+    def write_batch(self, states: Dict[str, dict]) -> None:
+        with Session(self.engine) as session:
+            for key, state in states.items():
+                session.merge(StateRow(key=key, data=json.dumps(state)))
+            session.commit()
+
+    def close(self) -> None:
+        super().close()
+        self.engine.dispose()
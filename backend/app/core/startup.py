@@ -0,0 +1,115 @@
+"""Startup-time report: import and init cost per module.
+
+``track_imports`` (called first thing in ``app.main``) puts a finder at
+the front of ``sys.meta_path`` that times how long each module takes to
+execute until ``finish``: inclusive (with the imports it triggers) and
+self time, which adds up per top-level package. Lifespan steps are timed
+with ``step``. ``report`` lists the slowest modules and steps; it is
+logged once at startup and served at ``/debug/startup``.
+"""
+from __future__ import annotations
+
+import importlib.abc
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_t0 = time.perf_counter()
+_imports: Dict[str, float] = {}  # tiempo inclusivo
+_self: Dict[str, float] = {}  # sin los imports anidados
+_local = threading.local()  # por hilo: tiempo de hijos de cada import en curso
+_steps: Dict[str, float] = {}
+_ready: Optional[float] = None
+
+
+class _TimedLoader:
+    def __init__(self, loader) -> None:
+        self._loader = loader
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module) -> None:
+        nested = _local.__dict__.setdefault("nested", [])
+        t = time.perf_counter()
+        nested.append(0.0)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            elapsed = time.perf_counter() - t
+            children = nested.pop()
+            if nested:
+                nested[-1] += elapsed
+            _imports[module.__name__] = elapsed
+            _self[module.__name__] = elapsed - children
+
+
+class _TimingFinder(importlib.abc.MetaPathFinder):
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader)
+                return spec
+        return None
+
+
+_finder = _TimingFinder()
+
+
+def track_imports() -> None:
+    if _finder not in sys.meta_path:
+        sys.meta_path.insert(0, _finder)
+
+
+@contextmanager
+def step(name: str) -> Iterator[None]:
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        _steps[name] = time.perf_counter() - t
+
+
+def finish() -> dict:
+    """Stop tracking imports and log the report (application ready)."""
+    global _ready
+    if _finder in sys.meta_path:
+        sys.meta_path.remove(_finder)
+    if _ready is None:
+        _ready = time.perf_counter() - _t0
+        info = report(top=5)
+        slowest = ", ".join(f"{m['module']} {m['ms']} ms" for m in info["imports"])
+        logger.info(f"Arranque en {info['ready_ms']} ms (imports más lentos: {slowest})")
+    return report()
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 1)
+
+
+def report(top: int = 25) -> dict:
+    """Slowest modules and top-level packages, and lifespan steps, in ms."""
+    modules: List[dict] = [{"module": name, "ms": _ms(t), "self_ms": _ms(_self[name])}
+                           for name, t in sorted(_imports.items(), key=lambda kv: -kv[1])[:top]]
+    packages: Dict[str, float] = {}
+    for name, t in _self.items():
+        root = name.split(".")[0]
+        packages[root] = packages.get(root, 0.0) + t
+    return {
+        "ready_ms": _ms(_ready) if _ready is not None else None,
+        "imports_ms": {k: _ms(v) for k, v in sorted(packages.items(), key=lambda kv: -kv[1])[:top]},
+        "imports": modules,
+        "steps_ms": {k: _ms(v) for k, v in _steps.items()},
+    }
@@ -0,0 +1,292 @@
+"""Storage layer for saved programs and robot state.
+
+Firestore (and SQLite) clients are synchronous. ``Storage`` runs every
+call on a bounded thread pool, behind a concurrency limit and a timeout,
+so an ``async def`` handler awaiting storage never blocks the event loop.
+Backends only implement the ``_sync`` methods; ``write_batch`` is also
+what the write-behind persister (``app.core.persistence``) calls from its
+own thread.
+
+Backends: ``firebase`` (Firestore + Realtime DB), ``sqlite`` (SQLModel,
+see ``sql_storage.py``) and ``memory`` for tests and load tests.
+
+With ``PROGRAM_FORMAT=packed`` the Firestore and memory backends store
+program items as a compressed binary blob (``program_codec.py``); blobs
+over ``PROGRAM_CHUNK_BYTES`` are split into ``chunks`` sub-documents.
+Programs saved as JSON are still read as before.
+"""
+from __future__ import annotations
+
+import asyncio
+import copy
+import logging
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+from .config import Settings
+from .metrics import metrics
+from .program_codec import decode_program, encode_program, is_packed
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+PROGRAMS_COLLECTION = "programas"
+INDEX_COLLECTION = "programas_index"
+STATE_COLLECTION = "robotica"
+CHUNKS_COLLECTION = "chunks"  # subcolección de programas/{id} con partes del blob
+
+# Límites de un batch de Firestore: 500 operaciones y ~10 MiB por petición
+BATCH_MAX_OPS = 500
+BATCH_MAX_BYTES = 9 << 20
+
+OP_SECONDS = metrics.histogram("storage_op_seconds", "Duration of storage calls, including queueing")
+OP_ERRORS = metrics.counter("storage_errors_total", "Failed storage calls by cause")
+
+
+class StorageError(Exception):
+    pass
+
+
+class StorageTimeout(StorageError):
+    pass
+
+
+class Storage(ABC):
+    name = "base"
+
+    def __init__(self, max_workers: int = 8, max_concurrency: int = 16, timeout: float = 10.0,
+                 program_format: str = "json", chunk_bytes: int = 900_000) -> None:
+        self.timeout = timeout
+        self.program_format = program_format
+        self.chunk_bytes = max(1, chunk_bytes)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"storage-{self.name}")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _run(self, fn: Callable[..., T], *args) -> T:
+        op = fn.__name__.lstrip("_")
+        t0 = time.perf_counter()
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            try:
+                return await asyncio.wait_for(loop.run_in_executor(self._executor, fn, *args), self.timeout)
+            except asyncio.TimeoutError:
+                OP_ERRORS.inc(backend=self.name, op=op, cause="timeout")
+                raise StorageTimeout(f"{self.name}: {fn.__name__} superó {self.timeout}s")
+            except StorageError:
+                OP_ERRORS.inc(backend=self.name, op=op, cause="error")
+                raise
+            except Exception as e:
+                OP_ERRORS.inc(backend=self.name, op=op, cause="error")
+                raise StorageError(f"{self.name}: {e}") from e
+            finally:
+                OP_SECONDS.observe(time.perf_counter() - t0, backend=self.name, op=op)
+
+    # --- API asíncrona usada por los handlers ---
+    async def save_program(self, program_id: str, data: dict, summary: dict) -> None:
+        await self._run(self._save_program, program_id, data, summary)
+
+    async def get_program(self, program_id: str) -> Optional[dict]:
+        return await self._run(self._get_program, program_id)
+
+    async def load_index(self) -> List[dict]:
+        return await self._run(self._load_index)
+
+    async def save_state(self, states: Dict[str, dict]) -> None:
+        await self._run(self.write_batch, states)
+
+    async def load_state(self, key: str = "state") -> Optional[dict]:
+        return await self._run(self._load_state, key)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    def _encode_program(self, data: dict) -> Tuple[dict, List[bytes]]:
+        """Document to store plus blob chunks (empty if inline or JSON)."""
+        if self.program_format == "packed":
+            encoded = encode_program(data, self.chunk_bytes)
+            if encoded is not None:
+                return encoded
+        return data, []
+
+    # --- Implementación síncrona (se ejecuta en el pool) ---
+    @abstractmethod
+    def _save_program(self, program_id: str, data: dict, summary: dict) -> None:
+        ...
+
+    @abstractmethod
+    def _get_program(self, program_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def _load_index(self) -> List[dict]:
+        ...
+
+    @abstractmethod
+    def _load_state(self, key: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def write_batch(self, states: Dict[str, dict]) -> None:
+        ...
+
+
+class MemoryStorage(Storage):
+    name = "memory"
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.programs: Dict[str, dict] = {}
+        self.chunks: Dict[str, List[bytes]] = {}
+        self.index: Dict[str, dict] = {}
+        self.states: Dict[str, dict] = {}
+
+    def _save_program(self, program_id: str, data: dict, summary: dict) -> None:
+        doc, chunks = self._encode_program(data)
+        self.programs[program_id] = copy.deepcopy(doc)
+        self.chunks[program_id] = chunks
+        self.index[program_id] = dict(summary)
+
+    def _get_program(self, program_id: str) -> Optional[dict]:
+        doc = self.programs.get(program_id)
+        if doc is None:
+            return None
+        if is_packed(doc):
+            blob = doc.get("items_packed") or b"".join(self.chunks.get(program_id, []))
+            return decode_program(doc, blob)
+        return copy.deepcopy(doc)
+
+    def _load_index(self) -> List[dict]:
+        return [dict(s) for s in self.index.values()]
+
+    def _load_state(self, key: str) -> Optional[dict]:
+        state = self.states.get(key)
+        return dict(state) if state is not None else None
+
+    def write_batch(self, states: Dict[str, dict]) -> None:
+        self.states.update({k: dict(v) for k, v in states.items()})
+
+
+class FirebaseStorage(Storage):
+    """Firestore for programs and state, plus Realtime DB ``/robotica`` for state.
+
+    State key ``"state"`` maps to RTDB ``/robotica`` and Firestore
+    ``robotica/state``, the layout used since the first version.
+    """
+
+    name = "firebase"
+
+    def __init__(self, firebase, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.firebase = firebase
+
+    @property
+    def db(self):
+        # el cliente se crea en el primer acceso (ver FirebaseResources)
+        return self.firebase.db
+
+    def _chunk_refs(self, ref, count: int) -> list:
+        return [ref.collection(CHUNKS_COLLECTION).document(f"{n:05d}") for n in range(count)]
+
+    def _save_program(self, program_id: str, data: dict, summary: dict) -> None:
+        doc, chunks = self._encode_program(data)
+        ref = self.db.collection(PROGRAMS_COLLECTION).document(program_id)
+        # Primero las partes: el documento principal solo aparece cuando todas existen
+        batch, pending, size = self.db.batch(), 0, 0
+        for chunk_ref, chunk in zip(self._chunk_refs(ref, len(chunks)), chunks):
+            if pending and (pending == BATCH_MAX_OPS or size + len(chunk) > BATCH_MAX_BYTES):
+                batch.commit()
+                batch, pending, size = self.db.batch(), 0, 0
+            batch.set(chunk_ref, {"data": chunk})
+            pending += 1
+            size += len(chunk)
+        if pending:
+            batch.commit()
+        batch = self.db.batch()
+        batch.set(ref, doc)
+        batch.set(self.db.collection(INDEX_COLLECTION).document(program_id), summary)
+        batch.commit()
+
+    def _get_program(self, program_id: str) -> Optional[dict]:
+        ref = self.db.collection(PROGRAMS_COLLECTION).document(program_id)
+        doc = ref.get()
+        if not doc.exists:
+            return None
+        data = doc.to_dict()
+        if not is_packed(data):
+            return data
+        if not data.get("chunks"):
+            return decode_program(data, data["items_packed"])
+        refs = self._chunk_refs(ref, int(data["chunks"]))
+        parts = {snap.id: snap.to_dict()["data"] for snap in self.db.get_all(refs)}
+        return decode_program(data, b"".join(parts[r.id] for r in refs))
+
+    def _load_index(self) -> List[dict]:
+        """Read summaries from ``programas_index``; build them once if missing."""
+        from .program_cache import summarize
+
+        summaries = [doc.to_dict() for doc in self.db.collection(INDEX_COLLECTION).stream()]
+        if summaries:
+            return summaries
+        # Migración única: índice vacío, se construye desde los programas completos
+        batch = self.db.batch()
+        pending = 0
+        for doc in self.db.collection(PROGRAMS_COLLECTION).stream():
+            summary = summarize(doc.id, doc.to_dict())
+            summaries.append(summary)
+            batch.set(self.db.collection(INDEX_COLLECTION).document(doc.id), summary)
+            pending += 1
+            if pending == 500:  # límite de operaciones por batch en Firestore
+                batch.commit()
+                batch = self.db.batch()
+                pending = 0
+        if pending:
+            batch.commit()
+        return summaries
+
+    def _load_state(self, key: str) -> Optional[dict]:
+        doc = self.db.collection(STATE_COLLECTION).document(key).get()
+        return doc.to_dict() if doc.exists else None
+
+    def write_batch(self, states: Dict[str, dict]) -> None:
+        from firebase_admin import db as firebase_rtdb  # type: ignore
+
+        updates = {}
+        for key, state in states.items():
+            prefix = "" if key == "state" else f"{key}/"
+            for joint, value in state.items():
+                updates[f"{prefix}{joint}"] = value
+        firebase_rtdb.reference("/robotica", app=self.firebase.app).update(updates)  # type: ignore
+        batch = self.db.batch()
+        for key, state in states.items():
+            batch.set(self.db.collection(STATE_COLLECTION).document(key), state)
+        batch.commit()
+
+
+def build_storage(settings: Settings, firebase=None) -> Optional[Storage]:
+    """Select the backend named by ``STORAGE_BACKEND`` (``auto`` = Firebase if available)."""
+    kind = (settings.STORAGE_BACKEND or "auto").lower()
+    opts = dict(
+        max_workers=settings.STORAGE_MAX_WORKERS,
+        max_concurrency=settings.STORAGE_MAX_CONCURRENCY,
+        timeout=settings.STORAGE_TIMEOUT_S,
+        program_format=(settings.PROGRAM_FORMAT or "json").lower(),
+        chunk_bytes=settings.PROGRAM_CHUNK_BYTES,
+    )
+    if kind in ("auto", "firebase"):
+        if firebase is not None:
+            return FirebaseStorage(firebase, **opts)
+        if kind == "firebase":
+            logger.warning("STORAGE_BACKEND=firebase pero Firestore no está inicializado")
+        return None
+    if kind == "sqlite":
+        from .sql_storage import SQLStorage
+
+        return SQLStorage(settings.STORAGE_SQLITE_URL, **opts)
+    if kind == "memory":
+        return MemoryStorage(**opts)
+    if kind == "none":
+        return None
+    raise ValueError(f"STORAGE_BACKEND desconocido: {kind}")
@@ -1,28 +1,92 @@
+from app.core import startup
+
+startup.track_imports()  # antes del resto: mide el coste de importar cada módulo
+
+import asyncio
 from contextlib import asynccontextmanager
 import logging
 import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.core.config import Settings
+from app.core.config import get_settings
 from app.core.firebase import init_firebase, shutdown_firebase
+from app.core.persistence import persister, build_backend
+from app.core.profiling import TaskNameMiddleware, loop_monitor
+from app.core.storage import FirebaseStorage, build_storage
+from app.core.bus import bus, build_backend as build_bus_backend
+from app.motion.robot import on_bus_message, registry
+from app.motion.simulate import shutdown_pool
 from app.api.routes import all_http_routers
 from app.websocket.endpoints import ws_router
-from app.auth import router as auth_router
-from app.robot import router as robot_router
+from app.auth import get_pwd, on_revoke, router as auth_router
+from app.robot import on_program_saved, router as robot_router, robots_router
 
-settings = Settings()
+settings = get_settings()
 logger = logging.getLogger("app")
 logging.basicConfig(level=logging.INFO)
 
 
+def _without_firebase(app: FastAPI, storage) -> None:
+    """Firebase failed to initialize: run without it, as when it is not configured."""
+    if isinstance(storage, FirebaseStorage) and app.state.storage is storage:
+        app.state.storage = None
+        if persister.backend is storage:
+            persister.backend = None
+        logger.error("Almacenamiento Firebase desactivado: no se pudo inicializar")
+
+
+async def _dispatch(message: dict) -> None:
+    """Route a bus message from another worker to its handler."""
+    kind = message.get("kind")
+    if kind == "revoke":
+        on_revoke(message)
+    elif kind == "program":
+        on_program_saved(message)
+    else:
+        await on_bus_message(message)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    firebase_resources = init_firebase(settings)
-    if firebase_resources:
-        app.state.db = firebase_resources.db
-        app.state.bucket = firebase_resources.bucket
+    loop_monitor.start()
+    with startup.step("firebase"):
+        # solo comprueba credenciales; app y clientes se crean en el primer uso
+        firebase_resources = init_firebase(settings)
+    app.state.firebase = firebase_resources
+    with startup.step("storage"):
+        storage = build_storage(settings, firebase_resources)
+    app.state.storage = storage
+    with startup.step("persistence"):
+        persister.configure(build_backend(settings, storage), settings.PERSIST_RATE_HZ)
+        persister.start()
+    with startup.step("bus"):
+        bus.configure(build_bus_backend(settings), settings.BUS_LOCK_TTL_MS)
+        await bus.start(_dispatch)
+    if settings.JOURNAL_DIR:
+        if bus.distributed:
+            # varios workers escribirían el mismo archivo; el estado se restaura del bus/almacenamiento
+            logger.warning("JOURNAL_DIR ignorado con bus distribuido")
+        else:
+            with startup.step("journal"):
+                registry.open_journals(settings.JOURNAL_DIR, settings.JOURNAL_FILE_BYTES)
+    startup.finish()
+    if settings.STARTUP_WARMUP:
+        # en hilos aparte y sin esperarlos: el servidor empieza a aceptar peticiones mientras tanto
+        loop = asyncio.get_running_loop()
+        if firebase_resources:
+            warmup = loop.run_in_executor(None, firebase_resources.warm_up)
+            warmup.add_done_callback(lambda f: f.result() or _without_firebase(app, storage))
+        loop.run_in_executor(None, get_pwd)
     yield
+    await loop_monitor.stop()
+    await bus.stop()
+    shutdown_pool()
+    persister.stop()
+    registry.close_journals()
+    registry.close_recorders()
+    if storage:
+        storage.close()
     shutdown_firebase(firebase_resources)
 
 
@@ -39,11 +103,13 @@ app.add_middleware(
     allow_methods=allow_methods,
     allow_headers=allow_headers,
 )
+app.add_middleware(TaskNameMiddleware)
 
 for r in all_http_routers:
     app.include_router(r)
 app.include_router(auth_router)
 app.include_router(robot_router)
+app.include_router(robots_router)
 app.include_router(ws_router)
 
 logger.info("HTTP + WebSocket endpoints registered.")
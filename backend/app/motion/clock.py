@@ -0,0 +1,109 @@
+"""Deadline-based frame clock for motion playback.
+
+Frames are scheduled against absolute ``time.monotonic()`` deadlines
+(``t0 + k * interval``) instead of sleeping a fixed interval after each
+frame, so the work done per frame (broadcast, persistence) does not add to
+the period. When the loop falls behind, late frames are skipped rather than
+stretching the move: a move of N frames always ends at ``t0 + N * interval``
+(plus the time spent paused, when a ``gate`` is given).
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import AsyncIterator, Optional
+
+from app.core.config import get_settings
+from app.core.metrics import metrics
+
+settings = get_settings()
+
+FRAME_PERIOD = metrics.histogram("frame_period_seconds", "Time between consecutive motion frames")
+FRAMES_SKIPPED = metrics.counter("frames_skipped_total", "Motion frames skipped because the loop fell behind")
+
+
+class MotionClock:
+    def __init__(self, interval_s: float = 0.05) -> None:
+        self.interval = interval_s
+        self.reset_stats()
+
+    @property
+    def interval_ms(self) -> float:
+        return self.interval * 1000
+
+    def frames_for(self, duration_ms: float) -> int:
+        """Number of frames used to play a move of ``duration_ms``."""
+        return max(1, int(duration_ms / self.interval_ms))
+
+    def reset_stats(self) -> None:
+        self._frames = 0
+        self._skipped = 0
+        self._elapsed = 0.0
+        self._late_sum = 0.0
+        self._late_max = 0.0
+
+    async def ticks(self, frames: int, gate: Optional[asyncio.Event] = None) -> AsyncIterator[int]:
+        """Yield frame indices ``1..frames`` on schedule, skipping late ones.
+
+        Frame ``i`` is due at ``t0 + (i - 1) * interval``; the last frame is
+        always yielded, and the generator returns at ``t0 + frames * interval``.
+        While ``gate`` is cleared no frame is yielded, and ``t0`` moves
+        forward by the paused time so no frame is skipped on resume.
+        """
+        interval = self.interval
+        t0 = time.monotonic()
+        start = t0
+        prev = None
+        i = 1
+        try:
+            while i <= frames:
+                if gate is not None and not gate.is_set():
+                    paused = time.monotonic()
+                    await gate.wait()
+                    idle = time.monotonic() - paused
+                    t0 += idle
+                    start += idle  # la pausa no cuenta para los fps
+                    prev = None
+                deadline = t0 + (i - 1) * interval
+                now = time.monotonic()
+                if now < deadline:
+                    await asyncio.sleep(deadline - now)
+                    if gate is not None and not gate.is_set():
+                        continue  # pausado mientras se esperaba el frame
+                    now = time.monotonic()
+                else:
+                    due = min(frames, int((now - t0) / interval) + 1)
+                    if due > i:
+                        self._skipped += due - i
+                        FRAMES_SKIPPED.inc(due - i)
+                        i = due
+                        deadline = t0 + (i - 1) * interval
+                late = now - deadline
+                self._late_sum += late
+                if late > self._late_max:
+                    self._late_max = late
+                self._frames += 1
+                if prev is not None:
+                    FRAME_PERIOD.observe(now - prev)
+                prev = now
+                yield i
+                i += 1
+            remaining = t0 + frames * interval - time.monotonic()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+        finally:
+            self._elapsed += time.monotonic() - start
+
+    def stats(self) -> dict:
+        frames = self._frames
+        return {
+            "interval_ms": self.interval_ms,
+            "frames": frames,
+            "skipped": self._skipped,
+            "fps": round(frames / self._elapsed, 2) if self._elapsed else 0.0,
+            "jitter_ms_mean": round(self._late_sum / frames * 1000, 3) if frames else 0.0,
+            "jitter_ms_max": round(self._late_max * 1000, 3),
+        }
+
+
+motion_clock = MotionClock(settings.FRAME_INTERVAL_MS / 1000)
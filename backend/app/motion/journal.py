@@ -0,0 +1,152 @@
+"""Per-robot journal of sequenced events.
+
+``EventJournal`` keeps the last ``capacity`` frames of a robot in a ring
+buffer so a reconnecting client can resume from the ``seq`` it last saw
+(``/ws?since=``) and a new client gets the current state immediately.
+
+Optionally the journal is mirrored to an append-only file mapped with
+``mmap``: appending is a memory copy (no syscall per frame), the header
+always holds the latest full state for O(1) restore on restart, and the
+records after it rebuild the ring. When the file is full, writing starts
+again after the header (older records are only kept in memory)::
+
+    header: <4s magic "RBJ1"> <H version> <H joints> <Q end offset> <Q last seq> <h angle>*joints
+    record: <I length> <Q seq> <length bytes: JSON text of the frame>
+"""
+from __future__ import annotations
+
+import json
+import logging
+import mmap
+import os
+import struct
+from bisect import bisect_right
+from collections import deque
+from typing import Deque, Dict, List, Optional, Sequence
+
+from app.websocket.frames import Frame
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"RBJ1"
+VERSION = 1
+_HEADER = struct.Struct("<4sHHQQ")
+_RECORD = struct.Struct("<IQ")
+
+
+class JournalFile:
+    """Append-only, memory-mapped mirror of one robot's journal."""
+
+    def __init__(self, path: str, joints: Sequence[str], size: int = 8 << 20) -> None:
+        self.path = path
+        self.joints = tuple(joints)
+        self._state = struct.Struct(f"<{len(self.joints)}h")
+        self.header_size = _HEADER.size + self._state.size
+        fresh = not os.path.isfile(path) or os.path.getsize(path) < self.header_size
+        self._fh = open(path, "a+b")
+        if os.path.getsize(path) < size:
+            self._fh.truncate(size)
+        self.map = mmap.mmap(self._fh.fileno(), 0)
+        self.size = len(self.map)
+        magic, version, joints_n, end, seq = _HEADER.unpack_from(self.map, 0)
+        if fresh or magic != MAGIC or version != VERSION or joints_n != len(self.joints) or end > self.size:
+            if not fresh:
+                logger.warning(f"Journal {path} incompatible; se reinicia")
+            self.end, self.seq = self.header_size, 0
+            self.state: Optional[Dict[str, int]] = None
+            self._write_header()
+        else:
+            self.end, self.seq = end, seq
+            values = self._state.unpack_from(self.map, _HEADER.size)
+            self.state = dict(zip(self.joints, values)) if seq else None
+
+    def _write_header(self) -> None:
+        _HEADER.pack_into(self.map, 0, MAGIC, VERSION, len(self.joints), self.end, self.seq)
+
+    def append(self, frame: Frame) -> None:
+        data = frame.text(full=True).encode()
+        needed = _RECORD.size + len(data)
+        if needed > self.size - self.header_size:
+            return  # no cabe ni en un archivo vacío
+        if self.end + needed > self.size:
+            self.end = self.header_size  # lleno: se vuelve a escribir tras la cabecera
+        _RECORD.pack_into(self.map, self.end, len(data), frame.seq or 0)
+        start = self.end + _RECORD.size
+        self.map[start:start + len(data)] = data
+        self.end = start + len(data)
+        self.seq = frame.seq or self.seq
+        if frame.full_payload is not None:
+            self.state = dict(frame.full_payload)
+            self._state.pack_into(self.map, _HEADER.size, *(int(self.state.get(j, 0)) for j in self.joints))
+        self._write_header()
+
+    def records(self) -> List[Frame]:
+        """Frames stored since the last wrap, oldest first."""
+        frames = []
+        offset = self.header_size
+        while offset + _RECORD.size <= self.end:
+            length, seq = _RECORD.unpack_from(self.map, offset)
+            start = offset + _RECORD.size
+            if start + length > self.end:
+                break
+            try:
+                msg = json.loads(self.map[start:start + length])
+            except ValueError:
+                break
+            frames.append(_frame_from_message(msg, seq, self.joints))
+            offset = start + length
+        return frames
+
+    def close(self) -> None:
+        self.map.flush()
+        self.map.close()
+        self._fh.close()
+
+
+def _frame_from_message(msg: dict, seq: int, joints: Sequence[str]) -> Frame:
+    event = msg.get("type", "")
+    payload = msg.get("payload") or {}
+    robot = msg.get("robot")
+    if event == "STATE_UPDATE":
+        key = event if robot is None else f"{event}:{robot}"
+        return Frame(event, payload, seq, full_payload=payload, coalesce_key=key, joints=joints, robot=robot)
+    return Frame(event, payload, seq, robot=robot)
+
+
+class EventJournal:
+    def __init__(self, capacity: int = 1024) -> None:
+        self.frames: Deque[Frame] = deque(maxlen=max(1, capacity))
+        self.file: Optional[JournalFile] = None
+
+    @property
+    def last_seq(self) -> int:
+        return (self.frames[-1].seq or 0) if self.frames else 0
+
+    def append(self, frame: Frame) -> None:
+        if frame.seq is None:
+            return
+        self.frames.append(frame)
+        if self.file is not None:
+            self.file.append(frame)
+
+    def since(self, seq: int) -> Optional[List[Frame]]:
+        """Frames after ``seq``, or ``None`` if some of them are no longer kept."""
+        frames = list(self.frames)
+        if not frames:
+            return None
+        seqs = [f.seq or 0 for f in frames]
+        if seq < seqs[0] - 1 or seq > seqs[-1]:
+            return None  # demasiado antiguo o de otra ejecución del servidor
+        return frames[bisect_right(seqs, seq):]
+
+    def attach(self, path: str, joints: Sequence[str], size: int) -> Optional[Dict[str, int]]:
+        """Mirror the journal to ``path``; returns the last state stored there."""
+        self.file = JournalFile(path, joints, size)
+        for frame in self.file.records():
+            self.frames.append(frame)
+        return self.file.state
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
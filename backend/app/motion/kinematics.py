@@ -0,0 +1,185 @@
+"""Forward and inverse kinematics of the arm.
+
+Geometry and angle conventions match the client's ``Robot3D.tsx`` (Three.js
+axes, Y up): the base yaws the whole arm about Y, the shoulder sits at
+``base_height`` and shoulder/elbow pitch about X by ``-(angle - 90)°``, so
+90° points straight up. ``forward`` is vectorized over any number of joint
+rows (e.g. a whole ``Trajectory.frames`` table).
+
+Inverse kinematics splits off the base angle analytically (``atan2``) and
+answers the remaining planar problem from ``WorkspaceIndex``: every integer
+(hombro, codo) pair is precomputed once and bucketed in a uniform grid over
+the arm plane, so a query is a couple of ``searchsorted`` calls plus a tiny
+nearest-neighbour scan, and candidate sets are memoized per quantized target.
+"""
+from __future__ import annotations
+
+import math
+from functools import lru_cache
+from typing import Dict, Mapping, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import get_settings
+
+settings = get_settings()
+
+
+class ArmGeometry(NamedTuple):
+    base_height: float = 1.5
+    upper_len: float = 4.5
+    fore_len: float = 3.8
+
+
+GEOMETRY = ArmGeometry()
+ANGLE_RANGE = (0, 180)
+
+
+def forward(angles: np.ndarray, geometry: ArmGeometry = GEOMETRY) -> np.ndarray:
+    """End-effector ``(x, y, z)`` for joint rows ``(..., 3)`` in ``JOINTS`` order."""
+    a = np.radians(np.asarray(angles, dtype=np.float64))
+    base, shoulder, elbow = a[..., 0], (math.pi / 2) - a[..., 1], (math.pi / 2) - a[..., 2]
+    reach = geometry.upper_len * np.sin(shoulder) + geometry.fore_len * np.sin(shoulder + elbow)
+    height = geometry.base_height + geometry.upper_len * np.cos(shoulder) + geometry.fore_len * np.cos(shoulder + elbow)
+    return np.stack([reach * np.sin(base), height, reach * np.cos(base)], axis=-1)
+
+
+def forward_state(state: Mapping[str, float], geometry: ArmGeometry = GEOMETRY) -> Tuple[float, float, float]:
+    """Scalar ``forward`` for one state (no NumPy overhead)."""
+    base = math.radians(state.get("base", 0))
+    shoulder = math.radians(90 - state.get("hombro", 0))
+    elbow = shoulder + math.radians(90 - state.get("codo", 0))
+    reach = geometry.upper_len * math.sin(shoulder) + geometry.fore_len * math.sin(elbow)
+    height = geometry.base_height + geometry.upper_len * math.cos(shoulder) + geometry.fore_len * math.cos(elbow)
+    return reach * math.sin(base), height, reach * math.cos(base)
+
+
+class IKSolution(NamedTuple):
+    base: int
+    hombro: int
+    codo: int
+    error: float  # distancia entre el objetivo y la posición alcanzada
+
+    def state(self) -> Dict[str, int]:
+        return {"base": self.base, "hombro": self.hombro, "codo": self.codo}
+
+
+class WorkspaceIndex:
+    """Uniform-grid index of the planar workspace at 1° joint resolution."""
+
+    def __init__(self, geometry: ArmGeometry = GEOMETRY, cell: float = 0.25, memo_size: int = 65536) -> None:
+        self.geometry = geometry
+        self.cell = cell
+        low, high = ANGLE_RANGE
+        hombro, codo = np.meshgrid(np.arange(low, high + 1), np.arange(low, high + 1), indexing="ij")
+        joints = np.stack([np.zeros(hombro.size), hombro.ravel(), codo.ravel()], axis=1)
+        points = forward(joints, geometry)
+        # plano del brazo: (alcance con signo, altura); con base = 0 el alcance es z
+        planar = points[:, [2, 1]]
+        cells = np.floor(planar / cell).astype(np.int64)
+        self._origin = cells.min(axis=0)
+        cells -= self._origin
+        self._width = int(cells[:, 1].max()) + 1
+        keys = cells[:, 0] * self._width + cells[:, 1]
+        order = np.argsort(keys, kind="stable")
+        self._keys = keys[order]
+        self._points = planar[order]
+        self._angles = np.stack([hombro.ravel(), codo.ravel()], axis=1)[order].astype(np.int16)
+        self._rows = int(cells[:, 0].max()) + 1
+        self.candidates = lru_cache(maxsize=memo_size)(self._candidates)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _candidates(self, qreach: int, qheight: int, quantum: float, max_rings: int) -> Tuple[Tuple[int, int, float], ...]:
+        """Nearest (hombro, codo, distance) grid points to a quantized planar target."""
+        target = np.array([qreach * quantum, qheight * quantum])
+        row0, col0 = (np.floor(target / self.cell).astype(np.int64) - self._origin).tolist()
+        for ring in range(1, max_rings + 1):
+            # las celdas de una fila son claves contiguas: un rango por fila
+            rows = np.arange(max(row0 - ring, 0), min(row0 + ring + 1, self._rows))
+            c_lo, c_hi = max(col0 - ring, 0), min(col0 + ring, self._width - 1)
+            if not len(rows) or c_lo > c_hi:
+                continue
+            lo = np.searchsorted(self._keys, rows * self._width + c_lo, "left")
+            hi = np.searchsorted(self._keys, rows * self._width + c_hi, "right")
+            idx = np.concatenate([np.arange(a, b) for a, b in zip(lo.tolist(), hi.tolist())])
+            if not len(idx):
+                continue
+            dist = np.hypot(*(self._points[idx] - target).T)
+            best = float(dist.min())
+            if best > ring * self.cell:
+                continue  # puede haber uno más cercano en el siguiente anillo
+            # soluciones casi equivalentes (codo arriba / abajo): IKSolver.solve elige entre ellas
+            near = idx[dist <= best + self.cell / 2]
+            near_dist = dist[dist <= best + self.cell / 2]
+            return tuple((int(h), int(c), float(d)) for (h, c), d in zip(self._angles[near], near_dist))
+        return ()
+
+
+class IKSolver:
+    def __init__(self, geometry: ArmGeometry = GEOMETRY, tolerance: float = 0.1,
+                 quantum: float = 0.01, max_rings: int = 8, tie_epsilon: float = 0.01) -> None:
+        self.geometry = geometry
+        self.tolerance = tolerance
+        self.tie_epsilon = tie_epsilon  # errores a menos de esto se consideran empatados
+        self.quantum = quantum
+        self.max_rings = max_rings
+        self._index: Optional[WorkspaceIndex] = None
+
+    @property
+    def index(self) -> WorkspaceIndex:
+        if self._index is None:  # se construye en la primera consulta (~33k puntos)
+            self._index = WorkspaceIndex(self.geometry)
+        return self._index
+
+    def solve(self, x: float, y: float, z: float,
+              current: Optional[Mapping[str, int]] = None) -> Optional[IKSolution]:
+        """Integer joint angles reaching ``(x, y, z)``, or ``None`` if out of reach."""
+        yaw = math.degrees(math.atan2(x, z))
+        reach = math.hypot(x, z)
+        if yaw < ANGLE_RANGE[0]:
+            yaw, reach = yaw + 180, -reach  # la base solo gira 0..180: se inclina hacia atrás
+        elif yaw > ANGLE_RANGE[1]:
+            yaw, reach = yaw - 180, -reach
+        base = int(round(yaw))
+        q = self.quantum
+        candidates = self.index.candidates(int(round(reach / q)), int(round(y / q)), q, self.max_rings)
+        if not candidates:
+            return None
+        # primero el error; la cercanía al estado actual solo desempata
+        best = min(c[2] for c in candidates)
+        tied = [c for c in candidates if c[2] <= best + self.tie_epsilon]
+        current = current or {}
+        hombro, codo, _ = min(tied, key=lambda c: (
+            abs(c[0] - current.get("hombro", c[0])) + abs(c[1] - current.get("codo", c[1])), c[2]))
+        px, py, pz = forward_state({"base": base, "hombro": hombro, "codo": codo}, self.geometry)
+        error = math.dist((px, py, pz), (x, y, z))
+        if error > self.tolerance:
+            return None
+        return IKSolution(base, hombro, codo, round(error, 4))
+
+    def stats(self) -> dict:
+        info = self.index.candidates.cache_info() if self._index is not None else None
+        return {
+            "grid_points": len(self._index) if self._index is not None else 0,
+            "memo_hits": info.hits if info else 0,
+            "memo_misses": info.misses if info else 0,
+        }
+
+
+def path_summary(frames: np.ndarray, geometry: ArmGeometry = GEOMETRY) -> dict:
+    """End-effector path of a trajectory table: length and bounding box."""
+    if not len(frames):
+        return {"path_length": 0.0}
+    points = forward(frames, geometry)
+    length = float(np.linalg.norm(np.diff(points, axis=0), axis=1).sum())
+    return {
+        "path_length": round(length, 4),
+        "min": [round(v, 4) for v in points.min(axis=0).tolist()],
+        "max": [round(v, 4) for v in points.max(axis=0).tolist()],
+    }
+
+
+
+ik_solver = IKSolver(tolerance=settings.IK_TOLERANCE)
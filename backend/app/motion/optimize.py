@@ -0,0 +1,142 @@
+"""Program optimizer: same end state, fewer frames.
+
+``optimize_program`` rewrites a list of items in passes:
+
+- ``noops``: drop sequential steps whose target is the current angle and
+  parallel blocks that don't move any joint (they only wait).
+- ``merge``: consecutive sequential steps of the same joint (and profile)
+  become one step to the last angle. Its duration is counted in clock
+  frames (each step plays ``max(1, duration // interval)``) and keeps the
+  average speed of the original moves, so it is never faster than them
+  and never plays more frames.
+- ``parallelize`` (needs the start state): runs of sequential steps on
+  different joints with the same profile become one parallel block lasting
+  as long as the slowest step; the program becomes ``parallel``.
+
+Angles of joints not yet moved are unknown when no start state is given
+(e.g. on save), so those steps are never treated as no-ops.
+"""
+from __future__ import annotations
+
+import math
+from typing import Dict, List, Mapping, NamedTuple, Optional, Sequence
+
+from .trajectory import DURATION_LIMITS, JOINTS, compile_program
+
+
+class OptimizedProgram(NamedTuple):
+    kind: str
+    items: List[dict]
+    report: dict
+
+
+def _drop_noops(kind: str, items: Sequence[Mapping], current: Dict[str, int]) -> List[dict]:
+    out = []
+    for item in items:
+        if kind == "sequential":
+            targets = {item["joint"]: item["angle"]}
+        else:
+            targets = {j: item[j] for j in JOINTS if j in item}
+        if all(current.get(j) == v for j, v in targets.items()):
+            continue
+        current.update(targets)
+        out.append(dict(item))
+    return out
+
+
+def _frames(duration_ms: float, interval_ms: float) -> int:
+    return max(1, int(duration_ms / interval_ms))  # como compile_program
+
+
+def _merge_steps(items: List[dict], start: Mapping[str, int], interval_ms: float) -> List[dict]:
+    """Merge runs of the same joint; ``items`` must have no no-ops."""
+    current = dict(start)
+    out: List[dict] = []
+    run: List[dict] = []
+
+    def close_run() -> None:
+        if not run:
+            return
+        joint = run[0]["joint"]
+        if current.get(joint) is None:
+            # ángulo inicial desconocido: el primer paso se conserva tal cual
+            out.append(run.pop(0))
+            current[joint] = out[-1]["angle"]
+        first, last = current[joint], run[-1]["angle"] if run else current[joint]
+        travel, prev = 0, first
+        for step in run:
+            travel += abs(step["angle"] - prev)
+            prev = step["angle"]
+        total = sum(_frames(step.get("duration_ms", 1000), interval_ms) for step in run)
+        frames = max(1, math.ceil(total * abs(last - first) / travel)) if travel else 0
+        duration = max(DURATION_LIMITS[0], math.ceil(frames * interval_ms)) if frames else 0
+        if len(run) <= 1 or duration > DURATION_LIMITS[1]:
+            out.extend(run)
+        elif last != first:
+            out.append({**run[-1], "duration_ms": duration})
+        # ida y vuelta al mismo ángulo: no queda movimiento
+        current[joint] = last
+        run.clear()
+
+    for step in items:
+        if run and (step["joint"] != run[0]["joint"] or step.get("profile") != run[0].get("profile")):
+            close_run()
+        run.append(step)
+    close_run()
+    return out
+
+
+def _parallelize(items: List[dict], start: Mapping[str, int]) -> List[dict]:
+    current = {j: int(start.get(j, 0)) for j in JOINTS}
+    blocks: List[dict] = []
+    group: List[dict] = []
+
+    def close_group() -> None:
+        if group:
+            current.update({step["joint"]: step["angle"] for step in group})
+            blocks.append({**current, "duration_ms": max(step.get("duration_ms", 1000) for step in group),
+                           "profile": group[0].get("profile")})
+            group.clear()
+
+    for step in items:
+        if group and (step["joint"] in {s["joint"] for s in group}
+                      or step.get("profile") != group[0].get("profile")):
+            close_group()
+        group.append(step)
+    close_group()
+    return blocks
+
+
+def optimize_program(kind: str, items: Sequence[Mapping], start_state: Optional[Mapping[str, int]] = None,
+                     interval_ms: float = 50.0, parallelize: bool = False) -> OptimizedProgram:
+    """Optimized items plus a report (durations computed as ``compile_program`` would)."""
+    known = dict(start_state or {})
+    optimized = _drop_noops(kind, items, dict(known))
+    noops = len(items) - len(optimized)
+    merged = 0
+    new_kind = kind
+    if kind == "sequential":
+        before_merge = len(optimized)
+        optimized = _merge_steps(optimized, known, interval_ms)
+        merged = before_merge - len(optimized)
+        if parallelize and start_state is not None and optimized:
+            optimized = _parallelize(optimized, start_state)
+            new_kind = "parallel"
+    start = dict(start_state or {})
+    before = compile_program(kind, items, start, interval_ms)
+    after = compile_program(new_kind, optimized, start, interval_ms)
+    if after.total_frames > before.total_frames:
+        # nunca devolver un programa más largo que el original
+        optimized, new_kind, noops, merged, after = [dict(i) for i in items], kind, 0, 0, before
+    return OptimizedProgram(new_kind, optimized, {
+        "kind": new_kind,
+        "items_before": len(items),
+        "items_after": len(optimized),
+        "removed_noops": noops,
+        "merged": merged,
+        "frames_before": before.total_frames,
+        "frames_after": after.total_frames,
+        "duration_ms_before": before.duration_ms,
+        "duration_ms_after": after.duration_ms,
+        "saved_ms": before.duration_ms - after.duration_ms,
+    })
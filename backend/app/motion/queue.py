@@ -0,0 +1,78 @@
+"""Bounded FIFO of motion items.
+
+Backed by ``collections.deque`` so draining is O(1) per step, with
+all-or-nothing bulk enqueue for large generated programs. Mutations are
+reported to ``listener`` (used to replicate queues across workers) and
+replayed on replicas with ``apply``.
+"""
+from __future__ import annotations
+
+from collections import deque
+from itertools import islice
+from typing import Callable, Deque, Iterable, List, Optional
+
+
+class QueueFull(Exception):
+    pass
+
+
+class MotionQueue:
+    def __init__(self, max_items: int = 100_000) -> None:
+        self.max_items = max_items
+        self._items: Deque[dict] = deque()
+        self.listener: Optional[Callable[[str, List[dict]], None]] = None
+
+    def _notify(self, op: str, items: List[dict]) -> None:
+        if self.listener is not None:
+            self.listener(op, items)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __bool__(self) -> bool:
+        return bool(self._items)
+
+    @property
+    def free(self) -> int:
+        return self.max_items - len(self._items)
+
+    def append(self, item: dict) -> None:
+        if len(self._items) >= self.max_items:
+            raise QueueFull(f"Cola llena (máx. {self.max_items})")
+        self._items.append(item)
+        self._notify("extend", [item])
+
+    def extend(self, items: List[dict]) -> None:
+        """Enqueue all of ``items`` or none of them."""
+        if len(items) > self.free:
+            raise QueueFull(f"Cola llena: caben {self.free} de {len(items)} (máx. {self.max_items})")
+        self._items.extend(items)
+        self._notify("extend", items)
+
+    def popleft(self) -> dict:
+        item = self._items.popleft()
+        self._notify("popleft", [])
+        return item
+
+    def clear(self) -> None:
+        self._items.clear()
+        self._notify("clear", [])
+
+    def last(self) -> Optional[dict]:
+        return self._items[-1] if self._items else None
+
+    def apply(self, op: str, items: List[dict]) -> None:
+        """Replay a mutation reported by another replica (not re-notified)."""
+        if op == "extend":
+            self._items.extend(items)
+        elif op == "popleft" and self._items:
+            self._items.popleft()
+        elif op == "clear":
+            self._items.clear()
+
+    def page(self, offset: int = 0, limit: Optional[int] = None) -> List[dict]:
+        end = None if limit is None else offset + limit
+        return list(islice(self._items, offset, end))
+
+    def __iter__(self) -> Iterable[dict]:
+        return iter(self._items)
@@ -0,0 +1,214 @@
+"""Opt-in trajectory recorder.
+
+With ``RECORDER_DIR`` set, each robot records what it plays: every state
+frame and every step start/end, with a timestamp, the joint angles and the
+run ID. Records are written into a preallocated numpy buffer (no object
+per frame); when it fills, when a run ends and before a download, the
+buffer is swapped for an empty one and handed to the writer thread, which
+appends it to the robot's current recording file and rotates files, so
+disk latency never reaches the event loop. Memory stays at
+``buffer_frames`` records (plus blocks waiting for the disk) however many
+hours are captured.
+
+A recording is a fixed-size header (magic plus JSON) followed by packed
+records, so it opens as columns with no parsing::
+
+    header, rec = load_recording("brazo2-20260101-120000.rbr")
+    rec["t"], rec["base"], rec["hombro"], rec["codo"]  # np.memmap
+
+Files rotate at ``file_bytes`` and the last ``keep`` per robot are kept.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import AsyncIterator, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from app.core.metrics import metrics
+
+from .trajectory import JOINTS
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"RBR1"
+VERSION = 1
+HEADER_BYTES = 512
+SUFFIX = ".rbr"
+EVENTS = ("STATE_UPDATE", "MOVE_SEQ_START", "MOVE_SEQ_END", "MOVE_PAR_START", "MOVE_PAR_END")
+RUN_ID_BYTES = 12  # uuid hex[:12], ver app.motion.scheduler.Run
+RECORD_DTYPE = np.dtype([("t", "<f8"), ("run", f"S{RUN_ID_BYTES}"), ("event", "u1")]
+                        + [(j, "<i2") for j in JOINTS])
+
+RECORDED = metrics.counter("trajectory_records_total", "Frames and events written to recordings")
+
+# un solo hilo para todas las grabaciones: los bloques de cada robot se escriben en orden
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trajectory-recorder")
+
+
+def _header(robot_id: str) -> bytes:
+    text = json.dumps({
+        "version": VERSION,
+        "robot": robot_id,
+        "started_at": time.time(),
+        "joints": list(JOINTS),
+        "events": list(EVENTS),
+        "fields": [[name, RECORD_DTYPE[name].str] for name in RECORD_DTYPE.names],
+    }).encode()
+    return MAGIC + text.ljust(HEADER_BYTES - len(MAGIC))
+
+
+def read_header(fh) -> dict:
+    data = fh.read(HEADER_BYTES)
+    if len(data) < HEADER_BYTES or data[:len(MAGIC)] != MAGIC:
+        raise ValueError("No es una grabación de trayectoria")
+    return json.loads(data[len(MAGIC):])
+
+
+def load_recording(path: str) -> Tuple[dict, np.ndarray]:
+    """Header and records of a recording, memory-mapped (read-only)."""
+    with open(path, "rb") as fh:
+        header = read_header(fh)
+    dtype = np.dtype([tuple(f) for f in header["fields"]])
+    count = (os.path.getsize(path) - HEADER_BYTES) // dtype.itemsize
+    if count <= 0:
+        return header, np.zeros(0, dtype)
+    return header, np.memmap(path, dtype, "r", offset=HEADER_BYTES, shape=(count,))
+
+
+class TrajectoryRecorder:
+    def __init__(self, robot_id: str, directory: str, buffer_frames: int = 1024,
+                 file_bytes: int = 64 << 20, keep: int = 24) -> None:
+        self.robot_id = robot_id
+        self.directory = directory
+        self.file_bytes = file_bytes
+        self.keep = max(1, keep)
+        self.buffer = np.zeros(max(1, buffer_frames), RECORD_DTYPE)
+        self.count = 0
+        self.path: Optional[str] = None
+        self._fh = None
+        self._name_re = re.compile(rf"^{re.escape(robot_id)}-\d{{8}}-\d{{6}}(-\d+)?{re.escape(SUFFIX)}$")
+
+    def record(self, event: str, state: Mapping[str, int], run_id: Optional[str] = None) -> None:
+        self.buffer[self.count] = (time.time(), (run_id or "").encode()[:RUN_ID_BYTES], EVENTS.index(event),
+                                   *(state.get(j, 0) for j in JOINTS))
+        self.count += 1
+        if self.count == len(self.buffer):
+            self.flush()
+
+    def flush(self) -> Future:
+        """Hand the buffered records to the writer thread (done when the future is)."""
+        block, count = self.buffer, self.count
+        if count:
+            self.buffer, self.count = np.empty_like(block), 0
+        return _writer.submit(self._write, block[:count])
+
+    def _write(self, block: np.ndarray) -> None:
+        # hilo de escritura: único que toca ``_fh`` y ``path``
+        if not len(block):
+            return
+        try:
+            if self._fh is None or self._fh.tell() >= self.file_bytes:
+                self._rotate()
+            self._fh.write(block.tobytes())
+            self._fh.flush()
+        except OSError as e:
+            logger.warning(f"Grabación de {self.robot_id}: no se pudo escribir ({e}); se descartan {len(block)} registros")
+        else:
+            RECORDED.inc(len(block))
+
+    def _rotate(self) -> None:
+        self._close()
+        os.makedirs(self.directory, exist_ok=True)
+        base = f"{self.robot_id}-{time.strftime('%Y%m%d-%H%M%S')}"
+        name, n = base + SUFFIX, 0
+        while os.path.exists(os.path.join(self.directory, name)):
+            n += 1
+            name = f"{base}-{n}{SUFFIX}"
+        self.path = os.path.join(self.directory, name)
+        self._fh = open(self.path, "ab")
+        self._fh.write(_header(self.robot_id))
+        for old in self.files()[:-self.keep]:
+            try:
+                os.remove(os.path.join(self.directory, old))
+            except OSError as e:
+                logger.warning(f"Grabación de {self.robot_id}: no se pudo borrar {old} ({e})")
+
+    def files(self) -> List[str]:
+        """Names of this robot's recordings, oldest first."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        # en el mismo segundo: base.rbr, base-1.rbr, base-2.rbr...
+        return sorted((n for n in names if self._name_re.match(n)),
+                      key=lambda n: (os.path.getmtime(os.path.join(self.directory, n)), len(n), n))
+
+    def path_of(self, name: str) -> Optional[str]:
+        return os.path.join(self.directory, name) if name in self.files() else None
+
+    def info(self) -> List[dict]:
+        out = []
+        for name in self.files():
+            size = os.path.getsize(os.path.join(self.directory, name))
+            out.append({
+                "name": name,
+                "bytes": size,
+                "records": max(0, size - HEADER_BYTES) // RECORD_DTYPE.itemsize,
+                "active": self.path is not None and os.path.basename(self.path) == name,
+            })
+        return out
+
+    def _close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def close(self) -> None:
+        """Write what is buffered and close the file (blocks until done)."""
+        self.flush()
+        _writer.submit(self._close).result()
+
+
+async def stream_raw(path: str, chunk_bytes: int) -> AsyncIterator[bytes]:
+    """File bytes up to its current size, read on the thread pool in chunks."""
+    with open(path, "rb") as fh:
+        remaining = os.fstat(fh.fileno()).st_size
+        while remaining > 0:
+            data = await asyncio.to_thread(fh.read, min(chunk_bytes, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+def _csv_rows(records: np.ndarray, events: List[str], joints: List[str]) -> bytes:
+    columns = [records["t"].tolist(), records["run"].tolist(), records["event"].tolist()]
+    columns += [records[j].tolist() for j in joints]
+    lines = [f"{t:.3f},{run.decode()},{events[e]}," + ",".join(map(str, angles))
+             for t, run, e, *angles in zip(*columns)]
+    return ("\n".join(lines) + "\n").encode()
+
+
+async def stream_csv(path: str, chunk_bytes: int) -> AsyncIterator[bytes]:
+    """The recording as CSV (``t,run_id,event,<joints>``), converted chunk by chunk."""
+    with open(path, "rb") as fh:
+        header = await asyncio.to_thread(read_header, fh)
+        dtype = np.dtype([tuple(f) for f in header["fields"]])
+        joints, events = header["joints"], header["events"]
+        yield ("t,run_id,event," + ",".join(joints) + "\n").encode()
+        remaining = (os.fstat(fh.fileno()).st_size - HEADER_BYTES) // dtype.itemsize
+        per_chunk = max(1, chunk_bytes // dtype.itemsize)
+        while remaining > 0:
+            data = await asyncio.to_thread(fh.read, min(per_chunk, remaining) * dtype.itemsize)
+            records = np.frombuffer(data, dtype, count=len(data) // dtype.itemsize)
+            if not len(records):
+                break
+            remaining -= len(records)
+            yield await asyncio.to_thread(_csv_rows, records, events, joints)
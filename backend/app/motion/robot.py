@@ -0,0 +1,319 @@
+"""Per-robot state, queues and motion task.
+
+Each ``Robot`` owns its joint state, its sequential/parallel queues, its
+frame encoder (sequence numbers and delta baseline) and a
+``MotionScheduler`` that owns its (single) running motion task, so several
+arms animate concurrently in one process without sharing any mutable state. ``registry`` maps robot IDs to robots;
+the ``default`` robot is the one served under ``/robot``.
+
+With several workers, every worker keeps a replica of each robot: queue
+mutations and frames are relayed over ``app.core.bus``, and a per-robot
+bus lock makes the worker that starts a run the only one animating it.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import re
+import zlib
+from typing import Coroutine, Dict, Iterator, List, Optional, Tuple
+
+from app.core.bus import bus
+from app.core.config import get_settings
+from app.core.metrics import metrics
+from app.core.persistence import persister
+from app.websocket.frames import Frame, FrameEncoder
+from app.websocket.manager import manager
+
+from .clock import motion_clock
+from .journal import EventJournal
+from .queue import MotionQueue
+from .recorder import TrajectoryRecorder
+from .scheduler import MotionScheduler, Run
+from .trajectory import JOINTS, Trajectory, compile_program
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROBOT_ID = "default"
+ROBOT_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class Robot:
+    def __init__(self, robot_id: str) -> None:
+        self.id = robot_id
+        self.state: Dict[str, int] = {joint: 0 for joint in JOINTS}
+        self.sequential_queue = MotionQueue(settings.MOTION_QUEUE_MAX)  # {joint, angle, duration_ms}
+        self.parallel_queue = MotionQueue(settings.MOTION_QUEUE_MAX)    # {base, hombro, codo, duration_ms}
+        self.encoder = FrameEncoder(JOINTS, settings.WS_KEYFRAME_EVERY, settings.WS_DELTA_FRAMES, robot=robot_id)
+        self.journal = EventJournal(settings.JOURNAL_CAPACITY)
+        # El robot por defecto conserva las rutas históricas (/robotica, robotica/state)
+        self.persist_key = "state" if robot_id == DEFAULT_ROBOT_ID else f"robot_{robot_id}"
+        self.scheduler = MotionScheduler(self)
+        self.recorder: Optional[TrajectoryRecorder] = None
+        if settings.RECORDER_DIR:
+            self.recorder = TrajectoryRecorder(robot_id, settings.RECORDER_DIR, settings.RECORDER_BUFFER_FRAMES,
+                                               settings.RECORDER_FILE_BYTES, settings.RECORDER_KEEP_FILES)
+        # versión del estado (seq del último STATE_UPDATE) para ETag y long-poll
+        self.state_version = 0
+        self._state_changed = asyncio.Event()
+        self._state_body: Optional[Tuple[tuple, bytes, str]] = None
+        self.lock_name = f"robotica:run:{robot_id}"
+        self.sequential_queue.listener = self._queue_listener("sequential")
+        self.parallel_queue.listener = self._queue_listener("parallel")
+
+    def _queue_listener(self, name: str):
+        def publish(op: str, items: List[dict]) -> None:
+            bus.publish({"kind": "queue", "robot": self.id, "queue": name, "op": op, "items": items})
+        return publish
+
+    @property
+    def busy(self) -> bool:
+        return self.scheduler.busy
+
+    @property
+    def running(self) -> bool:
+        """A run is animating this robot on this worker."""
+        return self.scheduler.current is not None
+
+    # ----- Run control -----
+    async def run(self, mode: str, job: Coroutine, priority: int = 0) -> Optional[Run]:
+        """Start ``job`` as this robot's motion task (see ``MotionScheduler.start``)."""
+        return await self.scheduler.start(mode, job, priority)
+
+    async def drain_sequential(self) -> None:
+        while self.sequential_queue:
+            self.scheduler.plan(len(self.sequential_queue))
+            await self.animate_sequential_step(self.sequential_queue.popleft())
+        await self.broadcast("STATE_UPDATE", self.state)
+
+    async def drain_parallel(self) -> None:
+        while self.parallel_queue:
+            self.scheduler.plan(len(self.parallel_queue))
+            await self.animate_parallel_block(self.parallel_queue.popleft())
+        await self.broadcast("STATE_UPDATE", self.state)
+
+    # ----- Animation -----
+    def compile(self, kind: str, items) -> Trajectory:
+        return compile_program(kind, items, self.state, motion_clock.interval_ms, settings.MOTION_PROFILE)
+
+    async def animate_sequential_step(self, step: dict) -> None:
+        await self.play_segment(self.compile("sequential", [step]), 0)
+
+    async def animate_parallel_block(self, block: dict) -> None:
+        await self.play_segment(self.compile("parallel", [block]), 0)
+
+    async def play_program(self, traj: Trajectory) -> None:
+        """Reproduce un programa compilado completo, segmento a segmento."""
+        k = 0
+        self.scheduler.plan(len(traj), traj.total_frames)
+        while k < len(traj):
+            if traj.state_before(k) != self.state:
+                # El estado cambió por fuera (POST /state): recompilar lo que falta
+                traj = self.compile(traj.kind, traj.items[k:])
+                k = 0
+                self.scheduler.plan(len(traj), traj.total_frames)
+            await self.play_segment(traj, k)
+            k += 1
+
+    async def play_segment(self, traj: Trajectory, k: int) -> None:
+        await self.scheduler.checkpoint()  # en pausa: esperar antes de empezar el paso
+        run = self.scheduler.current
+        item = traj.items[k]
+        prefix = "MOVE_SEQ" if traj.kind == "sequential" else "MOVE_PAR"
+        await self.broadcast(f"{prefix}_START", item)
+        self.record(f"{prefix}_START", run)
+        frames = traj.segment(k)
+        if not len(frames):
+            self.state.update(traj.state_before(k + 1))
+            await self.broadcast("STATE_UPDATE", self.state)
+            self.record("STATE_UPDATE", run)
+        else:
+            done = run.frames_done if run is not None else 0
+            async for i in motion_clock.ticks(len(frames), run.gate if run is not None else None):
+                self.state.update(zip(JOINTS, frames[i - 1].tolist()))
+                await self.broadcast("STATE_UPDATE", self.state)
+                self.record("STATE_UPDATE", run)
+                self.persist()  # persist cada frame (write-behind, ver app.core.persistence)
+                if run is not None:
+                    run.frames_done = done + i
+            persister.flush()
+        if run is not None:
+            run.items_done += 1
+        await self.broadcast(f"{prefix}_END", item)
+        self.record(f"{prefix}_END", run)
+
+    def record(self, event: str, run: Optional[Run]) -> None:
+        if self.recorder is not None:
+            self.recorder.record(event, self.state, run.id if run is not None else None)
+
+    # ----- Output -----
+    async def broadcast(self, event_type: str, payload: dict) -> None:
+        # Se serializa una sola vez; los frames de estado van como delta + seq y
+        # se fusionan en clientes lentos (solo importa el último)
+        if event_type == "STATE_UPDATE":
+            frame = self.encoder.state(payload)
+            self._state_updated(frame.seq or 0)
+        else:
+            frame = self.encoder.event(event_type, payload)
+        self.journal.append(frame)
+        await manager.broadcast(frame)
+
+    def _state_updated(self, version: int) -> None:
+        self.state_version = version
+        changed, self._state_changed = self._state_changed, asyncio.Event()
+        changed.set()
+
+    async def wait_state(self, since: int, timeout: float) -> bool:
+        """Wait until ``state_version`` is not ``since``; False on timeout."""
+        if self.state_version != since:
+            return True
+        try:
+            await asyncio.wait_for(self._state_changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def state_body(self) -> Tuple[bytes, str]:
+        """State serialized as JSON plus its ETag, rebuilt only when it changes."""
+        key = tuple(self.state.get(j) for j in JOINTS)
+        if self._state_body is None or self._state_body[0] != key:
+            body = json.dumps(dict(zip(JOINTS, key)), separators=(",", ":")).encode()
+            self._state_body = (key, body, f'"{zlib.crc32(body):08x}"')
+        return self._state_body[1], self._state_body[2]
+
+    def snapshot(self) -> Frame:
+        return self.encoder.snapshot(self.state)
+
+    def resume(self, since: Optional[int]) -> List[Frame]:
+        """Frames a client that last saw ``since`` needs (a snapshot if unknown)."""
+        frames = self.journal.since(since) if since is not None else None
+        return [self.snapshot()] if frames is None else frames
+
+    def persist(self, flush: bool = False) -> None:
+        persister.submit(self.state, key=self.persist_key)
+        if flush:
+            persister.flush()
+
+    def status(self) -> dict:
+        return {
+            "id": self.id,
+            "running": self.busy,
+            "mode": (self.scheduler.info() or {}).get("mode"),
+            "run": self.scheduler.info(),
+            "sequential_queue_len": len(self.sequential_queue),
+            "parallel_queue_len": len(self.parallel_queue),
+            "state": self.state,
+        }
+
+
+class RobotRegistry:
+    def __init__(self, max_robots: int = 64, robot_ids=()) -> None:
+        self.max_robots = max_robots
+        self._robots: Dict[str, Robot] = {}
+        self.default = self.create(DEFAULT_ROBOT_ID)
+        for robot_id in robot_ids:
+            if robot_id and robot_id not in self._robots:
+                self.create(robot_id)
+
+    def create(self, robot_id: str) -> Robot:
+        if not ROBOT_ID_RE.match(robot_id):
+            raise ValueError("ID de robot inválido (letras, dígitos, '-' o '_', máx. 64)")
+        if robot_id in self._robots:
+            return self._robots[robot_id]
+        if len(self._robots) >= self.max_robots:
+            raise ValueError(f"Máximo de robots alcanzado ({self.max_robots})")
+        robot = self._robots[robot_id] = Robot(robot_id)
+        return robot
+
+    def get(self, robot_id: str) -> Optional[Robot]:
+        return self._robots.get(robot_id)
+
+    def __iter__(self) -> Iterator[Robot]:
+        return iter(list(self._robots.values()))
+
+    def __len__(self) -> int:
+        return len(self._robots)
+
+    def open_journals(self, directory: str, size: int) -> None:
+        """Mirror every journal to ``directory`` and restore the state saved there."""
+        os.makedirs(directory, exist_ok=True)
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".journal") and name[:-8] not in self._robots:
+                try:
+                    self.create(name[:-8])
+                except ValueError as e:
+                    logger.warning(f"Journal {name} ignorado: {e}")
+        for robot in self:
+            state = robot.journal.attach(os.path.join(directory, f"{robot.id}.journal"), JOINTS, size)
+            if state is not None:
+                robot.state.update(state)
+                # seq continúa tras el reinicio: los clientes que reanudan no ven saltos hacia atrás
+                robot.encoder.seq = max(robot.encoder.seq, robot.journal.file.seq, robot.journal.last_seq)
+                robot._state_updated(robot.encoder.seq)
+                logger.info(f"Estado de {robot.id} restaurado del journal (seq {robot.encoder.seq})")
+
+    def close_journals(self) -> None:
+        for robot in self:
+            robot.journal.close()
+
+    def close_recorders(self) -> None:
+        for robot in self:
+            if robot.recorder is not None:
+                robot.recorder.close()
+
+
+registry = RobotRegistry(settings.ROBOTS_MAX, settings.ROBOT_IDS)
+
+metrics.gauge("motion_queue_depth", "Items waiting in each robot's motion queues", lambda: [
+    ({"robot": r.id, "queue": name}, len(q))
+    for r in registry for name, q in (("sequential", r.sequential_queue), ("parallel", r.parallel_queue))
+])
+metrics.gauge("robots_running", "Robots animating on this worker", lambda: sum(r.running for r in registry))
+
+
+def _replica(robot_id: Optional[str]) -> Optional[Robot]:
+    if robot_id is None:
+        return None
+    robot = registry.get(robot_id)
+    if robot is None:
+        try:
+            robot = registry.create(robot_id)
+        except ValueError:
+            return None
+    return robot
+
+
+async def on_bus_message(message: dict) -> None:
+    """Apply a message published by another worker to the local replicas."""
+    kind = message.get("kind")
+    if kind == "frame":
+        frame = Frame.from_wire(message["frame"])
+        robot = _replica(frame.robot)
+        if robot is not None and not robot.running:
+            robot.scheduler.touch_remote()
+            robot.encoder.observe(frame)
+            robot.journal.append(frame)
+            if frame.full_payload is not None:
+                robot.state.update(frame.full_payload)
+                robot._state_updated(frame.seq or 0)
+        manager.deliver(frame)
+    elif kind == "queue":
+        robot = _replica(message.get("robot"))
+        if robot is not None:
+            queue = robot.sequential_queue if message.get("queue") == "sequential" else robot.parallel_queue
+            queue.apply(message["op"], message.get("items", []))
+    elif kind == "run":
+        robot = _replica(message.get("robot"))
+        if robot is not None:
+            robot.scheduler.set_remote(message.get("run"), message.get("ended"))
+    elif kind == "robot":
+        _replica(message.get("robot"))
+    elif kind == "control":
+        # stop / pause / resume reenviados al worker dueño de la ejecución
+        robot = registry.get(message.get("robot"))
+        action = message.get("action")
+        if robot is not None and robot.running and action in ("stop", "pause", "resume"):
+            await getattr(robot.scheduler, action)()
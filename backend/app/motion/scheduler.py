@@ -0,0 +1,219 @@
+"""Per-robot motion scheduler.
+
+``MotionScheduler`` owns a robot's motion task: at most one ``Run`` at a
+time, with an ID, a priority and its progress (items and frames played).
+
+- ``stop`` cancels the task. Playback only awaits the frame clock, so the
+  cancellation lands before the next frame (within ``FRAME_INTERVAL_MS``)
+  instead of after the remaining program or queue.
+- ``pause`` clears the run's gate; the clock waits on it before each frame
+  and shifts its deadlines on ``resume``, so the move continues where it
+  stopped instead of skipping the paused frames.
+- ``start`` with a higher ``priority`` than the current run preempts it
+  (stopped with reason ``preempted``) once its task has finished.
+
+Runs owned by another worker are only known through the bus (``remote``);
+stop/pause/resume are forwarded to their owner as ``control`` messages.
+The marker is refreshed by the owner's frames; once it is older than the
+lock TTL, ``start`` tries the bus lock anyway and clears the marker if it
+gets it (the owner died without publishing the end of its run). A run
+whose lock can no longer be renewed is stopped with reason ``lock_lost``.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+import uuid
+from typing import TYPE_CHECKING, Coroutine, Optional
+
+from app.core.bus import bus
+from app.core.config import get_settings
+
+if TYPE_CHECKING:
+    from .robot import Robot
+
+
+class Run:
+    __slots__ = ("id", "mode", "priority", "started_at", "gate", "task", "reason",
+                 "items_done", "items_total", "frames_done", "frames_total")
+
+    def __init__(self, mode: str, priority: int = 0) -> None:
+        self.id = uuid.uuid4().hex[:12]
+        self.mode = mode
+        self.priority = priority
+        self.started_at = time.time()
+        self.gate = asyncio.Event()  # activo = en marcha; limpio = en pausa
+        self.gate.set()
+        self.task: Optional[asyncio.Task] = None
+        self.reason: Optional[str] = None
+        self.items_done = 0
+        self.items_total: Optional[int] = None
+        self.frames_done = 0
+        self.frames_total: Optional[int] = None
+
+    @property
+    def paused(self) -> bool:
+        return not self.gate.is_set()
+
+    def plan(self, items: int, frames: Optional[int] = None) -> None:
+        """Remaining work from now on (recomputed when a program is recompiled)."""
+        self.items_total = self.items_done + items
+        self.frames_total = self.frames_done + frames if frames is not None else None
+
+    def info(self) -> dict:
+        return {
+            "run_id": self.id,
+            "mode": self.mode,
+            "priority": self.priority,
+            "status": "paused" if self.paused else "running",
+            "started_at": self.started_at,
+            "progress": {
+                "items_done": self.items_done,
+                "items_total": self.items_total,
+                "frames_done": self.frames_done,
+                "frames_total": self.frames_total,
+            },
+        }
+
+
+class MotionScheduler:
+    def __init__(self, robot: "Robot") -> None:
+        self.robot = robot
+        self.current: Optional[Run] = None
+        # ejecución en otro worker (dueño del lock), según el bus
+        self.remote: Optional[dict] = None
+        self.remote_seen = 0.0
+
+    @property
+    def busy(self) -> bool:
+        return self.current is not None or self.remote is not None
+
+    @property
+    def remote_stale(self) -> bool:
+        """No news from the remote owner for longer than the lock TTL."""
+        return time.monotonic() - self.remote_seen > get_settings().BUS_LOCK_TTL_MS / 1000
+
+    def set_remote(self, run: Optional[dict], ended: Optional[str] = None) -> None:
+        """Apply a ``run`` bus message; ``ended`` only clears that run's marker."""
+        if run is None and ended is not None and self.remote is not None and self.remote.get("run_id") != ended:
+            return  # fin de una ejecución anterior (p. ej. de un dueño que perdió el lock)
+        self.remote = run
+        self.remote_seen = time.monotonic()
+
+    def touch_remote(self) -> None:
+        if self.remote is not None:
+            self.remote_seen = time.monotonic()
+
+    def can_start(self, priority: int = 0) -> bool:
+        """Whether ``start`` with ``priority`` would run now (idle or preempting)."""
+        if self.current is not None:
+            return priority > self.current.priority
+        return self.remote is None or self.remote_stale
+
+    async def start(self, mode: str, job: Coroutine, priority: int = 0) -> Optional[Run]:
+        """Run ``job`` as the robot's motion task.
+
+        Returns ``None`` (and discards ``job``) if a run of equal or higher
+        priority is in progress here, or any run on another worker.
+        """
+        current = self.current
+        if current is not None and priority > current.priority:
+            await self._finish(current, "preempted")
+        if not self.can_start(priority) or not await bus.acquire(self.robot.lock_name, self._lock_lost):
+            job.close()
+            return None
+        if self.current is not None:  # otra petición ganó mientras se esperaba el lock
+            job.close()
+            return None
+        self.remote = None  # con el lock en mano, un marcador remoto era de un dueño caído
+        run = self.current = Run(mode, priority)
+        bus.publish({"kind": "run", "robot": self.robot.id, "run": self._summary(run)})
+        run.task = asyncio.create_task(self._wrap(run, job), name=f"robot-{self.robot.id}-{run.id}")
+        return run
+
+    async def _wrap(self, run: Run, job: Coroutine) -> None:
+        robot = self.robot
+        try:
+            await robot.broadcast("RUN_STARTED", run.info())
+            await job
+        except asyncio.CancelledError:
+            # detenido: el estado queda donde llegó el último frame
+            robot.persist(flush=True)
+            await robot.broadcast("RUN_STOPPED", {**run.info(), "reason": run.reason or "stopped",
+                                                  "state": dict(robot.state)})
+        finally:
+            job.close()  # si se canceló antes de empezar
+            if self.current is run:
+                self.current = None
+            if robot.recorder is not None:
+                robot.recorder.flush()  # la ejecución pasa entera al hilo de escritura
+            bus.publish({"kind": "run", "robot": robot.id, "run": None, "ended": run.id})
+            await bus.release(robot.lock_name)
+
+    async def _lock_lost(self) -> None:
+        if self.current is not None:
+            await self._finish(self.current, "lock_lost")
+
+    async def _finish(self, run: Run, reason: str) -> None:
+        run.reason = reason
+        if run.task is not None:
+            run.task.cancel()
+            await asyncio.wait([run.task])
+
+    @staticmethod
+    def _summary(run: Run) -> dict:
+        return {"run_id": run.id, "mode": run.mode, "priority": run.priority}
+
+    def _forward(self, action: str) -> Optional[dict]:
+        if self.remote is None:
+            return None
+        bus.publish({"kind": "control", "robot": self.robot.id, "action": action})
+        return dict(self.remote)
+
+    # ----- Control -----
+    async def stop(self, reason: str = "stopped") -> Optional[dict]:
+        """Cancel the current run; returns its info, or ``None`` if idle."""
+        run = self.current
+        if run is None:
+            return self._forward("stop")
+        info = run.info()
+        await self._finish(run, reason)
+        return info
+
+    async def pause(self) -> Optional[dict]:
+        run = self.current
+        if run is None:
+            return self._forward("pause")
+        if not run.paused:
+            run.gate.clear()
+            await self.robot.broadcast("RUN_PAUSED", run.info())
+        return run.info()
+
+    async def resume(self) -> Optional[dict]:
+        run = self.current
+        if run is None:
+            return self._forward("resume")
+        if run.paused:
+            run.gate.set()
+            await self.robot.broadcast("RUN_RESUMED", run.info())
+        return run.info()
+
+    # ----- Playback hooks -----
+    @property
+    def gate(self) -> Optional[asyncio.Event]:
+        return self.current.gate if self.current is not None else None
+
+    async def checkpoint(self) -> None:
+        """Wait here while the current run is paused."""
+        gate = self.gate
+        if gate is not None and not gate.is_set():
+            await gate.wait()
+
+    def plan(self, items: int, frames: Optional[int] = None) -> None:
+        if self.current is not None:
+            self.current.plan(items, frames)
+
+    def info(self) -> Optional[dict]:
+        if self.current is not None:
+            return self.current.info()
+        return dict(self.remote) if self.remote is not None else None
@@ -0,0 +1,161 @@
+"""Headless fast-forward simulation of programs.
+
+``simulate_program`` compiles a program against a start state and reads
+the result straight from the keyframe table: final state, duration,
+per-joint travel, peak speed and every limit violation, without sleeping,
+broadcasting or touching any live robot. ``simulate_batch`` spreads many
+programs over a process pool (chunked to keep pickling overhead low) so
+hundreds of programs are checked in seconds.
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+from app.core.config import get_settings
+
+from .kinematics import path_summary
+from .trajectory import DURATION_LIMITS, JOINTS, PROFILES, compile_program
+
+settings = get_settings()
+
+JOINT_LIMITS: Dict[str, tuple] = {joint: (0, 180) for joint in JOINTS}
+MAX_VIOLATIONS = 100
+
+
+def _check_item(kind: str, k: int, item: Mapping, violations: List[dict]) -> bool:
+    """Record the violations of one item; False if it cannot be compiled."""
+    if not isinstance(item, Mapping):
+        violations.append({"item": k, "kind": "invalid_item"})
+        return False
+    if kind == "sequential":
+        joint = item.get("joint")
+        if joint not in JOINT_LIMITS:
+            violations.append({"item": k, "kind": "unknown_joint", "joint": joint})
+            return False
+        if not isinstance(item.get("angle"), (int, float)):
+            violations.append({"item": k, "kind": "invalid_item", "joint": joint})
+            return False
+        targets = {joint: item["angle"]}
+    else:
+        targets = {j: item[j] for j in JOINTS if j in item}
+        if any(not isinstance(v, (int, float)) for v in targets.values()):
+            violations.append({"item": k, "kind": "invalid_item"})
+            return False
+    for joint, angle in targets.items():
+        low, high = JOINT_LIMITS[joint]
+        if not math.isfinite(angle) or abs(angle) > 32767:  # no cabe en la tabla int16
+            # NaN/inf como texto: la respuesta JSON no los admite
+            violations.append({"item": k, "kind": "invalid_item", "joint": joint,
+                               "value": angle if math.isfinite(angle) else str(angle)})
+            return False
+        if not low <= angle <= high:
+            violations.append({"item": k, "kind": "angle_limit", "joint": joint,
+                               "value": angle, "limit": [low, high]})
+    duration = item.get("duration_ms", 1000)
+    if not isinstance(duration, (int, float)) or not math.isfinite(duration):
+        violations.append({"item": k, "kind": "invalid_item"})
+        return False
+    if not DURATION_LIMITS[0] <= duration <= DURATION_LIMITS[1]:
+        # fuera de límites no se compila: una duración enorme reservaría millones de frames
+        violations.append({"item": k, "kind": "duration_limit", "value": duration,
+                           "limit": list(DURATION_LIMITS)})
+        return False
+    profile = item.get("profile")
+    if profile is not None and profile not in PROFILES:
+        violations.append({"item": k, "kind": "unknown_profile", "value": profile})
+        return False
+    return True
+
+
+def simulate_program(kind: str, items: Sequence[Mapping], start_state: Mapping[str, int],
+                     interval_ms: float, default_profile: str = "linear",
+                     max_speed_deg_s: float = 0.0) -> dict:
+    """Evaluate a program at unlimited speed; never raises on bad items."""
+    if kind not in ("sequential", "parallel"):
+        return {"valid": False, "violations": [{"kind": "unknown_type", "value": kind}],
+                "violations_count": 1}
+    violations: List[dict] = []
+    valid_items = [item for k, item in enumerate(items) if _check_item(kind, k, item, violations)]
+    traj = compile_program(kind, valid_items, start_state, interval_ms, default_profile)
+
+    keyframes = traj.keyframes.astype(np.int32)
+    travel = np.abs(np.diff(keyframes, axis=0)).sum(axis=0) if len(valid_items) else np.zeros(len(JOINTS))
+    peak = np.zeros(len(JOINTS))
+    for k in np.flatnonzero(np.diff(traj.offsets)):
+        # velocidad por frame dentro de cada segmento (incluye el salto desde el keyframe)
+        seg = np.vstack([keyframes[k], traj.segment(int(k)).astype(np.int32)])
+        np.maximum(peak, np.abs(np.diff(seg, axis=0)).max(axis=0), out=peak)
+    peak_speed = peak * (1000.0 / interval_ms)
+    if max_speed_deg_s > 0:
+        for j, joint in enumerate(JOINTS):
+            if peak_speed[j] > max_speed_deg_s:
+                violations.append({"kind": "speed_limit", "joint": joint,
+                                   "value": round(float(peak_speed[j]), 1), "limit": max_speed_deg_s})
+
+    return {
+        "valid": not violations,
+        "items_count": len(items),
+        "frames": traj.total_frames,
+        "duration_ms": traj.duration_ms,
+        "final_state": traj.final_state(),
+        "travel": dict(zip(JOINTS, (int(v) for v in travel))),
+        "peak_speed_deg_s": dict(zip(JOINTS, (round(float(v), 1) for v in peak_speed))),
+        "effector": path_summary(np.vstack([traj.keyframes[:1], traj.frames])),
+        "violations": violations[:MAX_VIOLATIONS],
+        "violations_count": len(violations),
+    }
+
+
+def simulate_many(programs: Sequence[Mapping], start_state: Mapping[str, int], interval_ms: float,
+                  default_profile: str, max_speed_deg_s: float) -> List[dict]:
+    """Worker entry point: simulate a chunk of ``{"type", "items"}`` programs."""
+    return [
+        simulate_program(p.get("type"), p.get("items") or [], start_state, interval_ms,
+                         default_profile, max_speed_deg_s)
+        for p in programs
+    ]
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _workers() -> int:
+    return settings.SIM_MAX_WORKERS or os.cpu_count() or 1
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=_workers())
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def simulate_batch(programs: Sequence[Mapping], start_state: Mapping[str, int],
+                         interval_ms: float) -> List[dict]:
+    """Simulate ``programs`` in the process pool; results keep the input order."""
+    if not programs:
+        return []
+    args = (dict(start_state), interval_ms, settings.MOTION_PROFILE, settings.MOTION_MAX_SPEED_DEG_S)
+    loop = asyncio.get_running_loop()
+    if len(programs) < settings.SIM_PROCESS_MIN:
+        # lotes pequeños: arrancar procesos cuesta más que simular
+        return await loop.run_in_executor(None, simulate_many, list(programs), *args)
+    workers = _workers()
+    size = max(1, -(-len(programs) // (workers * 4)))
+    chunks = [list(programs[i:i + size]) for i in range(0, len(programs), size)]
+    pool = get_pool()
+    results = await asyncio.gather(*(loop.run_in_executor(pool, simulate_many, chunk, *args) for chunk in chunks))
+    return [r for chunk in results for r in chunk]
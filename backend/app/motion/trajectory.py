@@ -0,0 +1,225 @@
+"""Precomputed joint trajectories.
+
+A list of sequential or parallel items is compiled once into an ``int16``
+keyframe table of shape ``(frames, joints)``: one row per clock frame, with
+every velocity profile evaluated in bulk by NumPy. Playback then only
+indexes rows, and because frames are evenly spaced in time, seeking to a
+timestamp, resuming and the total duration are O(1) lookups.
+
+Items loaded from packed storage arrive as ``PackedItems``, a read-only
+sequence over a structured record array; ``compile_program`` reads its
+columns directly instead of building one dict per item.
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Dict, Iterator, List, Mapping, Sequence, Tuple, Union
+
+import numpy as np
+
+JOINTS: Tuple[str, ...] = ("base", "hombro", "codo")
+PROFILES: Tuple[str, ...] = ("linear", "trapezoidal", "s_curve")
+# Allowed ``duration_ms`` of a step (enforced by the API models in app.robot)
+DURATION_LIMITS: Tuple[int, int] = (50, 60000)
+
+# Fraction of the move spent accelerating (and decelerating) in a trapezoid
+TRAPEZOID_ACCEL = 0.25
+
+# Codes of the ``profile`` field in packed records (0 = default profile)
+PROFILE_CODES = (None,) + PROFILES
+
+RECORD_DTYPES: Dict[str, np.dtype] = {
+    "sequential": np.dtype([("joint", "u1"), ("angle", "<i2"), ("duration_ms", "<u4"), ("profile", "u1")]),
+    "parallel": np.dtype([(j, "<i2") for j in JOINTS] + [("duration_ms", "<u4"), ("profile", "u1")]),
+}
+
+
+class PackedItems(Sequence):
+    """Read-only program items backed by a structured record array."""
+
+    __slots__ = ("kind", "records")
+
+    def __init__(self, kind: str, records: np.ndarray) -> None:
+        self.kind = kind
+        self.records = records
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __getitem__(self, k: Union[int, slice]):  # type: ignore[override]
+        if isinstance(k, slice):
+            return PackedItems(self.kind, self.records[k])
+        return self._item(self.records[k].tolist())
+
+    def __iter__(self) -> Iterator[dict]:
+        return map(self._item, self.records.tolist())
+
+    def _item(self, row: tuple) -> dict:
+        if self.kind == "sequential":
+            joint, angle, duration, profile = row
+            return {"joint": JOINTS[joint], "angle": angle, "duration_ms": duration, "profile": PROFILE_CODES[profile]}
+        *angles, duration, profile = row
+        return {**dict(zip(JOINTS, angles)), "duration_ms": duration, "profile": PROFILE_CODES[profile]}
+
+    def to_list(self) -> List[dict]:
+        return list(self)
+
+    @property
+    def durations(self) -> np.ndarray:
+        return self.records["duration_ms"]
+
+    def profiles(self, default: str) -> List[str]:
+        names = [p or default for p in PROFILE_CODES]
+        return [names[p] for p in self.records["profile"].tolist()]
+
+    def targets(self, start: np.ndarray) -> np.ndarray:
+        """Joint angles after each item, starting from ``start`` (``(n, joints)``)."""
+        n = len(self.records)
+        if self.kind == "parallel":
+            return np.stack([self.records[j] for j in JOINTS], axis=1)
+        out = np.empty((n, len(JOINTS)), dtype=np.int16)
+        steps = np.arange(n)
+        angles = self.records["angle"]
+        for j in range(len(JOINTS)):
+            # último paso que movió la articulación j (arrastrado hacia delante)
+            last = np.maximum.accumulate(np.where(self.records["joint"] == j, steps, -1))
+            out[:, j] = np.where(last >= 0, angles[np.maximum(last, 0)], start[j])
+        return out
+
+
+@lru_cache(maxsize=512)
+def profile_curve(profile: str, n: int) -> np.ndarray:
+    """Normalized position (0..1] at frames ``1..n`` for a velocity profile."""
+    t = np.arange(1, n + 1, dtype=np.float64) / n
+    if profile == "linear":
+        curve = t
+    elif profile == "trapezoidal":
+        ta = TRAPEZOID_ACCEL
+        v = 1.0 / (1.0 - ta)
+        curve = np.where(
+            t < ta,
+            0.5 * v / ta * t * t,
+            np.where(t <= 1.0 - ta, 0.5 * v * ta + v * (t - ta), 1.0 - 0.5 * v / ta * (1.0 - t) ** 2),
+        )
+    elif profile == "s_curve":
+        # minimum-jerk polynomial: zero velocity and acceleration at both ends
+        curve = t * t * t * (10.0 + t * (-15.0 + 6.0 * t))
+    else:
+        raise ValueError(f"Perfil desconocido: {profile}")
+    curve.setflags(write=False)
+    return curve
+
+
+class Trajectory:
+    """Compiled program: keyframe table plus per-segment offsets.
+
+    - ``frames[f]``: joint angles shown at frame ``f`` (row order = ``JOINTS``)
+    - ``offsets[k]:offsets[k+1]``: frame range of item ``k`` (may be empty
+      for instantaneous items)
+    - ``keyframes[k]``: joint angles before item ``k``; ``keyframes[-1]`` is
+      the final state
+    """
+
+    __slots__ = ("kind", "items", "interval_ms", "frames", "offsets", "keyframes", "frame_segment")
+
+    def __init__(self, kind: str, items: Sequence[dict], interval_ms: float, frames: np.ndarray,
+                 offsets: np.ndarray, keyframes: np.ndarray) -> None:
+        self.kind = kind
+        self.items = items
+        self.interval_ms = interval_ms
+        self.frames = frames
+        self.offsets = offsets
+        self.keyframes = keyframes
+        self.frame_segment = np.repeat(
+            np.arange(len(items), dtype=np.int32), np.diff(offsets)
+        )
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    @property
+    def total_frames(self) -> int:
+        return int(self.offsets[-1])
+
+    @property
+    def duration_ms(self) -> float:
+        return self.total_frames * self.interval_ms
+
+    def segment(self, k: int) -> np.ndarray:
+        return self.frames[self.offsets[k]:self.offsets[k + 1]]
+
+    def state_before(self, k: int) -> Dict[str, int]:
+        return dict(zip(JOINTS, self.keyframes[k].tolist()))
+
+    def final_state(self) -> Dict[str, int]:
+        return self.state_before(len(self.items))
+
+    def locate(self, t_ms: float) -> Tuple[int, int]:
+        """(segment, frame within segment) playing at ``t_ms`` from the start."""
+        if not self.total_frames:
+            return len(self.items), 0
+        f = min(max(int(t_ms // self.interval_ms), 0), self.total_frames - 1)
+        k = int(self.frame_segment[f])
+        return k, f - int(self.offsets[k])
+
+    def state_at(self, t_ms: float) -> Dict[str, int]:
+        if t_ms >= self.duration_ms:
+            return self.final_state()
+        k, i = self.locate(t_ms)
+        return dict(zip(JOINTS, self.segment(k)[i].tolist()))
+
+
+def item_targets(kind: str, item: Mapping, current: np.ndarray) -> np.ndarray:
+    target = current.copy()
+    if kind == "sequential":
+        target[JOINTS.index(item["joint"])] = item["angle"]
+    else:
+        for j, joint in enumerate(JOINTS):
+            if joint in item:
+                target[j] = item[joint]
+    return target
+
+
+def compile_program(kind: str, items: Sequence[Mapping], start_state: Mapping[str, int],
+                    interval_ms: float, default_profile: str = "linear") -> Trajectory:
+    """Compile ``items`` starting at ``start_state`` into a ``Trajectory``.
+
+    Frame counts match the clock (``max(1, duration // interval)``). As in
+    the original loops, sequential moves whose target equals the current
+    angle, and items with ``duration_ms <= 0``, produce no frames.
+    """
+    if kind not in ("sequential", "parallel"):
+        raise ValueError(f"Tipo de programa desconocido: {kind}")
+    n_items = len(items)
+    keyframes = np.empty((n_items + 1, len(JOINTS)), dtype=np.int16)
+    keyframes[0] = [int(start_state.get(j, 0)) for j in JOINTS]
+    if isinstance(items, PackedItems):
+        if items.kind != kind:
+            raise ValueError(f"Elementos {items.kind} en un programa {kind}")
+        keyframes[1:] = items.targets(keyframes[0])
+        durations = items.durations.astype(np.int64)
+        moving = durations > 0
+        if kind == "sequential":
+            moving &= (keyframes[1:] != keyframes[:-1]).any(axis=1)
+        counts = np.where(moving, np.maximum(1, (durations / interval_ms).astype(np.int64)), 0)
+        profiles = items.profiles(default_profile)
+    else:
+        counts = np.zeros(n_items, dtype=np.int64)
+        for k, item in enumerate(items):
+            keyframes[k + 1] = item_targets(kind, item, keyframes[k])
+            duration = item.get("duration_ms", 1000)
+            if duration <= 0 or (kind == "sequential" and (keyframes[k + 1] == keyframes[k]).all()):
+                continue
+            counts[k] = max(1, int(duration / interval_ms))
+        profiles = [item.get("profile") or default_profile for item in items]
+        items = [dict(i) for i in items]
+    offsets = np.zeros(n_items + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    frames = np.empty((int(offsets[-1]), len(JOINTS)), dtype=np.int16)
+    start = keyframes[:-1].astype(np.float64)
+    delta = keyframes[1:].astype(np.float64) - start
+    for k in np.flatnonzero(counts):
+        curve = profile_curve(profiles[k], int(counts[k]))
+        frames[offsets[k]:offsets[k + 1]] = np.rint(start[k] + delta[k] * curve[:, None])
+    return Trajectory(kind, items, interval_ms, frames, offsets, keyframes)
+
@@ -1,49 +1,86 @@
 """Robot state & queue endpoints (sequential & parallel).
 
-Ahora también persiste el estado en Firebase (si está inicializado) en la ruta:
+Las rutas por robot se sirven en /robot (robot "default") y en
+/robots/{robot_id}; el estado y las colas viven en ``app.motion.robot``.
+
+Ahora también persiste el estado en el almacenamiento configurado
+(``app.core.storage``); con Firebase las rutas son:
 Realtime DB: /robotica/{base,hombro,codo}
 Firestore:   collection "robotica" -> documento "state" con campos base,hombro,codo
+(otros robots: /robotica/robot_{id} y documento "robot_{id}").
 """
 from __future__ import annotations
-from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
 import asyncio
+import json
 import time
+import zlib
 from pydantic import BaseModel, Field
-from typing import List
+from typing import Dict, List, Literal, Optional, Tuple, Union
 from .auth import get_current_admin
 from app.websocket.manager import manager
-from app.core.config import Settings
-import json
-import firebase_admin  # type: ignore
-from firebase_admin import db as firebase_rtdb, firestore as firebase_fs  # type: ignore
-
-settings = Settings()
+from app.core.bus import bus
+from app.core.config import get_settings
+from app.core.metrics import metrics
+from app.core.program_cache import program_cache, program_index, summarize
+from app.core.storage import Storage, StorageError, StorageTimeout
+from app.core.persistence import persister
+from app.motion.clock import motion_clock
+from app.motion.queue import MotionQueue, QueueFull
+from app.motion.robot import DEFAULT_ROBOT_ID, Robot, registry
+from app.motion.kinematics import forward_state, ik_solver
+from app.motion.optimize import optimize_program
+from app.motion.recorder import TrajectoryRecorder, stream_csv, stream_raw
+from app.motion.simulate import simulate_batch
+from app.motion.trajectory import DURATION_LIMITS, JOINTS
+
+settings = get_settings()
 router = APIRouter(prefix="/robot", tags=["robot"])
-
-# In-memory storage (replace with Firebase persistence as needed)
-robot_state = {"base": 0, "hombro": 0, "codo": 0}
-sequential_queue: List[dict] = []  # each item: {joint: str, angle: int, duration_ms: int}
-parallel_queue: List[dict] = []    # each item: {base: int, hombro: int, codo: int, duration_ms: int}
-_simulation_lock = asyncio.Lock()
-_simulation_running = False
-_simulation_mode: str | None = None
+# Rutas por robot: se montan en /robot (robot "default" o ?robot_id=) y en /robots/{robot_id}
+robot_routes = APIRouter()
+robots_router = APIRouter(prefix="/robots", tags=["robots"])
 
 class State(BaseModel):
     base: int = Field(ge=0, le=180)
     hombro: int = Field(ge=0, le=180)
     codo: int = Field(ge=0, le=180)
 
+MotionProfile = Literal["linear", "trapezoidal", "s_curve"]
+
 class SequentialItem(BaseModel):
     joint: str
     angle: int = Field(ge=0, le=180)
-    duration_ms: int = Field(default=1000, ge=50, le=60000)
+    duration_ms: int = Field(default=1000, ge=DURATION_LIMITS[0], le=DURATION_LIMITS[1])
+    profile: Optional[MotionProfile] = None  # None -> settings.MOTION_PROFILE
 
 
 class ParallelItem(State):
-    duration_ms: int = Field(default=1000, ge=50, le=60000)
+    duration_ms: int = Field(default=1000, ge=DURATION_LIMITS[0], le=DURATION_LIMITS[1])
+    profile: Optional[MotionProfile] = None
+
+class CartesianTarget(BaseModel):
+    # coordenadas de la escena de Robot3D (Y hacia arriba, origen en la base)
+    x: float
+    y: float
+    z: float
+
+class CartesianItem(CartesianTarget):
+    duration_ms: int = Field(default=1000, ge=DURATION_LIMITS[0], le=DURATION_LIMITS[1])
+    profile: Optional[MotionProfile] = None
 
 AdminDep = Depends(get_current_admin)
 
+async def get_robot(robot_id: str = DEFAULT_ROBOT_ID) -> Robot:
+    robot = registry.get(robot_id)
+    if robot is None:
+        raise HTTPException(404, detail=f"Robot no encontrado: {robot_id}")
+    return robot
+
+RobotDep = Depends(get_robot)
+# Prioridad de una ejecución: una mayor interrumpe la que está en curso
+PriorityQuery = Query(0, ge=0, le=100)
+
 class SequentialProgram(BaseModel):
     name: str
     items: List[SequentialItem]
@@ -54,308 +91,529 @@ class ParallelProgram(BaseModel):
     items: List[ParallelItem]
     created_at: float = Field(default_factory=lambda: __import__('time').time())
 
+class InlineProgram(BaseModel):
+    type: Literal["sequential", "parallel"]
+    items: Union[List[SequentialItem], List[ParallelItem]]
+    name: Optional[str] = None
+
+class SimulationBatch(BaseModel):
+    program_ids: List[str] = []
+    programs: List[InlineProgram] = []
+
+
+# --- Programas guardados (inmutables) ---
+def _get_storage(request: Request) -> Storage:
+    storage = getattr(request.app.state, "storage", None)
+    if not storage:
+        raise HTTPException(503, "Almacenamiento no disponible")
+    return storage
+
+def _storage_http_error(action: str, e: StorageError) -> HTTPException:
+    status = 504 if isinstance(e, StorageTimeout) else 500
+    return HTTPException(status, f"Error {action}: {e}")
+
+async def _save_program(storage: Storage, doc_id: str, data: dict) -> None:
+    """Escribe programa + resumen y actualiza caché e índice."""
+    summary = summarize(doc_id, data)
+    try:
+        await storage.save_program(doc_id, data, summary)
+    except StorageError as e:
+        raise _storage_http_error("guardando programa", e)
+    program_cache.put(doc_id, data)
+    program_index.add(summary)
+    bus.publish({"kind": "program", "summary": summary})
+
+def on_program_saved(message: dict) -> None:
+    """Índice de programas: añade el resumen de un programa guardado en otro worker."""
+    summary = message.get("summary")
+    if isinstance(summary, dict) and isinstance(summary.get("id"), str):
+        program_index.add(summary)
+
+def _optimize_on_save(kind: str, data: dict, response: Response) -> dict:
+    """Optimiza sin estado inicial (mismo tipo de programa); informa en cabeceras."""
+    try:
+        optimized = optimize_program(kind, data["items"], None, motion_clock.interval_ms)
+    except (ValueError, KeyError) as e:
+        raise HTTPException(422, f"Programa inválido: {e}")
+    response.headers["X-Optimizer-Removed-Items"] = str(len(data["items"]) - len(optimized.items))
+    response.headers["X-Optimizer-Saved-Ms"] = str(optimized.report["saved_ms"])
+    return {**data, "items": optimized.items}
 
-# --- Programas guardados en Firebase (inmutables) ---
 @router.post("/programs/sequential", response_model=SequentialProgram)
-async def save_sequential_program(program: SequentialProgram, request: Request, _admin: str = AdminDep):
-    """Guarda un programa secuencial en Firebase."""
-    db = getattr(request.app.state, "db", None)
-    if not db:
-        raise HTTPException(503, "Firestore no disponible")
+async def save_sequential_program(program: SequentialProgram, request: Request, response: Response,
+                                  optimize: bool = False, _admin: str = AdminDep):
+    """Guarda un programa secuencial (``?optimize=true``: sin pasos nulos y con pasos fusionados)."""
+    storage = _get_storage(request)
     doc_id = f"seq_{int(program.created_at)}_{program.name}"
-    try:
-        db.collection("programas").document(doc_id).set({
-            **program.dict(),
-            "type": "sequential"
-        })
-    except Exception as e:
-        raise HTTPException(500, f"Error guardando programa: {e}")
-    return program
+    data = program.dict()
+    if optimize:
+        data = _optimize_on_save("sequential", data, response)
+    await _save_program(storage, doc_id, {**data, "type": "sequential"})
+    return data
 
 @router.post("/programs/parallel", response_model=ParallelProgram)
-async def save_parallel_program(program: ParallelProgram, request: Request, _admin: str = AdminDep):
-    """Guarda un programa paralelo en Firebase."""
-    db = getattr(request.app.state, "db", None)
-    if not db:
-        raise HTTPException(503, "Firestore no disponible")
+async def save_parallel_program(program: ParallelProgram, request: Request, response: Response,
+                                optimize: bool = False, _admin: str = AdminDep):
+    """Guarda un programa paralelo (``?optimize=true``: sin bloques que no mueven nada)."""
+    storage = _get_storage(request)
     doc_id = f"par_{int(program.created_at)}_{program.name}"
-    try:
-        db.collection("programas").document(doc_id).set({
-            **program.dict(),
-            "type": "parallel"
-        })
-    except Exception as e:
-        raise HTTPException(500, f"Error guardando programa: {e}")
-    return program
+    data = program.dict()
+    if optimize:
+        data = _optimize_on_save("parallel", data, response)
+    await _save_program(storage, doc_id, {**data, "type": "parallel"})
+    return data
 
 @router.get("/programs/list")
-async def list_programs(request: Request):
-    """Lista todos los programas guardados."""
-    db = getattr(request.app.state, "db", None)
-    if not db:
-        raise HTTPException(503, "Firestore no disponible")
-    docs = db.collection("programas").stream()
-    programs = []
-    for doc in docs:
-        data = doc.to_dict()
-        programs.append({
-            "id": doc.id,
-            "name": data.get("name"),
-            "type": data.get("type"),
-            "created_at": data.get("created_at"),
-            "items_count": len(data.get("items", []))
-        })
+async def list_programs(request: Request, response: Response,
+                        offset: int = Query(0, ge=0), limit: Optional[int] = Query(None, ge=1, le=1000)):
+    """Lista los programas guardados (desde el índice de resúmenes).
+
+    Sin ``limit`` se devuelven todos, como antes; con ``offset``/``limit``
+    se pagina. El total se devuelve en la cabecera ``X-Total-Count``.
+    """
+    storage = _get_storage(request)
+    if not program_index.loaded:
+        try:
+            program_index.load(await storage.load_index())
+        except StorageError as e:
+            raise _storage_http_error("cargando índice de programas", e)
+    programs, total = program_index.page(offset, limit)
+    response.headers["X-Total-Count"] = str(total)
     return programs
 
-@router.post("/programs/{program_id}/execute")
-async def execute_program(program_id: str, request: Request, _admin: str = AdminDep):
-    """Ejecuta un programa guardado sin borrarlo."""
-    db = getattr(request.app.state, "db", None)
-    if not db:
-        raise HTTPException(503, "Firestore no disponible")
+async def _load_program(storage: Storage, program_id: str) -> Optional[dict]:
+    # Programas inmutables: primero la caché, luego el almacenamiento
+    data = program_cache.get(program_id)
+    if data is None:
+        try:
+            data = await storage.get_program(program_id)
+        except StorageError as e:
+            raise _storage_http_error("obteniendo programa", e)
+        if data is not None:
+            program_cache.put(program_id, data)
+    return data
+
+@robot_routes.post("/programs/simulate/batch")
+async def simulate_programs(batch: SimulationBatch, request: Request, robot: Robot = RobotDep,
+                            _admin: str = AdminDep):
+    """Dry-run de muchos programas (guardados o en línea) desde el estado actual del robot."""
+    total = len(batch.program_ids) + len(batch.programs)
+    if total > settings.SIM_BATCH_MAX:
+        raise HTTPException(413, detail=f"Máximo {settings.SIM_BATCH_MAX} programas por lote")
+    loaded = []
+    if batch.program_ids:
+        storage = _get_storage(request)
+        loaded = await asyncio.gather(*(_load_program(storage, pid) for pid in batch.program_ids))
+    programs = [p for p in loaded if p is not None] + [p.dict() for p in batch.programs]
+    results = iter(await simulate_batch(programs, robot.state, motion_clock.interval_ms))
+    out = []
+    for pid, data in zip(batch.program_ids, loaded):
+        out.append({"program_id": pid, "error": "Programa no encontrado"} if data is None
+                   else {"program_id": pid, "name": data.get("name"), **next(results)})
+    for program in batch.programs:
+        out.append({"name": program.name, **next(results)})
+    return {"robot": robot.id, "start_state": dict(robot.state), "results": out}
+
+@robot_routes.post("/programs/{program_id}/simulate")
+async def simulate_saved_program(program_id: str, request: Request, robot: Robot = RobotDep,
+                                 _admin: str = AdminDep):
+    """Dry-run headless: estado final, duración, recorrido y violaciones, sin mover el robot."""
+    data = await _load_program(_get_storage(request), program_id)
+    if data is None:
+        raise HTTPException(404, "Programa no encontrado")
+    [result] = await simulate_batch([data], robot.state, motion_clock.interval_ms)
+    return {"program_id": program_id, "name": data.get("name"), "robot": robot.id, **result}
+
+@robot_routes.post("/programs/{program_id}/execute")
+async def execute_program(program_id: str, request: Request, robot: Robot = RobotDep,
+                          optimize: bool = False, priority: int = PriorityQuery, _admin: str = AdminDep):
+    """Ejecuta un programa guardado sin borrarlo.
+
+    Con ``?optimize=true`` se ejecuta la versión optimizada desde el estado
+    actual (pasos independientes en paralelo); el programa guardado no cambia.
+    Con una ``priority`` mayor que la de la ejecución en curso, la interrumpe.
+    """
+    storage = _get_storage(request)
     
-    global _simulation_running, _simulation_mode
-    if _simulation_running:
+    if not robot.scheduler.can_start(priority):
         raise HTTPException(409, detail="Simulación en curso")
     
-    # Obtener el programa de Firebase
-    try:
-        doc = db.collection("programas").document(program_id).get()
-        if not doc.exists:
-            raise HTTPException(404, "Programa no encontrado")
-        data = doc.to_dict()
-    except Exception as e:
-        raise HTTPException(500, f"Error obteniendo programa: {e}")
-    
+    data = await _load_program(storage, program_id)
+    if data is None:
+        raise HTTPException(404, "Programa no encontrado")
     program_type = data.get("type")
     items = data.get("items", [])
     
     if not items:
         return {"detail": "Programa vacío", "executed": []}
-    
-    _simulation_running = True
-    _simulation_mode = f"{program_type}_program"
+    report = None
+    try:
+        kind = program_type
+        if optimize:
+            kind, items, report = optimize_program(program_type, items, robot.state,
+                                                   motion_clock.interval_ms, parallelize=True)
+        traj = robot.compile(kind, items)
+    except (ValueError, KeyError) as e:
+        raise HTTPException(422, f"Programa inválido: {e}")
     
     async def runner():
-        executed = []
-        try:
-            if program_type == "sequential":
-                for item in items:
-                    await _animate_sequential_step(item)
-                    executed.append(item)
-            elif program_type == "parallel":
-                for item in items:
-                    await _animate_parallel_block(item)
-                    executed.append(item)
-            await _broadcast_event("STATE_UPDATE", robot_state)
-            await _broadcast_event("PROGRAM_COMPLETED", {
-                "program_id": program_id,
-                "name": data.get("name"),
-                "type": program_type
-            })
-        finally:
-            _end_simulation()
+        await robot.play_program(traj)
+        await robot.broadcast("STATE_UPDATE", robot.state)
+        await robot.broadcast("PROGRAM_COMPLETED", {
+            "program_id": program_id,
+            "name": data.get("name"),
+            "type": program_type
+        })
     
-    asyncio.create_task(runner())
+    run = await robot.run(f"{program_type}_program", runner(), priority)
+    if run is None:
+        raise HTTPException(409, detail="Simulación en curso")
     return {
         "detail": f"Ejecutando programa {data.get('name')} ({program_type})",
         "program_id": program_id,
-        "items_count": len(items)
+        "robot": robot.id,
+        "run_id": run.id,
+        "items_count": len(items),
+        "duration_ms": traj.duration_ms,
+        **({"optimization": report} if report is not None else {}),
     }
 
 
 
-@router.get("/state", response_model=State)
-async def get_state():
-    return State(**robot_state)
+STATE_RESPONSES = metrics.counter("state_responses_total", "GET /state and /status responses by result")
 
-@router.post("/state", response_model=State)
-async def set_state(new_state: State, request: Request, _admin: str = AdminDep):
-    robot_state.update(new_state.dict())
-    await _broadcast_event("STATE_UPDATE", robot_state)
-    await _persist_state(request)
+def _not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return "*" in tags or etag in tags
+
+@robot_routes.get("/state", response_model=State)
+async def get_state(request: Request, robot: Robot = RobotDep, since: Optional[int] = None,
+                    timeout: float = Query(25.0, ge=0, le=60)):
+    """Estado actual con ETag (304 si no cambió).
+
+    Long-poll: con ``?since=<X-State-Version>`` espera hasta el siguiente
+    cambio (máx. ``timeout`` s; 304 si no hubo ninguno).
+    """
+    changed = since is None or await robot.wait_state(since, timeout)
+    body, etag = robot.state_body()
+    headers = {"ETag": etag, "X-State-Version": str(robot.state_version), "Cache-Control": "no-cache"}
+    if not changed or _not_modified(request, etag):
+        STATE_RESPONSES.inc(endpoint="state", result="timeout" if not changed else "not_modified")
+        return Response(status_code=304, headers=headers)
+    STATE_RESPONSES.inc(endpoint="state", result="ok")
+    return Response(body, media_type="application/json", headers=headers)
+
+async def apply_state(robot: Robot, new_state: State) -> None:
+    robot.state.update(new_state.dict())
+    await robot.broadcast("STATE_UPDATE", robot.state)
+    robot.persist(flush=True)
+
+@robot_routes.post("/state", response_model=State)
+async def set_state(new_state: State, robot: Robot = RobotDep, _admin: str = AdminDep):
+    await apply_state(robot, new_state)
     return new_state
 
+# Bulk enqueue helpers
+def enqueue_all(queue: MotionQueue, items: List[dict]) -> None:
+    try:
+        queue.extend(items)
+    except QueueFull as e:
+        raise HTTPException(413, detail=str(e))
+
+def _check_joint(item: SequentialItem) -> None:
+    if item.joint not in JOINTS:
+        raise HTTPException(400, detail=f"Joint inválido: {item.joint}")
+
+async def _read_ndjson(request: Request, model, queue: MotionQueue) -> List[dict]:
+    """Valida un cuerpo NDJSON (un item por línea) a medida que llega."""
+    items: List[dict] = []
+    lineno = 0
+
+    def parse(line: bytes) -> None:
+        nonlocal lineno
+        lineno += 1
+        if not line.strip():
+            return
+        try:
+            item = model(**json.loads(line))
+        except (ValueError, TypeError) as e:
+            raise HTTPException(422, detail=f"Línea {lineno}: {e}")
+        if model is SequentialItem:
+            _check_joint(item)
+        items.append(item.dict())
+        if len(items) > queue.free:
+            raise HTTPException(413, detail=f"Cola llena (máx. {queue.max_items})")
+
+    buf = b""
+    async for chunk in request.stream():
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            parse(line)
+    parse(buf)
+    return items
+
+def parse_items(mode: str, raw_items: List[dict]) -> List[dict]:
+    """Validate raw items (e.g. from the WebSocket) with the HTTP models; 422 on error."""
+    model = SequentialItem if mode == "sequential" else ParallelItem
+    items = []
+    for i, raw in enumerate(raw_items):
+        try:
+            item = model(**raw)
+        except (ValueError, TypeError) as e:
+            raise HTTPException(422, detail=f"Elemento {i}: {e}")
+        if model is SequentialItem:
+            _check_joint(item)
+        items.append(item.dict())
+    return items
+
+def robot_queue(robot: Robot, mode: str) -> MotionQueue:
+    if mode == "sequential":
+        return robot.sequential_queue
+    if mode == "parallel":
+        return robot.parallel_queue
+    raise HTTPException(422, detail=f"Modo desconocido: {mode}")
+
+async def start_queue(robot: Robot, mode: str, priority: int = 0) -> dict:
+    queue = robot_queue(robot, mode)
+    if not robot.scheduler.can_start(priority):
+        raise HTTPException(409, detail="Simulación en curso")
+    if not queue:
+        return {"executed": [], "state": robot.state}
+    job = robot.drain_sequential() if mode == "sequential" else robot.drain_parallel()
+    run = await robot.run(mode, job, priority)
+    if run is None:
+        raise HTTPException(409, detail="Simulación en curso")
+    return {"detail": f"Simulación {'secuencial' if mode == 'sequential' else 'paralela'} iniciada",
+            "run_id": run.id}
+
+def _page_queue(queue: MotionQueue, response: Response, offset: int, limit: int) -> List[dict]:
+    response.headers["X-Total-Count"] = str(len(queue))
+    return queue.page(offset, limit)
+
 # Sequential
-@router.post("/sequential/enqueue")
-async def enqueue_seq(item: SequentialItem, _admin: str = AdminDep):
-    if item.joint not in robot_state:
-        raise HTTPException(400, detail="Joint inválido")
-    sequential_queue.append(item.dict())
+@robot_routes.post("/sequential/enqueue")
+async def enqueue_seq(item: SequentialItem, robot: Robot = RobotDep, _admin: str = AdminDep):
+    _check_joint(item)
+    enqueue_all(robot.sequential_queue, [item.dict()])
     return {"queued": item}
 
-@router.get("/sequential/list")
-async def list_seq():
-    return sequential_queue
-
-@router.post("/sequential/reset")
-async def reset_seq(_admin: str = AdminDep):
-    sequential_queue.clear()
+@robot_routes.post("/sequential/enqueue/batch")
+async def enqueue_seq_batch(items: List[SequentialItem], robot: Robot = RobotDep, _admin: str = AdminDep):
+    """Encola muchos pasos en una sola llamada (todo o nada)."""
+    for item in items:
+        _check_joint(item)
+    enqueue_all(robot.sequential_queue, [item.dict() for item in items])
+    return {"queued": len(items), "queue_len": len(robot.sequential_queue)}
+
+@robot_routes.post("/sequential/enqueue/stream")
+async def enqueue_seq_stream(request: Request, robot: Robot = RobotDep, _admin: str = AdminDep):
+    """Encola pasos enviados como NDJSON (``application/x-ndjson``), todo o nada."""
+    items = await _read_ndjson(request, SequentialItem, robot.sequential_queue)
+    enqueue_all(robot.sequential_queue, items)
+    return {"queued": len(items), "queue_len": len(robot.sequential_queue)}
+
+@robot_routes.get("/sequential/list")
+async def list_seq(response: Response, robot: Robot = RobotDep,
+                   offset: int = Query(0, ge=0), limit: int = Query(1000, ge=1, le=10000)):
+    return _page_queue(robot.sequential_queue, response, offset, limit)
+
+@robot_routes.post("/sequential/reset")
+async def reset_seq(robot: Robot = RobotDep, _admin: str = AdminDep):
+    robot.sequential_queue.clear()
     return {"detail": "cola secuencial vacía"}
 
-@router.post("/sequential/start")
-async def start_seq(_admin: str = AdminDep):
-    global _simulation_running, _simulation_mode
-    if _simulation_running:
-        raise HTTPException(409, detail="Simulación en curso")
-    if not sequential_queue:
-        return {"executed": [], "state": robot_state}
-    _simulation_running = True
-    _simulation_mode = "sequential"
-    async def runner():
-        ran = []
-        try:
-            while sequential_queue:
-                step = sequential_queue.pop(0)
-                await _animate_sequential_step(step)
-                ran.append(step)
-            await _broadcast_event("STATE_UPDATE", robot_state)
-        finally:
-            nonlocal_ran[:] = ran  # store result
-            _end_simulation()
-    nonlocal_ran: List[dict] = []
-    asyncio.create_task(runner())
-    return {"detail": "Simulación secuencial iniciada"}
+@robot_routes.post("/sequential/start")
+async def start_seq(robot: Robot = RobotDep, priority: int = PriorityQuery, _admin: str = AdminDep):
+    return await start_queue(robot, "sequential", priority)
+
+# Kinematics
+def _position(state: dict) -> dict:
+    x, y, z = forward_state(state)
+    return {"x": round(x, 4), "y": round(y, 4), "z": round(z, 4)}
+
+def _solve_chain(targets: List[CartesianItem], start: dict) -> List[dict]:
+    """IK de cada objetivo partiendo del anterior (elige la solución más cercana)."""
+    items = []
+    current = start
+    for i, target in enumerate(targets):
+        solution = ik_solver.solve(target.x, target.y, target.z, current)
+        if solution is None:
+            raise HTTPException(422, detail=f"Objetivo {i} fuera del espacio de trabajo: ({target.x}, {target.y}, {target.z})")
+        current = solution.state()
+        items.append({**current, "duration_ms": target.duration_ms, "profile": target.profile})
+    return items
+
+@robot_routes.get("/kinematics/position")
+async def effector_position(robot: Robot = RobotDep):
+    """Posición del efector final para el estado actual."""
+    return {"state": robot.state, "position": _position(robot.state)}
+
+@robot_routes.post("/kinematics/fk")
+async def forward_kinematics(state: State):
+    return _position(state.dict())
+
+@robot_routes.post("/kinematics/ik")
+async def inverse_kinematics(target: CartesianTarget, robot: Robot = RobotDep):
+    solution = ik_solver.solve(target.x, target.y, target.z, robot.state)
+    if solution is None:
+        raise HTTPException(422, detail="Objetivo fuera del espacio de trabajo")
+    return {"state": solution.state(), "error": solution.error, "position": _position(solution.state())}
+
+@robot_routes.post("/parallel/enqueue/cartesian")
+async def enqueue_cartesian(targets: List[CartesianItem], robot: Robot = RobotDep, _admin: str = AdminDep):
+    """Encola objetivos cartesianos como bloques paralelos (IK al encolar, todo o nada)."""
+    start = robot.parallel_queue.last() or robot.state
+    items = _solve_chain(targets, start)
+    enqueue_all(robot.parallel_queue, items)
+    return {"queued": items, "queue_len": len(robot.parallel_queue)}
 
 # Parallel
-@router.post("/parallel/enqueue")
-async def enqueue_parallel(item: ParallelItem, _admin: str = AdminDep):
-    parallel_queue.append(item.dict())
+@robot_routes.post("/parallel/enqueue")
+async def enqueue_parallel(item: ParallelItem, robot: Robot = RobotDep, _admin: str = AdminDep):
+    enqueue_all(robot.parallel_queue, [item.dict()])
     return {"queued": item}
 
-@router.get("/parallel/list")
-async def list_parallel():
-    return parallel_queue
-
-@router.post("/parallel/reset")
-async def reset_parallel(_admin: str = AdminDep):
-    parallel_queue.clear()
+@robot_routes.post("/parallel/enqueue/batch")
+async def enqueue_parallel_batch(items: List[ParallelItem], robot: Robot = RobotDep, _admin: str = AdminDep):
+    """Encola muchos bloques en una sola llamada (todo o nada)."""
+    enqueue_all(robot.parallel_queue, [item.dict() for item in items])
+    return {"queued": len(items), "queue_len": len(robot.parallel_queue)}
+
+@robot_routes.post("/parallel/enqueue/stream")
+async def enqueue_parallel_stream(request: Request, robot: Robot = RobotDep, _admin: str = AdminDep):
+    """Encola bloques enviados como NDJSON (``application/x-ndjson``), todo o nada."""
+    items = await _read_ndjson(request, ParallelItem, robot.parallel_queue)
+    enqueue_all(robot.parallel_queue, items)
+    return {"queued": len(items), "queue_len": len(robot.parallel_queue)}
+
+@robot_routes.get("/parallel/list")
+async def list_parallel(response: Response, robot: Robot = RobotDep,
+                        offset: int = Query(0, ge=0), limit: int = Query(1000, ge=1, le=10000)):
+    return _page_queue(robot.parallel_queue, response, offset, limit)
+
+@robot_routes.post("/parallel/reset")
+async def reset_parallel(robot: Robot = RobotDep, _admin: str = AdminDep):
+    robot.parallel_queue.clear()
     return {"detail": "cola paralela vacía"}
 
-@router.post("/parallel/start")
-async def start_parallel(_admin: str = AdminDep):
-    global _simulation_running, _simulation_mode
-    if _simulation_running:
-        raise HTTPException(409, detail="Simulación en curso")
-    if not parallel_queue:
-        return {"executed": [], "state": robot_state}
-    _simulation_running = True
-    _simulation_mode = "parallel"
-    async def runner():
-        ran = []
-        try:
-            while parallel_queue:
-                block = parallel_queue.pop(0)
-                await _animate_parallel_block(block)
-                ran.append(block)
-            await _broadcast_event("STATE_UPDATE", robot_state)
-        finally:
-            _end_simulation()
-    asyncio.create_task(runner())
-    return {"detail": "Simulación paralela iniciada"}
-
-# ----- Simulation helpers -----
-
-def _end_simulation():
-    global _simulation_running, _simulation_mode
-    _simulation_running = False
-    _simulation_mode = None
-
-async def _animate_sequential_step(step: dict):
-    joint = step['joint']
-    target = step['angle']
-    duration = step.get('duration_ms', 1000)
-    start_angle = robot_state[joint]
-    await _broadcast_event("MOVE_SEQ_START", step)
-    if duration <= 0 or target == start_angle:
-        robot_state[joint] = target
-        await _broadcast_event("STATE_UPDATE", robot_state)
-        await _broadcast_event("MOVE_SEQ_END", step)
-        return
-    interval = 0.05  # 50 ms
-    steps = max(1, int(duration / (interval * 1000)))
-    for i in range(1, steps + 1):
-        factor = i / steps
-        robot_state[joint] = round(start_angle + (target - start_angle) * factor)
-        await _broadcast_event("STATE_UPDATE", robot_state)
-        _persist_state_light()  # persist cada frame (ver notas de rendimiento)
-        await asyncio.sleep(interval)
-    await _broadcast_event("MOVE_SEQ_END", step)
-
-async def _animate_parallel_block(block: dict):
-    duration = block.get('duration_ms', 1000)
-    start_state = robot_state.copy()
-    targets = {k: block[k] for k in ['base','hombro','codo'] if k in block}
-    await _broadcast_event("MOVE_PAR_START", block)
-    if duration <= 0:
-        robot_state.update(targets)
-        await _broadcast_event("STATE_UPDATE", robot_state)
-        await _broadcast_event("MOVE_PAR_END", block)
-        return
-    interval = 0.05
-    steps = max(1, int(duration / (interval * 1000)))
-    for i in range(1, steps + 1):
-        factor = i / steps
-        for joint, target in targets.items():
-            s = start_state[joint]
-            robot_state[joint] = round(s + (target - s) * factor)
-        await _broadcast_event("STATE_UPDATE", robot_state)
-        _persist_state_light()
-        await asyncio.sleep(interval)
-    await _broadcast_event("MOVE_PAR_END", block)
-
-@router.get("/status")
-async def simulation_status():
-    return {
-        "running": _simulation_running,
-        "mode": _simulation_mode,
-        "sequential_queue_len": len(sequential_queue),
-        "parallel_queue_len": len(parallel_queue),
-        "state": robot_state,
-    }
-
-async def _broadcast_event(event_type: str, payload: dict):
-    message = json.dumps({"type": event_type, "payload": payload})
-    await manager.broadcast(message)
-
-
-# ---------------- Firebase persistence helpers -----------------
-async def _persist_state(request: Request) -> None:
-    """Persiste el estado actual del robot en Firebase (si está disponible).
-
-    - Realtime Database: /robotica/{base,hombro,codo}
-    - Firestore: collection("robotica").document("state")
-    Cualquier error se ignora silenciosamente para no romper el flujo.
+@robot_routes.post("/parallel/start")
+async def start_parallel(robot: Robot = RobotDep, priority: int = PriorityQuery, _admin: str = AdminDep):
+    return await start_queue(robot, "parallel", priority)
+
+# Control de la ejecución en curso
+@robot_routes.get("/run")
+async def get_run(robot: Robot = RobotDep):
+    """Ejecución en curso (id, prioridad, estado y progreso) o ``null``."""
+    return {"robot": robot.id, "run": robot.scheduler.info()}
+
+@robot_routes.post("/stop")
+async def stop_robot(robot: Robot = RobotDep, clear: bool = False, _admin: str = AdminDep):
+    """Detiene la ejecución en curso antes del siguiente frame; ``?clear=true`` vacía además las colas."""
+    run = await robot.scheduler.stop()
+    if clear:
+        robot.sequential_queue.clear()
+        robot.parallel_queue.clear()
+    if run is None and not clear:
+        raise HTTPException(409, detail="No hay ejecución en curso")
+    return {"detail": "Ejecución detenida", "robot": robot.id, "run": run}
+
+@robot_routes.post("/pause")
+async def pause_robot(robot: Robot = RobotDep, _admin: str = AdminDep):
+    run = await robot.scheduler.pause()
+    if run is None:
+        raise HTTPException(409, detail="No hay ejecución en curso")
+    return {"robot": robot.id, "run": run}
+
+@robot_routes.post("/resume")
+async def resume_robot(robot: Robot = RobotDep, _admin: str = AdminDep):
+    run = await robot.scheduler.resume()
+    if run is None:
+        raise HTTPException(409, detail="No hay ejecución en curso")
+    return {"robot": robot.id, "run": run}
+
+# /status por robot: (clave, instante, cuerpo, ETag)
+_status_cache: Dict[str, Tuple[tuple, float, bytes, str]] = {}
+
+def _status_body(robot: Robot) -> Tuple[bytes, str]:
+    """Cuerpo y ETag de /status, reconstruidos solo si cambió el robot o caducaron las estadísticas."""
+    key = (robot.state_version, robot.busy, robot.scheduler.info(),
+           len(robot.sequential_queue), len(robot.parallel_queue))
+    now = time.monotonic()
+    cached = _status_cache.get(robot.id)
+    if cached is not None and cached[0] == key and now - cached[1] < settings.STATUS_STATS_MAX_AGE_MS / 1000:
+        return cached[2], cached[3]
+    body = json.dumps({
+        **robot.status(),
+        "websocket": manager.stats(),
+        "persistence": persister.stats(),
+        "clock": motion_clock.stats(),
+        "program_cache": program_cache.stats(),
+        "bus": bus.stats(),
+        "kinematics": ik_solver.stats(),
+    }, separators=(",", ":"), default=str).encode()
+    etag = f'"{zlib.crc32(body):08x}"'
+    _status_cache[robot.id] = (key, now, body, etag)
+    return body, etag
+
+@robot_routes.get("/status")
+async def simulation_status(request: Request, robot: Robot = RobotDep):
+    """Estado del robot y estadísticas de los subsistemas (con ETag).
+
+    El robot siempre está al día; las estadísticas pueden llevar hasta
+    ``STATUS_STATS_MAX_AGE_MS`` de retraso.
     """
-    # Firestore (cargado en app.state.db en lifespan si credenciales existen)
-    firestore_db = getattr(request.app.state, "db", None)
-    if firestore_db:
-        try:  # collection robotica / doc state
-            firestore_db.collection("robotica").document("state").set(robot_state)
-        except Exception:  # pragma: no cover - tolerante
-            pass
-    # Realtime DB (usa firebase_admin.db.reference)
+    body, etag = _status_body(robot)
+    if _not_modified(request, etag):
+        STATE_RESPONSES.inc(endpoint="status", result="not_modified")
+        return Response(status_code=304, headers={"ETag": etag})
+    STATE_RESPONSES.inc(endpoint="status", result="ok")
+    return Response(body, media_type="application/json", headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+# Grabaciones de trayectorias (RECORDER_DIR)
+def _recorder(robot: Robot) -> TrajectoryRecorder:
+    if robot.recorder is None:
+        raise HTTPException(404, detail="Grabación desactivada (RECORDER_DIR)")
+    return robot.recorder
+
+@robot_routes.get("/recordings")
+async def list_recordings(robot: Robot = RobotDep, _admin: str = AdminDep):
+    recorder = _recorder(robot)
+    return {"robot": robot.id, "files": await asyncio.to_thread(recorder.info)}
+
+@robot_routes.get("/recordings/{name}")
+async def download_recording(name: str, robot: Robot = RobotDep,
+                             format: str = Query("raw", pattern="^(raw|csv)$"), _admin: str = AdminDep):
+    """Descarga por partes: ``raw`` (cabecera + registros, ver ``load_recording``) o ``csv``."""
+    recorder = _recorder(robot)
+    await asyncio.wrap_future(recorder.flush())  # incluir lo que sigue en el búfer
+    path = await asyncio.to_thread(recorder.path_of, name)
+    if path is None:
+        raise HTTPException(404, detail="Grabación no encontrada")
+    if format == "csv":
+        body, media_type, filename = stream_csv(path, settings.RECORDER_CHUNK_BYTES), "text/csv", name[:-4] + ".csv"
+    else:
+        body, media_type, filename = stream_raw(path, settings.RECORDER_CHUNK_BYTES), "application/octet-stream", name
+    return StreamingResponse(body, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+# ----- Robots -----
+@robots_router.get("")
+async def list_robots():
+    return [robot.status() for robot in registry]
+
+@robots_router.post("/{robot_id}")
+async def create_robot(robot_id: str, _admin: str = AdminDep):
+    """Registra un robot (idempotente); sus rutas quedan en /robots/{robot_id}/..."""
     try:
-        ref = firebase_rtdb.reference("/robotica")  # type: ignore
-        ref.update(robot_state)
-    except Exception:  # pragma: no cover - tolerante
-        pass
-
-def _persist_state_light() -> None:
-    """Persistencia sincrónica ligera (sin Request) para actualizaciones frecuentes.
-
-    Nota: Firestore tiene costos por escritura; si esto resulta costoso se puede
-    limitar a cada N frames o solo al final. Realtime DB está mejor para updates
-    frecuentes. Aquí intentamos ambas pero ignoramos errores.
-    """
-    if not firebase_admin._apps:  # type: ignore
-        return
-    try:  # Realtime DB
-        firebase_rtdb.reference("/robotica").update(robot_state)  # type: ignore
-    except Exception:
-        pass
-    try:  # Firestore (opcional, podría comentarse si hay muchas escrituras)
-        firebase_fs.client().collection("robotica").document("state").set(robot_state)
-    except Exception:
-        pass
-
+        robot = registry.create(robot_id)
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+    bus.publish({"kind": "robot", "robot": robot.id})
+    return robot.status()
+
+router.include_router(robot_routes)
+robots_router.include_router(robot_routes, prefix="/{robot_id}")
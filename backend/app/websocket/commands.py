@@ -0,0 +1,207 @@
+"""Typed command channel on ``/ws``.
+
+Clients send JSON commands over the same socket that streams events, and
+get an ``ACK`` correlated by ``id`` sent to that connection only::
+
+    -> {"id": 1, "op": "enqueue", "robot": "default", "mode": "sequential", "items": [...], "start": true}
+    <- {"type": "ACK", "id": 1, "ok": true, "result": {"queued": 3, "queue_len": 3}}
+    <- {"type": "ACK", "id": 2, "ok": false, "status": 409, "error": "Simulación en curso"}
+
+A JSON array of commands is executed in order and answered with one
+``{"type": "ACKS", "acks": [...]}`` message. Commands that move the robot
+need an admin token (``/ws?token=`` or ``{"op": "auth", "token": ...}``);
+they reuse the HTTP handlers' validation and errors.
+"""
+from __future__ import annotations
+
+import json
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+from fastapi import HTTPException, WebSocket
+
+from app.auth import verify_token
+from app.motion.robot import DEFAULT_ROBOT_ID, Robot, registry
+from app.robot import State, apply_state, enqueue_all, parse_items, robot_queue, start_queue
+
+from .manager import manager
+
+MAX_COMMANDS_PER_MESSAGE = 100
+
+
+class CommandSession:
+    """Per-connection command state (authenticated user)."""
+
+    def __init__(self, websocket: WebSocket, user: Optional[str] = None) -> None:
+        self.websocket = websocket
+        self.user = user
+
+    async def handle(self, text: str) -> None:
+        try:
+            message = json.loads(text)
+        except ValueError:
+            manager.reply(self.websocket, _error(None, 400, "JSON inválido"))
+            return
+        if isinstance(message, list):
+            if len(message) > MAX_COMMANDS_PER_MESSAGE:
+                manager.reply(self.websocket, _error(None, 413, f"Máximo {MAX_COMMANDS_PER_MESSAGE} comandos por mensaje"))
+                return
+            acks = [await self.execute(cmd) for cmd in message]
+            manager.reply(self.websocket, {"type": "ACKS", "acks": acks})
+        else:
+            manager.reply(self.websocket, await self.execute(message))
+
+    async def execute(self, cmd: object) -> dict:
+        if not isinstance(cmd, dict):
+            return _error(None, 400, "Se esperaba un objeto JSON")
+        cmd_id = cmd.get("id")
+        op = cmd.get("op")
+        handler = COMMANDS.get(op) if isinstance(op, str) else None
+        if handler is None:
+            return _error(cmd_id, 400, f"Comando desconocido: {op}")
+        try:
+            if handler.admin and self.user is None:
+                raise HTTPException(401, detail="Falta autenticación (auth)")
+            result = await handler(self, cmd)
+        except HTTPException as e:
+            return _error(cmd_id, e.status_code, e.detail)
+        except (TypeError, ValueError) as e:
+            # campos con tipo incorrecto: error al cliente, la conexión sigue
+            return _error(cmd_id, 422, f"Comando inválido: {e}")
+        return {"type": "ACK", "id": cmd_id, "ok": True, "result": result}
+
+
+def _error(cmd_id, status: int, detail) -> dict:
+    return {"type": "ACK", "id": cmd_id, "ok": False, "status": status, "error": detail}
+
+
+def _robot(cmd: dict) -> Robot:
+    robot_id = cmd.get("robot") or DEFAULT_ROBOT_ID
+    if not isinstance(robot_id, str):
+        raise HTTPException(422, detail="robot debe ser un texto")
+    robot = registry.get(robot_id)
+    if robot is None:
+        raise HTTPException(404, detail=f"Robot no encontrado: {robot_id}")
+    return robot
+
+
+def _strings(cmd: dict, field: str) -> Optional[List[str]]:
+    value = cmd.get(field)
+    if value is None:
+        return None
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        raise HTTPException(422, detail=f"{field} debe ser una lista de textos")
+    return value
+
+
+def _priority(cmd: dict) -> int:
+    priority = cmd.get("priority", 0)
+    if isinstance(priority, bool) or not isinstance(priority, int) or not 0 <= priority <= 100:
+        raise HTTPException(422, detail="priority debe ser un entero entre 0 y 100")
+    return priority
+
+
+Handler = Callable[[CommandSession, dict], Awaitable[Union[dict, list, None]]]
+COMMANDS: Dict[str, Handler] = {}
+
+
+def command(op: str, admin: bool = True) -> Callable[[Handler], Handler]:
+    def register(fn: Handler) -> Handler:
+        fn.admin = admin  # type: ignore[attr-defined]
+        COMMANDS[op] = fn
+        return fn
+    return register
+
+
+@command("ping", admin=False)
+async def _ping(session: CommandSession, cmd: dict) -> dict:
+    return {"pong": True}
+
+
+@command("auth", admin=False)
+async def _auth(session: CommandSession, cmd: dict) -> dict:
+    session.user = verify_token(str(cmd.get("token") or ""))
+    return {"user": session.user}
+
+
+@command("subscribe", admin=False)
+async def _subscribe(session: CommandSession, cmd: dict) -> dict:
+    robots = _strings(cmd, "robots")
+    events = _strings(cmd, "events")
+    max_fps = cmd.get("max_fps")
+    if max_fps is not None and (isinstance(max_fps, bool) or not isinstance(max_fps, (int, float))):
+        raise HTTPException(422, detail="max_fps debe ser un número")
+    adaptive = cmd.get("adaptive")
+    if adaptive is not None and not isinstance(adaptive, bool):
+        raise HTTPException(422, detail="adaptive debe ser true o false")
+    manager.subscribe(
+        session.websocket,
+        robots=robots,
+        events=events,
+        max_fps=max(0.0, float(max_fps)) if max_fps is not None else None,
+        adaptive=adaptive,
+    )
+    return {"robots": robots, "events": events, "max_fps": max_fps}
+
+
+@command("set_state")
+async def _set_state(session: CommandSession, cmd: dict) -> dict:
+    robot = _robot(cmd)
+    try:
+        state = State(**(cmd.get("state") or {}))
+    except (ValueError, TypeError) as e:
+        raise HTTPException(422, detail=str(e))
+    await apply_state(robot, state)
+    return {"state": robot.state}
+
+
+@command("enqueue")
+async def _enqueue(session: CommandSession, cmd: dict) -> dict:
+    robot = _robot(cmd)
+    mode = cmd.get("mode", "sequential")
+    queue = robot_queue(robot, mode)
+    raw = cmd.get("items") or []
+    if not isinstance(raw, list):
+        raise HTTPException(422, detail="items debe ser una lista")
+    items = parse_items(mode, raw)
+    start = bool(cmd.get("start"))
+    if start:
+        # validar antes de encolar: un error no debe dejar elementos añadidos
+        priority = _priority(cmd)
+        if not robot.scheduler.can_start(priority):
+            raise HTTPException(409, detail="Simulación en curso")
+    enqueue_all(queue, items)
+    result: dict = {"queued": len(items), "queue_len": len(queue)}
+    if start:
+        try:
+            result["start"] = await start_queue(robot, mode, priority)
+        except HTTPException as e:
+            raise HTTPException(e.status_code, detail=f"{e.detail} ({len(items)} elementos quedaron encolados)")
+    return result
+
+
+@command("start")
+async def _start(session: CommandSession, cmd: dict) -> dict:
+    return await start_queue(_robot(cmd), cmd.get("mode", "sequential"), _priority(cmd))
+
+
+async def _control(cmd: dict, action: str) -> dict:
+    robot = _robot(cmd)
+    run = await getattr(robot.scheduler, action)()
+    if run is None:
+        raise HTTPException(409, detail="No hay ejecución en curso")
+    return {"robot": robot.id, "run": run}
+
+
+@command("stop")
+async def _stop(session: CommandSession, cmd: dict) -> dict:
+    return await _control(cmd, "stop")
+
+
+@command("pause")
+async def _pause(session: CommandSession, cmd: dict) -> dict:
+    return await _control(cmd, "pause")
+
+
+@command("resume")
+async def _resume(session: CommandSession, cmd: dict) -> dict:
+    return await _control(cmd, "resume")
@@ -1,18 +1,67 @@
 """WebSocket endpoints."""
 from __future__ import annotations
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from typing import Dict, List, Optional
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, status
+from app.auth import verify_token
+from app.motion.robot import DEFAULT_ROBOT_ID, registry
+from .commands import CommandSession
+from .frames import Frame
 from .manager import manager
 
 ws_router = APIRouter()
 
 
+def _parse_since(since: Optional[str], robots: List[str]) -> Dict[str, int]:
+    """``since=42`` (único robot o "default") o ``since=a:42,b:17``."""
+    result: Dict[str, int] = {}
+    for part in (since or "").split(","):
+        robot_id, _, seq = part.rpartition(":")
+        try:
+            result[robot_id or (robots[0] if len(robots) == 1 else DEFAULT_ROBOT_ID)] = int(seq)
+        except ValueError:
+            continue
+    return result
+
+
 @ws_router.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, format: str = "json", robot: Optional[str] = None,
+                             since: Optional[str] = None, events: Optional[str] = None,
+                             max_fps: float = 0.0, adaptive: Optional[bool] = None,
+                             token: Optional[str] = None):
+    # format=binary: frames de estado empaquetados (ver frames.py); el formato
+    # binario no identifica al robot, así que se limita a uno (por defecto "default")
+    # robot=a,b: solo eventos de esos robots
+    # since: último seq visto; se reenvían los eventos perdidos (o el estado completo)
+    # events=A,B: solo esos tipos; max_fps: tope de frames de estado (adaptive: bajarlo si el enlace es lento)
+    # token: admin para los comandos (ver commands.py); también con {"op": "auth"}
+    user = None
+    if token:
+        try:
+            user = verify_token(token)
+        except HTTPException:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+    robots = [r for r in (robot or "").split(",") if r]
+    if format == "binary" and len(robots) != 1:
+        robots = robots[:1] or ["default"]
+    last_seen = _parse_since(since, robots)
+
+    def initial() -> List[Frame]:
+        targets = [registry.get(r) for r in robots] if robots else list(registry)
+        frames: List[Frame] = []
+        for target in targets:
+            if target is not None:
+                frames.extend(target.resume(last_seen.get(target.id)))
+        return frames
+
+    await manager.connect(websocket, binary=format == "binary", robots=robots or None, initial=initial,
+                          events=[e for e in (events or "").split(",") if e] or None,
+                          max_fps=max(0.0, max_fps), adaptive=adaptive)
+    session = CommandSession(websocket, user)
     try:
         while True:
-            data = await websocket.receive_text()
-            await manager.broadcast(f"Message received: {data}")
+            await session.handle(await websocket.receive_text())
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket)
-        await manager.broadcast("Client disconnected")
@@ -0,0 +1,174 @@
+"""Serialize-once WebSocket frames with delta-encoded state.
+
+``FrameEncoder`` turns every event into a ``Frame`` that is serialized at
+most once per wire format, no matter how many clients receive it. State
+updates carry a sequence number and only the joints that changed since the
+previous frame; every ``keyframe_every`` frames (and whenever a client may
+have missed a delta) the full state is sent instead.
+
+JSON layout (compatible with clients that merge ``payload`` into their state)::
+
+    {"type": "STATE_UPDATE", "robot": "default", "seq": 42, "payload": {"codo": 91}, "delta": true}
+
+``seq`` counts per robot.
+
+Binary layout (opt-in with ``/ws?format=binary``, state frames only)::
+
+    <B version=1> <B flags: bit0 = keyframe> <I seq> <B joint mask> <h angle>*
+"""
+from __future__ import annotations
+
+import json
+import struct
+from typing import Dict, Optional, Sequence
+
+try:  # serialización rápida si está instalada
+    import orjson
+
+    def dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+except ImportError:  # pragma: no cover - fallback
+    def dumps(obj) -> str:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+BINARY_VERSION = 1
+_HEADER = struct.Struct("<BBIB")
+
+
+class Frame:
+    """An outbound event; ``text()``/``binary()`` serialize lazily and cache."""
+
+    __slots__ = ("event", "seq", "payload", "full_payload", "coalesce_key", "robot", "_cache", "_joints")
+
+    def __init__(self, event: str, payload: dict, seq: Optional[int] = None,
+                 full_payload: Optional[dict] = None, coalesce_key: Optional[str] = None,
+                 joints: Sequence[str] = (), robot: Optional[str] = None) -> None:
+        self.event = event
+        self.robot = robot
+        self.payload = payload
+        self.seq = seq
+        # full_payload is set only for state frames; equal to payload on keyframes
+        self.full_payload = full_payload
+        self.coalesce_key = coalesce_key
+        self._joints = joints
+        self._cache: Dict[tuple, object] = {}
+
+    @property
+    def is_keyframe(self) -> bool:
+        return self.full_payload is not None and self.full_payload is self.payload
+
+    def text(self, full: bool = False) -> str:
+        full = full and self.full_payload is not None
+        key = ("text", full)
+        cached = self._cache.get(key)
+        if cached is None:
+            msg = {"type": self.event}
+            if self.robot is not None:
+                msg["robot"] = self.robot
+            if self.seq is not None:
+                msg["seq"] = self.seq
+            msg["payload"] = self.full_payload if full else self.payload
+            if self.full_payload is not None and not full and not self.is_keyframe:
+                msg["delta"] = True
+            cached = self._cache[key] = dumps(msg)
+        return cached  # type: ignore[return-value]
+
+    def binary(self, full: bool = False) -> Optional[bytes]:
+        """Packed state frame, or ``None`` for events without a binary form."""
+        if self.full_payload is None or self.seq is None:
+            return None
+        full = full or self.is_keyframe
+        key = ("binary", full)
+        cached = self._cache.get(key)
+        if cached is None:
+            source = self.full_payload if full else self.payload
+            mask = 0
+            values = []
+            for bit, joint in enumerate(self._joints):
+                if joint in source:
+                    mask |= 1 << bit
+                    values.append(int(source[joint]))
+            cached = self._cache[key] = _HEADER.pack(
+                BINARY_VERSION, 1 if full else 0, self.seq & 0xFFFFFFFF, mask
+            ) + struct.pack(f"<{len(values)}h", *values)
+        return cached  # type: ignore[return-value]
+
+    def to_wire(self) -> dict:
+        """Fields needed to rebuild the frame on another worker (see app.core.bus)."""
+        return {
+            "event": self.event, "payload": self.payload, "seq": self.seq,
+            "full_payload": self.full_payload, "coalesce_key": self.coalesce_key,
+            "joints": list(self._joints), "robot": self.robot,
+        }
+
+    @classmethod
+    def from_wire(cls, data: dict) -> "Frame":
+        if "raw" in data:
+            return RawFrame(data["raw"])
+        full = data.get("full_payload")
+        payload = data["payload"]
+        if full is not None and full == payload:
+            payload = full  # conserva is_keyframe
+        return cls(data["event"], payload, data.get("seq"), full, data.get("coalesce_key"),
+                   data.get("joints", ()), data.get("robot"))
+
+
+class RawFrame(Frame):
+    """Pre-serialized text message (plain notifications)."""
+
+    __slots__ = ()
+
+    def __init__(self, message: str) -> None:
+        super().__init__("", {})
+        self._cache[("text", False)] = message
+
+    def text(self, full: bool = False) -> str:
+        return self._cache[("text", False)]  # type: ignore[return-value]
+
+    def to_wire(self) -> dict:
+        return {"raw": self.text()}
+
+
+class FrameEncoder:
+    def __init__(self, joints: Sequence[str], keyframe_every: int = 20, deltas: bool = True,
+                 robot: Optional[str] = None) -> None:
+        self.robot = robot
+        self.joints = tuple(joints)
+        self.keyframe_every = max(1, keyframe_every)
+        self.deltas = deltas
+        self.seq = 0
+        self._last: Optional[dict] = None
+        self._since_keyframe = 0
+
+    def observe(self, frame: Frame) -> None:
+        """Follow frames emitted for the same robot by another worker."""
+        if frame.seq is not None and frame.seq > self.seq:
+            self.seq = frame.seq
+        if frame.full_payload is not None:
+            self._last = dict(frame.full_payload)
+
+    def snapshot(self, state: dict, event_type: str = "STATE_UPDATE") -> Frame:
+        """Full state at the current ``seq`` (for new or resuming clients)."""
+        full = dict(state)
+        key = event_type if self.robot is None else f"{event_type}:{self.robot}"
+        return Frame(event_type, full, self.seq, full_payload=full,
+                     coalesce_key=key, joints=self.joints, robot=self.robot)
+
+    def event(self, event_type: str, payload: dict) -> Frame:
+        self.seq += 1
+        return Frame(event_type, payload, self.seq, robot=self.robot)
+
+    def state(self, state: dict, event_type: str = "STATE_UPDATE") -> Frame:
+        self.seq += 1
+        full = dict(state)
+        last = self._last
+        self._last = full
+        self._since_keyframe += 1
+        if not self.deltas or last is None or self._since_keyframe >= self.keyframe_every:
+            self._since_keyframe = 0
+            payload = full
+        else:
+            payload = {k: v for k, v in full.items() if last.get(k) != v}
+        key = event_type if self.robot is None else f"{event_type}:{self.robot}"
+        return Frame(event_type, payload, self.seq, full_payload=full,
+                     coalesce_key=key, joints=self.joints, robot=self.robot)
@@ -1,26 +1,345 @@
-"""WebSocket connection manager for broadcast messaging."""
+"""WebSocket connection manager for broadcast messaging.
+
+Each connection owns a bounded outbound queue drained by its own writer
+task, so ``broadcast`` never awaits a socket: a slow client only delays
+itself. Frames tagged with a ``coalesce_key`` (e.g. ``STATE_UPDATE``)
+replace the pending frame with the same key instead of queueing behind it.
+Messages are ``Frame`` objects (see ``frames.py``) serialized once per
+format; a client that may have missed a state delta (new, coalesced or
+dropped) is sent the full state instead. Clients may subscribe to a subset
+of robots and event types, and cap their state frame rate: state frames
+arriving faster are held back (only the latest is kept) and sent, in full,
+once the interval elapses or before the next event. With adaptive rate the
+cap is lowered while a client's sends are slow and restored when they
+recover.
+"""
 from __future__ import annotations
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, FrozenSet, Iterable, List, Optional, Union
 from fastapi import WebSocket
 
+from app.core.bus import bus
+from app.core.metrics import metrics
+from app.core.config import get_settings
+from .frames import Frame, RawFrame, dumps
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "disconnect")
+ADAPT_PERIOD_S = 0.5  # mínimo entre dos ajustes de frecuencia de un cliente
+
+BROADCAST_SECONDS = metrics.histogram("ws_broadcast_seconds", "Time to queue one frame for every connection")
+SEND_SECONDS = metrics.histogram("ws_send_seconds", "Time of one send on a WebSocket connection")
+
+
+class _Client:
+    """Outbound state of one connection: pending frames + writer task."""
+
+    __slots__ = ("websocket", "binary", "robots", "events", "synced", "pending", "keyed", "wakeup",
+                 "task", "closed", "base_interval", "interval", "adaptive", "next_state", "deferred",
+                 "send_ewma", "adjusted_at")
+
+    def __init__(self, websocket: WebSocket, binary: bool = False,
+                 robots: Optional[FrozenSet[str]] = None) -> None:
+        self.websocket = websocket
+        self.binary = binary
+        self.robots = robots  # None = todos los robots
+        self.events: Optional[FrozenSet[str]] = None  # None = todos los tipos de evento
+        # state frame rate cap: requested and current (adaptive) minimum interval, 0 = none
+        self.base_interval = 0.0
+        self.interval = 0.0
+        self.adaptive = False
+        self.next_state: Dict[str, float] = {}
+        self.deferred: Dict[str, Frame] = {}  # latest held-back state frame per key
+        self.send_ewma = 0.0
+        self.adjusted_at = 0.0
+        # state streams (coalesce keys) for which the client has a full base for deltas
+        self.synced: set = set()
+        # entries are [coalesce_key, data]; data is str or bytes, replaced when coalescing
+        self.pending: Deque[list] = deque()
+        self.keyed: Dict[str, list] = {}
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.closed = False
+
 
 class ConnectionManager:
-    def __init__(self) -> None:
-        self.active_connections: list[WebSocket] = []
+    def __init__(
+        self,
+        queue_size: int = settings.WS_SEND_QUEUE_SIZE,
+        overflow_policy: str = settings.WS_OVERFLOW_POLICY,
+        coalesce: bool = settings.WS_COALESCE_STATE,
+        send_timeout: float = settings.WS_SEND_TIMEOUT_S,
+        adaptive: bool = settings.WS_ADAPTIVE_RATE,
+        adaptive_target_s: float = settings.WS_ADAPTIVE_TARGET_MS / 1000,
+        adaptive_min_fps: float = settings.WS_ADAPTIVE_MIN_FPS,
+        frame_interval_s: float = settings.FRAME_INTERVAL_MS / 1000,
+    ) -> None:
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow_policy debe ser uno de {OVERFLOW_POLICIES}")
+        self.queue_size = max(1, queue_size)
+        self.overflow_policy = overflow_policy
+        self.coalesce = coalesce
+        self.send_timeout = send_timeout
+        self.adaptive = adaptive
+        self.adaptive_target = adaptive_target_s
+        self.adaptive_floor = 2 * frame_interval_s  # primer escalón: la mitad de la frecuencia nativa
+        self.adaptive_ceiling = 1.0 / adaptive_min_fps if adaptive_min_fps > 0 else 1.0
+        self._clients: Dict[WebSocket, _Client] = {}
+        self.counters: Dict[str, int] = {
+            "connects": 0,
+            "disconnects": 0,
+            "send_errors": 0,
+            "sent": 0,
+            "coalesced": 0,
+            "dropped": 0,
+            "overflows": 0,
+            "filtered": 0,
+            "throttled": 0,
+            "rate_changes": 0,
+        }
 
-    async def connect(self, websocket: WebSocket) -> None:
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self._clients)
+
+    async def connect(self, websocket: WebSocket, binary: bool = False,
+                      robots: Optional[Iterable[str]] = None,
+                      initial: Optional[Callable[[], Iterable[Frame]]] = None,
+                      events: Optional[Iterable[str]] = None, max_fps: float = 0.0,
+                      adaptive: Optional[bool] = None) -> None:
+        """Register ``websocket``; ``initial()`` frames (snapshot/replay) go first.
+
+        ``initial`` is called after the handshake, in the same step that
+        registers the client, so no broadcast falls between the two.
+        """
         await websocket.accept()
-        self.active_connections.append(websocket)
+        client = _Client(websocket, binary, frozenset(robots) if robots else None)
+        self._configure(client, events, max_fps, self.adaptive if adaptive is None else adaptive)
+        self._clients[websocket] = client
+        if initial is not None:
+            for frame in initial():
+                self._enqueue(client, frame, frame.coalesce_key)
+        client.task = asyncio.create_task(self._writer(client))
+        self.counters["connects"] += 1
+
+    def subscribe(self, websocket: WebSocket, robots: Optional[Iterable[str]] = None,
+                  events: Optional[Iterable[str]] = None, max_fps: Optional[float] = None,
+                  adaptive: Optional[bool] = None) -> bool:
+        """Change the filters of a connected client; ``None`` keeps a setting."""
+        client = self._clients.get(websocket)
+        if client is None:
+            return False
+        if robots is not None:
+            client.robots = frozenset(robots) or None
+        self._configure(client, events, max_fps, adaptive)
+        return True
+
+    def _configure(self, client: _Client, events: Optional[Iterable[str]], max_fps: Optional[float],
+                   adaptive: Optional[bool]) -> None:
+        if events is not None:
+            client.events = frozenset(events) or None
+        if max_fps is not None:
+            client.base_interval = client.interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        if adaptive is not None:
+            client.adaptive = adaptive
 
     def disconnect(self, websocket: WebSocket) -> None:
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        client = self._clients.pop(websocket, None)
+        if client is None:
+            return
+        client.closed = True
+        client.pending.clear()
+        client.keyed.clear()
+        client.deferred.clear()
+        self.counters["disconnects"] += 1
+        if client.task and client.task is not asyncio.current_task():
+            client.task.cancel()
+
+    async def broadcast(self, message: Union[str, Frame], coalesce_key: Optional[str] = None) -> None:
+        """Queue ``message`` for every connection without waiting on sockets.
+
+        The frame is also published on the bus for clients on other workers.
+        """
+        frame = RawFrame(message) if isinstance(message, str) else message
+        if not metrics.enabled:
+            self.deliver(frame, coalesce_key)
+        else:
+            t0 = time.perf_counter()
+            self.deliver(frame, coalesce_key)
+            BROADCAST_SECONDS.observe(time.perf_counter() - t0)
+        bus.publish({"kind": "frame", "frame": frame.to_wire()})
+
+    def deliver(self, frame: Frame, coalesce_key: Optional[str] = None) -> None:
+        """Queue ``frame`` for this worker's connections only."""
+        key = frame.coalesce_key or coalesce_key
+        robot = frame.robot
+        for client in list(self._clients.values()):
+            if robot is not None and client.robots is not None and robot not in client.robots:
+                continue
+            self._enqueue(client, frame, key)
+
+    def reply(self, websocket: WebSocket, message: Union[str, dict]) -> bool:
+        """Queue a message for one connection only (acks), ignoring its filters."""
+        client = self._clients.get(websocket)
+        if client is None:
+            return False
+        self._enqueue(client, RawFrame(message if isinstance(message, str) else dumps(message)),
+                      None, throttle=False, direct=True)
+        return True
+
+    def _enqueue(self, client: _Client, frame: Frame, coalesce_key: Optional[str],
+                 throttle: bool = True, direct: bool = False) -> None:
+        if not direct and client.events is not None and frame.event not in client.events:
+            self.counters["filtered"] += 1
+            return
+        if frame.full_payload is not None:
+            if throttle and client.interval:
+                now = time.monotonic()
+                if now < client.next_state.get(coalesce_key, 0.0):  # type: ignore[arg-type]
+                    # too soon: keep only the latest; it goes out in full later
+                    client.deferred[coalesce_key] = frame  # type: ignore[index]
+                    client.synced.discard(coalesce_key)
+                    self.counters["throttled"] += 1
+                    client.wakeup.set()
+                    return
+                client.next_state[coalesce_key] = now + client.interval  # type: ignore[index]
+                client.deferred.pop(coalesce_key, None)  # type: ignore[arg-type]
+        elif client.deferred:
+            self._flush_deferred(client, force=True)  # the held-back state precedes this event
+        if coalesce_key is not None and self.coalesce:
+            entry = client.keyed.get(coalesce_key)
+            # only the tail is replaced so state never jumps ahead of other events
+            if entry is not None and entry is client.pending[-1]:
+                # the replaced frame is lost, so send the full state
+                entry[1] = self._serialize(client, frame, full=True)
+                self.counters["coalesced"] += 1
+                return
+        if len(client.pending) >= self.queue_size:
+            self.counters["overflows"] += 1
+            if self.overflow_policy == "disconnect":
+                logger.info("Cerrando cliente WebSocket lento (cola llena)")
+                self.disconnect(client.websocket)
+                asyncio.create_task(self._close(client.websocket))
+                return
+            if self.overflow_policy == "drop_newest":
+                self.counters["dropped"] += 1
+                client.synced.discard(coalesce_key)
+                return
+            old = client.pending.popleft()
+            if old[0] is not None:
+                client.synced.discard(old[0])
+                if client.keyed.get(old[0]) is old:
+                    del client.keyed[old[0]]
+            self.counters["dropped"] += 1
+        is_state = frame.full_payload is not None
+        full = is_state and coalesce_key not in client.synced
+        entry = [coalesce_key, self._serialize(client, frame, full)]
+        if is_state and (full or frame.is_keyframe):
+            client.synced.add(coalesce_key)
+        client.pending.append(entry)
+        if coalesce_key is not None and self.coalesce:
+            client.keyed[coalesce_key] = entry
+        client.wakeup.set()
 
-    async def broadcast(self, message: str) -> None:
-        for connection in list(self.active_connections):
-            try:
-                await connection.send_text(message)
-            except Exception:
-                # Drop broken connections silently
-                self.disconnect(connection)
+    def _flush_deferred(self, client: _Client, force: bool = False) -> None:
+        now = time.monotonic()
+        for key, frame in list(client.deferred.items()):
+            if force or now >= client.next_state.get(key, 0.0):
+                del client.deferred[key]
+                client.next_state[key] = now + client.interval
+                self._enqueue(client, frame, key, throttle=False)
+
+    def _adapt(self, client: _Client, elapsed: float) -> None:
+        """Lower a slow client's state rate; restore it once sends are fast again."""
+        client.send_ewma = 0.8 * client.send_ewma + 0.2 * elapsed
+        now = time.monotonic()
+        if now - client.adjusted_at < ADAPT_PERIOD_S:
+            return
+        if client.send_ewma > self.adaptive_target or len(client.pending) > self.queue_size // 4:
+            interval = min(max(client.interval * 2, self.adaptive_floor), self.adaptive_ceiling)
+        elif client.interval > client.base_interval and client.send_ewma < self.adaptive_target / 4 \
+                and not client.pending:
+            interval = client.interval / 2
+            if interval < self.adaptive_floor:
+                interval = client.base_interval
+            interval = max(interval, client.base_interval)
+        else:
+            return
+        if interval != client.interval:
+            client.interval = interval
+            client.adjusted_at = now
+            self.counters["rate_changes"] += 1
+
+    @staticmethod
+    def _serialize(client: _Client, frame: Frame, full: bool) -> Union[str, bytes]:
+        if client.binary:
+            data = frame.binary(full)
+            if data is not None:
+                return data
+        return frame.text(full)
+
+    async def _writer(self, client: _Client) -> None:
+        ws = client.websocket
+        try:
+            while not client.closed:
+                if client.deferred:
+                    self._flush_deferred(client)
+                if not client.pending:
+                    client.wakeup.clear()
+                    timeout = None
+                    if client.deferred:
+                        due = min(client.next_state.get(k, 0.0) for k in client.deferred)
+                        timeout = max(0.0, due - time.monotonic())
+                    try:
+                        await asyncio.wait_for(client.wakeup.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                key, data = entry = client.pending.popleft()
+                if key is not None and client.keyed.get(key) is entry:
+                    del client.keyed[key]
+                send = ws.send_bytes(data) if isinstance(data, bytes) else ws.send_text(data)
+                if metrics.enabled or client.adaptive:
+                    t0 = time.perf_counter()
+                    await asyncio.wait_for(send, self.send_timeout)
+                    elapsed = time.perf_counter() - t0
+                    SEND_SECONDS.observe(elapsed)
+                    if client.adaptive:
+                        self._adapt(client, elapsed)
+                else:
+                    await asyncio.wait_for(send, self.send_timeout)
+                self.counters["sent"] += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # Drop broken or stalled connections
+            self.counters["send_errors"] += 1
+            self.disconnect(ws)
+
+    @staticmethod
+    async def _close(websocket: WebSocket) -> None:
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self._clients),
+            "queued": sum(len(c.pending) for c in self._clients.values()),
+            "rate_limited": sum(1 for c in self._clients.values() if c.interval),
+            **self.counters,
+        }
 
 manager = ConnectionManager()
+
+metrics.gauge("ws_connections", "Active WebSocket connections", lambda: len(manager._clients))
+metrics.gauge("ws_queued_frames", "Frames waiting in per-connection send queues",
+              lambda: sum(len(c.pending) for c in manager._clients.values()))
+metrics.callback_counter("ws_events_total", "WebSocket fan-out events by kind",
+                         lambda: [({"event": k}, v) for k, v in manager.counters.items()])
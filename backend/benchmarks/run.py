@@ -0,0 +1,328 @@
+"""Load and latency benchmarks for the backend.
+
+Runs the FastAPI app in-process (httpx ``ASGITransport``, lifespan included)
+with in-memory storage, persistence and bus instead of Firebase/Redis, and
+writes the results as JSON so runs can be compared between commits::
+
+    cd backend
+    python -m benchmarks.run                      # all scenarios
+    python -m benchmarks.run --only fanout,state --clients 10,100,1000
+    python -m benchmarks.run --compare old.json new.json
+
+Scenarios:
+
+- ``fanout``: latency from ``manager.broadcast`` to the send on each of N
+  connected WebSockets (stand-in sockets that record the send time).
+- ``enqueue``: items/s through ``/robot/sequential/enqueue`` and ``/batch``.
+- ``state``: ``GET /robot/state`` requests per second at a given concurrency.
+- ``login``: ``/auth/login`` latency (bcrypt) and ``/auth/me`` RPS.
+- ``jitter``: frame period seen by a client while a long program plays.
+"""
+from __future__ import annotations
+
+import os
+
+# Stand-ins locales: deben fijarse antes de importar la app (Settings lee el entorno)
+os.environ.setdefault("FIREBASE_CREDENTIALS_PATH", "")
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("PERSIST_BACKEND", "memory")
+os.environ.setdefault("BUS_BACKEND", "local")
+os.environ.setdefault("ADMIN_USER", "admin")
+os.environ.setdefault("ADMIN_PASSWORD", "admin")
+
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+from app.main import app
+from app.motion.clock import motion_clock
+from app.motion.robot import registry
+from app.websocket.manager import manager
+
+SCENARIOS = ("fanout", "enqueue", "state", "login", "jitter")
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+def summarize(samples: List[float], scale: float = 1000.0) -> dict:
+    """Percentiles of ``samples`` (seconds), reported in ms by default."""
+    if not samples:
+        return {"n": 0}
+    ordered = sorted(samples)
+
+    def pct(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * scale, 3)
+
+    return {
+        "n": len(ordered),
+        "mean": round(statistics.fmean(ordered) * scale, 3),
+        "p50": pct(0.50),
+        "p90": pct(0.90),
+        "p99": pct(0.99),
+        "max": round(ordered[-1] * scale, 3),
+    }
+
+
+class BenchSocket:
+    """WebSocket stand-in: records when each message is handed to the socket."""
+
+    def __init__(self) -> None:
+        self.received: List[float] = []
+
+    async def accept(self) -> None:
+        pass
+
+    async def send_text(self, data: str) -> None:
+        self.received.append(time.perf_counter())
+
+    async def send_bytes(self, data: bytes) -> None:
+        self.received.append(time.perf_counter())
+
+    async def close(self) -> None:
+        pass
+
+
+async def _wait_received(sockets: List[BenchSocket], count: int, timeout: float = 10.0) -> None:
+    deadline = time.perf_counter() + timeout
+    while any(len(s.received) < count for s in sockets):
+        if time.perf_counter() > deadline:
+            raise TimeoutError(f"fan-out: no llegaron {count} mensajes en {timeout}s")
+        await asyncio.sleep(0)
+
+
+# ----- Escenarios -----
+async def bench_fanout(client: httpx.AsyncClient, opts) -> dict:
+    robot = registry.default
+    results = {}
+    for n in opts.clients:
+        sockets = [BenchSocket() for _ in range(n)]
+        for ws in sockets:
+            await manager.connect(ws)  # type: ignore[arg-type]
+        per_client: List[float] = []
+        complete: List[float] = []
+        broadcast_cost: List[float] = []
+        try:
+            for i in range(opts.messages):
+                state = {"base": i % 180, "hombro": 90, "codo": 45}
+                t0 = time.perf_counter()
+                await manager.broadcast(robot.encoder.state(state))
+                broadcast_cost.append(time.perf_counter() - t0)
+                await _wait_received(sockets, i + 1)
+                arrivals = [s.received[i] - t0 for s in sockets]
+                per_client.extend(arrivals)
+                complete.append(max(arrivals))
+        finally:
+            for ws in sockets:
+                manager.disconnect(ws)  # type: ignore[arg-type]
+        results[str(n)] = {
+            "broadcast_call_ms": summarize(broadcast_cost),
+            "client_latency_ms": summarize(per_client),
+            "all_clients_ms": summarize(complete),
+        }
+    return results
+
+
+async def bench_enqueue(client: httpx.AsyncClient, opts) -> dict:
+    headers = await _admin_headers(client)
+    item = {"joint": "base", "angle": 90, "duration_ms": 100}
+
+    await client.post("/robot/sequential/reset", headers=headers)
+    t0 = time.perf_counter()
+    for _ in range(opts.requests):
+        r = await client.post("/robot/sequential/enqueue", json=item, headers=headers)
+        r.raise_for_status()
+    single = time.perf_counter() - t0
+
+    await client.post("/robot/sequential/reset", headers=headers)
+    batch = [item] * opts.batch_size
+    t0 = time.perf_counter()
+    r = await client.post("/robot/sequential/enqueue/batch", json=batch, headers=headers)
+    r.raise_for_status()
+    batched = time.perf_counter() - t0
+    await client.post("/robot/sequential/reset", headers=headers)
+    return {
+        "single_items_per_s": round(opts.requests / single, 1),
+        "batch_items_per_s": round(opts.batch_size / batched, 1),
+        "batch_size": opts.batch_size,
+    }
+
+
+async def _rps(call: Callable, total: int, concurrency: int) -> dict:
+    latencies: List[float] = []
+    remaining = total
+
+    async def worker() -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            t0 = time.perf_counter()
+            r = await call()
+            r.raise_for_status()
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    return {"rps": round(total / elapsed, 1), "concurrency": concurrency, "latency_ms": summarize(latencies)}
+
+
+async def bench_state(client: httpx.AsyncClient, opts) -> dict:
+    return await _rps(lambda: client.get("/robot/state"), opts.requests, opts.concurrency)
+
+
+async def bench_login(client: httpx.AsyncClient, opts) -> dict:
+    creds = {"username": os.environ["ADMIN_USER"], "password": os.environ["ADMIN_PASSWORD"]}
+    latencies = []
+    token = None
+    for _ in range(opts.logins):
+        t0 = time.perf_counter()
+        r = await client.post("/auth/login", json=creds)
+        r.raise_for_status()
+        latencies.append(time.perf_counter() - t0)
+        token = r.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    return {
+        "login_ms": summarize(latencies),
+        "me": await _rps(lambda: client.get("/auth/me", headers=headers), opts.requests, opts.concurrency),
+    }
+
+
+async def bench_jitter(client: httpx.AsyncClient, opts) -> dict:
+    robot = registry.default
+    ws = BenchSocket()
+    await manager.connect(ws, robots=[robot.id])  # type: ignore[arg-type]
+    steps = [{"joint": j, "angle": a, "duration_ms": opts.step_ms}
+             for a in (170, 10) for j in ("base", "hombro", "codo")]
+    items = (steps * (int(opts.program_s * 1000 / (opts.step_ms * len(steps))) + 1))
+    motion_clock.reset_stats()
+    try:
+        t0 = time.perf_counter()
+        await robot.play_program(robot.compile("sequential", items))
+        elapsed = time.perf_counter() - t0
+    finally:
+        manager.disconnect(ws)  # type: ignore[arg-type]
+    periods = [b - a for a, b in zip(ws.received, ws.received[1:])]
+    expected = motion_clock.interval
+    return {
+        "program_s": round(elapsed, 3),
+        "expected_period_ms": round(expected * 1000, 3),
+        "period_ms": summarize(periods),
+        "period_stdev_ms": round(statistics.pstdev(periods) * 1000, 3) if periods else None,
+        "clock": motion_clock.stats(),
+    }
+
+
+_token: Optional[str] = None
+
+
+async def _admin_headers(client: httpx.AsyncClient) -> Dict[str, str]:
+    global _token
+    if _token is None:
+        r = await client.post("/auth/login", json={
+            "username": os.environ["ADMIN_USER"], "password": os.environ["ADMIN_PASSWORD"],
+        })
+        r.raise_for_status()
+        _token = r.json()["access_token"]
+    return {"Authorization": f"Bearer {_token}"}
+
+
+BENCHES = {
+    "fanout": bench_fanout,
+    "enqueue": bench_enqueue,
+    "state": bench_state,
+    "login": bench_login,
+    "jitter": bench_jitter,
+}
+
+
+# ----- Ejecución y resultados -----
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+async def run(opts) -> dict:
+    results: Dict[str, dict] = {}
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name in opts.only:
+                print(f"-> {name}", file=sys.stderr)
+                results[name] = await BENCHES[name](client, opts)
+    return {
+        "revision": _git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": {k: v for k, v in vars(opts).items() if k not in ("output", "compare")},
+        "results": results,
+    }
+
+
+def _flatten(prefix: str, value, out: Dict[str, float]) -> None:
+    if isinstance(value, dict):
+        for k, v in value.items():
+            _flatten(f"{prefix}.{k}" if prefix else k, v, out)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        out[prefix] = value
+
+
+def compare(old_path: str, new_path: str) -> None:
+    """Print every numeric metric of two result files side by side."""
+    old: Dict[str, float] = {}
+    new: Dict[str, float] = {}
+    _flatten("", json.loads(Path(old_path).read_text())["results"], old)
+    _flatten("", json.loads(Path(new_path).read_text())["results"], new)
+    for key in sorted(old.keys() | new.keys()):
+        a, b = old.get(key), new.get(key)
+        change = f"{(b - a) / a * 100:+.1f}%" if a and b is not None else ""
+        print(f"{key:60} {a!s:>12} {b!s:>12} {change:>9}")
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", default=",".join(SCENARIOS),
+                        type=lambda s: [x for x in s.split(",") if x in BENCHES])
+    parser.add_argument("--clients", default="1,10,100,1000", type=_int_list)
+    parser.add_argument("--messages", default=200, type=int, help="broadcasts por tamaño en fanout")
+    parser.add_argument("--requests", default=2000, type=int)
+    parser.add_argument("--concurrency", default=32, type=int)
+    parser.add_argument("--batch-size", default=10000, type=int)
+    parser.add_argument("--logins", default=10, type=int)
+    parser.add_argument("--program-s", default=10.0, type=float, help="duración del programa en jitter")
+    parser.add_argument("--step-ms", default=500, type=int)
+    parser.add_argument("--output", help="archivo JSON (por defecto benchmarks/results/<fecha>-<rev>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    opts = parser.parse_args(argv)
+
+    if opts.compare:
+        compare(*opts.compare)
+        return
+    report = asyncio.run(run(opts))
+    if opts.output:
+        path = Path(opts.output)
+    else:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        path = RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}-{report['revision'] or 'local'}.json"
+    path.write_text(json.dumps(report, indent=2))
+    print(json.dumps(report["results"], indent=2))
+    print(f"Resultados en {path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
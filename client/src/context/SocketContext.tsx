@@ -13,6 +13,8 @@ export function SocketProvider({ children }: { children: ReactNode }) {
   const wsRef = useRef<WebSocket | null>(null)
   const [status, setStatus] = useState('desconectado')
   const [messages, setMessages] = useState<string[]>([])
+  // último seq visto por robot: al reconectar se piden solo los eventos perdidos
+  const lastSeq = useRef<Record<string, number>>({})
 
   useEffect(() => {
     let retry: number | null = null
@@ -20,10 +22,17 @@ export function SocketProvider({ children }: { children: ReactNode }) {
     const connect = () => {
       if (cancelled) return
       setStatus('conectando')
-      const ws = new WebSocket('ws://localhost:8000/ws')
+      const since = Object.entries(lastSeq.current).map(([robot, seq]) => `${robot}:${seq}`).join(',')
+      const ws = new WebSocket(`ws://localhost:8000/ws${since ? `?since=${since}` : ''}`)
       wsRef.current = ws
       ws.onopen = () => setStatus('conectado')
-      ws.onmessage = ev => setMessages(prev => [...prev, ev.data])
+      ws.onmessage = ev => {
+        try {
+          const msg = JSON.parse(ev.data)
+          if (typeof msg.seq === 'number') lastSeq.current[msg.robot ?? 'default'] = msg.seq
+        } catch { /* mensajes de texto plano */ }
+        setMessages(prev => [...prev, ev.data])
+      }
       ws.onerror = () => setStatus('error')
       ws.onclose = () => {
         setStatus('desconectado')